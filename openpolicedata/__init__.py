@@ -16,6 +16,10 @@ Column : module
     Standard column definitions for normalizing data access.
 datasets : module
     Access to the catalog of available datasets.
+col : function
+    Create filter expressions to only load records that match a condition.
+set_cache : function
+    Set a directory where loaded data for past years is cached.
 
 Examples:
 ---------
@@ -35,4 +39,6 @@ from . import defs
 from . import datasets
 from .defs import TableType
 from .defs import DataType
-from .defs import columns as Column
\ No newline at end of file
+from .defs import columns as Column
+from .filters import col
+from .cache import set_cache
\ No newline at end of file
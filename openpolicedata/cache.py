@@ -0,0 +1,271 @@
+'''Local cache of loaded tables
+
+When a cache directory is set with set_cache, data loaded by Source.load is saved as Hive-partitioned parquet files:
+
+    cache_dir/state=<state>/source=<source>/table_type=<table type>/dataset=<dataset>/opd_year=<year>/part-0.parquet
+
+The dataset directory name is the default parquet filename of the dataset (see get_parquet_filename). Only past years
+that were loaded in full are cached because data from past years is not expected to change. Requests for years
+that are cached are read from the cache instead of being downloaded. When an entire dataset is cached, records without 
+a valid date are cached in the opd_year=__null__ partition and are only read when the entire dataset is requested.
+'''
+from datetime import datetime
+import json
+import os
+import os.path as path
+import pandas as pd
+import pyarrow
+import pyarrow.dataset as ds
+import pyarrow.parquet as pq
+
+from . import log
+
+try:
+    import geopandas as gpd
+    _has_gpd = True
+except:
+    _has_gpd = False
+
+logger = log.get_logger()
+
+# Cache directory. None if caching is disabled.
+_cache_dir = None
+
+# Name of partition column. The name is chosen to not conflict with the columns of tables.
+_partition_key = 'opd_year'
+# Partition value for records without a valid date
+_null_partition = '__null__'
+_manifest_file = '_manifest.json'
+
+
+def set_cache(cache_dir):
+    '''Set directory where loaded data is cached. Data for past years that has been cached
+    will be read from the cache instead of being downloaded.
+
+    Parameters
+    ----------
+    cache_dir : str or None
+        Cache directory. If None, caching is disabled.
+    '''
+    global _cache_dir
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+    _cache_dir = cache_dir
+
+
+def get_cache():
+    '''Get cache directory
+
+    Returns
+    -------
+    str or None
+        Cache directory or None if caching is disabled
+    '''
+    return _cache_dir
+
+
+def _clean_name(name):
+    # Partition values cannot contain path separators
+    return str(name).replace('/', '_').replace('\\', '_').replace('=', '_')
+
+
+def get_dataset_dir(state, source_name, table_type, dataset):
+    '''Get directory where data for a dataset is cached
+
+    Parameters
+    ----------
+    state : str
+        Name of state
+    source_name : str
+        Name of source
+    table_type : str or TableType enum
+        Type of data
+    dataset : str
+        Unique name of dataset (i.e. default parquet filename without extension)
+
+    Returns
+    -------
+    str
+        Dataset directory
+    '''
+    if _cache_dir is None:
+        raise ValueError("Caching is not enabled. Set cache directory with set_cache.")
+    table_type = getattr(table_type, 'value', table_type)
+    return path.join(_cache_dir, f"state={_clean_name(state)}", f"source={_clean_name(source_name)}",
+                     f"table_type={_clean_name(table_type)}", f"dataset={_clean_name(dataset)}")
+
+
+def get_years(dataset_dir):
+    '''Get years that are cached for a dataset'''
+    manifest = _read_manifest(dataset_dir)
+    return manifest['years'] if manifest else []
+
+
+def is_complete(dataset_dir):
+    '''Get whether the entire dataset is cached'''
+    manifest = _read_manifest(dataset_dir)
+    return manifest['complete'] if manifest else False
+
+
+def _read_manifest(dataset_dir):
+    filename = path.join(dataset_dir, _manifest_file)
+    if not path.exists(filename):
+        return None
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def _to_timestamps(dates):
+    # Convert date column to timezone-naive timestamps
+    if isinstance(dates.dtype, pd.PeriodDtype):
+        return dates.dt.start_time
+    elif pd.api.types.is_numeric_dtype(dates):
+        # Years
+        return pd.to_datetime(dates, format='%Y', errors='coerce')
+    elif not pd.api.types.is_datetime64_any_dtype(dates):
+        dates = pd.to_datetime(dates, errors='coerce')
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates
+
+
+def get_complete_years(date):
+    '''Get past years that are entirely contained in a date range. Data from these years can be cached.
+
+    Parameters
+    ----------
+    date : list
+        Start and stop timestamps (output of data_loader._clean_date_input)
+
+    Returns
+    -------
+    list
+        Years
+    '''
+    cur_year = datetime.now().year
+    return [y for y in range(date[0].year, date[1].year+1) if y < cur_year and
+            date[0] <= pd.Timestamp(year=y, month=1, day=1) and date[1] >= pd.Timestamp(year=y, month=12, day=31)]
+
+
+def write(dataset_dir, df, date_field, years, complete=False):
+    '''Cache data for years. Years that have no data are cached as empty.
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Dataset directory (output of get_dataset_dir)
+    df : pandas or geopandas DataFrame
+        Data to cache. Must include all data for years.
+    date_field : str
+        Name of the date column. Not used if df is empty.
+    years : list
+        Years to cache
+    complete : bool
+        (Optional) Whether df contains the entire dataset and all of its years are being cached. If True, records 
+        without a valid date are also cached. Default False
+
+    Returns
+    -------
+    bool
+        Whether data was cached
+    '''
+    if len(years)==0:
+        return False
+
+    data_years = _to_timestamps(df[date_field]).dt.year if len(df)>0 else None
+    manifest = _read_manifest(dataset_dir) or {'years':[], 'date_field':date_field, 'complete':False}
+    for y in years:
+        if not _write_partition(dataset_dir, y, df[data_years==y] if len(df)>0 else df):
+            return False
+        if y not in manifest['years']:
+            manifest['years'].append(y)
+
+    if complete:
+        # Records without a date are not in any year
+        if not _write_partition(dataset_dir, _null_partition, df[data_years.isnull()] if len(df)>0 else df):
+            return False
+
+    manifest['years'].sort()
+    manifest['complete'] = manifest['complete'] or complete
+    os.makedirs(dataset_dir, exist_ok=True)
+    with open(path.join(dataset_dir, _manifest_file), 'w') as f:
+        json.dump(manifest, f, indent=4)
+
+    logger.debug(f"Cached data for years {years} in {dataset_dir}")
+    return True
+
+
+def _write_partition(dataset_dir, value, df):
+    # Writes data for a partition. Returns False if the data cannot be written.
+    part_dir = path.join(dataset_dir, f"{_partition_key}={value}")
+    filename = path.join(part_dir, 'part-0.parquet')
+    if len(df)==0:
+        # Only the manifest is needed to record that there is no data
+        if path.exists(filename):
+            os.remove(filename)
+        return True
+
+    os.makedirs(part_dir, exist_ok=True)
+    # Files starting with . are ignored when reading the dataset
+    tmp_file = path.join(part_dir, '.part-0.parquet.tmp')
+    try:
+        df.reset_index(drop=True).to_parquet(tmp_file)
+    except (pyarrow.lib.ArrowException, TypeError, ValueError) as e:
+        # Caching is not required. Data will be downloaded instead.
+        logger.debug(f"Unable to cache data for {value}: {e}")
+        if path.exists(tmp_file):
+            os.remove(tmp_file)
+        return False
+    os.replace(tmp_file, filename)
+    return True
+
+
+def read(dataset_dir, years, null_dates=False):
+    '''Read cached data for years
+
+    Parameters
+    ----------
+    dataset_dir : str
+        Dataset directory (output of get_dataset_dir)
+    years : list
+        Years to read. All years must be cached.
+    null_dates : bool
+        (Optional) If True, records without a valid date (which are only cached when the entire dataset is cached) 
+        are also read. Default False
+
+    Returns
+    -------
+    pandas or geopandas DataFrame
+        Cached data
+    '''
+    logger.debug(f"Reading cached data for years {years} from {dataset_dir}")
+    values = [str(y) for y in years] + ([_null_partition] if null_dates else [])
+    files = [path.join(dataset_dir, f"{_partition_key}={v}", 'part-0.parquet') for v in values]
+    files = [f for f in files if path.exists(f)]
+    if len(files)==0:
+        return pd.DataFrame()
+    
+    try:
+        # Partition values are read as strings because of the partition for records without a date
+        partitioning = ds.partitioning(pyarrow.schema([(_partition_key, pyarrow.string())]), flavor='hive')
+        dataset = ds.dataset(dataset_dir, format='parquet', partitioning=partitioning)
+        table = dataset.to_table(filter=ds.field(_partition_key).isin(values))
+        table = table.drop_columns([_partition_key])
+    except pyarrow.lib.ArrowException as e:
+        # Column types may differ between years
+        logger.debug(f"Unable to read cached data as a single dataset: {e}")
+        return pd.concat([_from_arrow(pq.read_table(f)) for f in files], ignore_index=True)
+
+    return _from_arrow(table)
+
+
+def _from_arrow(table):
+    df = table.to_pandas()
+    metadata = table.schema.metadata or {}
+    if _has_gpd and b'geo' in metadata:
+        geo = json.loads(metadata[b'geo'])
+        geometry = geo['primary_column']
+        for c, info in geo['columns'].items():
+            df[c] = gpd.GeoSeries.from_wkb(df[c], crs=info.get('crs', 'OGC:CRS84'))
+        df = gpd.GeoDataFrame(df, geometry=geometry)
+    return df.reset_index(drop=True)
@@ -6,6 +6,7 @@ Contains:
 """
 from __future__ import annotations
 import copy
+import json
 import numbers
 import os
 import os.path as path
@@ -25,6 +26,8 @@ import warnings
 from . import data_loaders, dataset_id
 from .data_loaders import data_loader
 from . import datasets
+from . import cache
+from . import filters
 from . import log
 from . import __version__
 from . import preproc
@@ -40,6 +43,11 @@ except:
 
 logger = log.get_logger()
 
+# Extension of file that stores high-water marks of tables saved by Source.sync
+_sync_state_ext = '.sync.json'
+# Record ID columns (ArcGIS, CKAN, Carto) used as high-water marks by Source.sync when a table has no date field
+_sync_id_fields = ['OBJECTID', 'FID', '_id', 'cartodb_id']
+
 class Table:
     """
     A class that contains a DataFrame for a dataset along with meta information
@@ -819,6 +827,8 @@ class Source:
         Load data from a previously saved feather file
     load_parquet()
         Load data from a previously saved parquet file
+    sync()
+        Update a local copy of a table with records added since the last update
     """
 
     datasets: pd.DataFrame = None
@@ -1060,7 +1070,8 @@ class Source:
                   force: bool = False,
                   verbose: bool | str | int = False,
                   url: str | None = None,
-                  id: str | None = None
+                  id: str | None = None,
+                  where: filters.Expression | None = None
                   ) -> int:
         '''Get number of records for a data request
 
@@ -1089,6 +1100,10 @@ class Source:
             (Optional) If set, URL must contain this string. Can be used in combination with id when multiple datasets match a set of inputs.
         id : str | None
             (Optional) If set, dataset ID must equal this value. Can be used in combination with url when multiple datasets match a set of inputs.
+        where : openpolicedata.filters.Expression | None, optional
+            If set, only records matching this filter expression are counted. Filter expressions are created with opd.col
+            (i.e. opd.col('race').isin(['BLACK','WHITE']) & (opd.col('age') > 17)). When supported by the data source, the filter
+            is sent to the server so that only matching records are downloaded. By default None (no filter)
 
         Returns
         -------
@@ -1097,7 +1112,66 @@ class Source:
         '''
 
         return self.__load(table_type, date, agency, True, pbar=False, return_count=True, force=force, verbose=verbose, 
-                           url_contains=url, id=id)
+                           url_contains=url, id=id, where=where)
+    
+    def aggregate(self, 
+                  table_type: str | defs.TableType | None = None,
+                  date: str | int | list[Union[int, str, pd.Timestamp]]=None,
+                  group_by: str | list[str] | None = None,
+                  agg: Literal['count'] = 'count',
+                  date_part: Literal['year','month', None] = None,
+                  agency: str | None = None, 
+                  verbose: bool | str | int = False,
+                  url: str | None = None,
+                  id: str | None = None,
+                  where: filters.Expression | None = None
+                  ) -> pd.DataFrame:
+        '''Get aggregate statistics (i.e. number of records in each group) for a data request. 
+        When supported by the data source, the aggregation is computed by the server so that
+        only the result is downloaded. Otherwise, the data is loaded and aggregated locally.
+
+        Parameters
+        ----------
+        table_type : str or TableType enum
+            (Optional) If set, requested dataset will be of this type
+        date - int or the string opd.defs.MULTI or opd.defs.NONE or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            Define timespan of data to aggregate:
+                1. Request data for an entire year by inputting the year (i.e. 2023)
+                2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
+                3. Request an entire multi-year dataset by inputting 'MULTIPLE'
+                4. Request of a dataset with no time information (i.e. officer demographics) by inputting 'NONE'
+        group_by : str | list[str] | None
+            (Optional) Column(s) to group by. If None, the total is returned.
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : Literal['year','month', None]
+            (Optional) If set, results are also grouped by the year or month of the date column. 
+            The year or month is returned in a column named date_part.
+        agency : str
+            (Optional) If set, for datasets containing multiple agencies, data will
+            only be returned for this agency
+        verbose : bool | str | int, optional
+            (Optional) If True, log level will be set to 'DEBUG' to print log messages. If a logging level ('WARNING', 'INFO', etc.), the log level
+            will be updated to the value of verbose. If any other string, verbose will specify the name of 
+            a file to log to with level 'INFO'
+        url : str | None
+            (Optional) If set, URL must contain this string. Can be used in combination with id when multiple datasets match a set of inputs.
+        id : str | None
+            (Optional) If set, dataset ID must equal this value. Can be used in combination with url when multiple datasets match a set of inputs.
+        where : openpolicedata.filters.Expression | None, optional
+            If set, only records matching this filter expression are aggregated. Filter expressions are created with opd.col
+            (i.e. opd.col('race').isin(['BLACK','WHITE']) & (opd.col('age') > 17)). When supported by the data source, the filter
+            is sent to the server so that only matching records are downloaded. By default None (no filter)
+
+        Returns
+        -------
+        pandas.DataFrame
+            DataFrame containing a column for each group_by column, the date_part column (if requested), and a count column
+        '''
+
+        group_by = data_loader._check_aggregate_input(group_by, agg)
+        return self.__load(table_type, date, agency, True, pbar=False, verbose=verbose, url_contains=url, id=id,
+                           aggregate={'group_by':group_by, 'agg':agg, 'date_part':date_part}, where=where)
     
     def load_iter(self,
                 table_type: str | defs.TableType,
@@ -1110,7 +1184,10 @@ class Source:
                 verbose: bool | str | int = False,
                 format_date: bool = True,
                 url: str | None = None,
-                id: str | None = None
+                id: str | None = None,
+                columns: list[str] | None = None,
+                where: filters.Expression | None = None,
+                engine: str | None = None
                 ) -> Iterator[Table]:
         '''Get generator to load data from URL in batches
 
@@ -1135,8 +1212,7 @@ class Source:
             (Optional) Number of records to offset from first record. Default is 0 
             to return records starting from the first.
         force - bool
-            (Optional) For file-based data, an exception will be thrown unless force 
-            is true. It will be more efficient to read the entire dataset all at once
+            (Optional) Not used. File-based data is downloaded once and split into batches
         verbose : bool | str | int, optional
             bool | str, optional
             (Optional) If True, log level will be set to 'DEBUG' to print log messages. If a logging level ('WARNING', 'INFO', etc.), the log level
@@ -1149,6 +1225,16 @@ class Source:
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list[str] | None, optional
+            If set, only these columns will be requested (when supported by the data source) and returned. The date and agency columns
+            are always included. Columns that are not in the data are ignored. By default None (all columns)
+        where : openpolicedata.filters.Expression | None, optional
+            If set, only records matching this filter expression are returned. Filter expressions are created with opd.col
+            (i.e. opd.col('race').isin(['BLACK','WHITE']) & (opd.col('age') > 17)). When supported by the data source, the filter
+            is sent to the server so that only matching records are downloaded. By default None (no filter)
+        engine : str | None, optional
+            Parser to use for Excel files: 'calamine' (faster reader for large files that requires python-calamine) or 'openpyxl'.
+            CSV files are read in batches with the pandas C parser. Not used for other data types. By default None (pandas default for Excel files)
 
         Returns
         -------
@@ -1156,10 +1242,17 @@ class Source:
             generates Table objects containing the requested data
         '''
 
-        count = self.get_count(table_type, date, agency, force, verbose=verbose, url=url, id=id)
+        src = self.__load(table_type, date, agency, False, url_contains=url, id=id).details
+        if src['DataType'] in [defs.DataType.CSV, defs.DataType.EXCEL, defs.DataType.HTML]:
+            # Files are read in a single pass instead of reading the file again for each batch
+            yield from self.__load(table_type, date, agency, True, pbar, offset=offset, verbose=verbose, url_contains=url, id=id, 
+                                   format_date=format_date, columns=columns, where=where, nbatch=nbatch, engine=engine)
+            return
+
+        count = self.get_count(table_type, date, agency, force, verbose=verbose, url=url, id=id, where=where)
         for k in range(offset, count, nbatch):
             yield self.__load(table_type, date, agency, True, pbar, nrows=min(nbatch, count-k), offset=k, 
-                              verbose=verbose, url_contains=url, id=id, format_date=format_date)
+                              verbose=verbose, url_contains=url, id=id, format_date=format_date, columns=columns, where=where)
     
     
     def load(self, 
@@ -1172,7 +1265,11 @@ class Source:
             verbose: bool | str | int = False,
             format_date: bool = True,
             url: str | None = None,
-            id: str | None = None
+            id: str | None = None,
+            max_workers: int = 1,
+            columns: list[str] | None = None,
+            where: filters.Expression | None = None,
+            engine: str | None = None
             ) -> Table:
         '''Load data from URL
 
@@ -1208,6 +1305,20 @@ class Source:
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        max_workers : int, optional
+            Maximum number of simultaneous requests when loading data in batches (currently used for ArcGIS data) or of processes
+            used to parse Excel files with data in multiple sheets, by default 1
+        columns : list[str] | None, optional
+            If set, only these columns will be requested (when supported by the data source) and returned. The date and agency columns
+            are always included. Columns that are not in the data are ignored. By default None (all columns)
+        where : openpolicedata.filters.Expression | None, optional
+            If set, only records matching this filter expression are returned. Filter expressions are created with opd.col
+            (i.e. opd.col('race').isin(['BLACK','WHITE']) & (opd.col('age') > 17)). When supported by the data source, the filter
+            is sent to the server so that only matching records are downloaded. By default None (no filter)
+        engine : str | None, optional
+            Parser to use for CSV files: 'c' (pandas C parser) or 'pyarrow' (multithreaded parser for large files). 
+            Parser to use for Excel files: 'calamine' (faster reader for large files that requires python-calamine) or 'openpyxl'.
+            Not used for other data types. By default None (pandas C parser for CSV files and pandas default for Excel files)
 
         Returns
         -------
@@ -1215,8 +1326,217 @@ class Source:
             Table object containing the requested data
         '''
 
+        if cache.get_cache() is not None and nrows is None and offset==0 and format_date:
+            table = self.__load_cached(table_type, date, agency, pbar, verbose, url, id, max_workers, columns, where, engine)
+            if table is not None:
+                return table
+
         return self.__load(table_type, date, agency, True, pbar, nrows=nrows, offset=offset, 
-                           verbose=verbose, url_contains=url, id=id, format_date=format_date)
+                           verbose=verbose, url_contains=url, id=id, format_date=format_date, max_workers=max_workers, columns=columns, 
+                           where=where, engine=engine)
+    
+
+    def __load_cached(self, table_type, date_orig, agency, pbar, verbose, url, id, max_workers, columns, where, engine):
+        # Loads data using data for past years from the cache (see opd.set_cache) when available and caches data 
+        # for past years that was loaded in full. Returns None if the cache cannot be used for the request.
+        table = self.__load(table_type, date_orig, agency, False, url_contains=url, id=id)
+        src = table.details
+        if pd.isnull(src['date_field']) or date_orig==defs.NA:
+            return None
+        
+        try:
+            filename = get_parquet_filename(src['State'], src['SourceName'], agency if agency else src['Agency'], src['TableType'], 
+                                            src['Year'], url=src['URL'], id=src['dataset_id'], src=self)
+        except ValueError as e:
+            logger.debug(f"Unable to cache data: {e}")
+            return None
+        
+        dataset_dir = cache.get_dataset_dir(src['State'], src['SourceName'], src['TableType'], path.splitext(filename)[0])
+        # Only data that is not filtered by columns or where is cached
+        full_load = columns is None and where is None
+        # Requests are limited to the cached dataset
+        load_args = dict(verbose=verbose, url_contains=src['URL'], id=src['dataset_id'], max_workers=max_workers, columns=columns, where=where, 
+                         engine=engine)
+        cur_year = datetime.now().year
+
+        date = data_loader._clean_date_input(date_orig) if _check_whether_to_filter_by_date(src, date_orig) else None
+        if not isinstance(date, list):
+            # Entire dataset is requested
+            if not cache.is_complete(dataset_dir):
+                loaded = self.__load(table_type, date_orig, agency, True, pbar, **load_args)
+                date_field = _find_column(loaded.table, src['date_field'])
+                if full_load and date_field and len(loaded.table)>0:
+                    years = cache._to_timestamps(loaded.table[date_field]).dt.year
+                    if years.notnull().any():
+                        # Entire dataset is cached if the data is from a past year and will not be updated
+                        complete = isinstance(src['Year'], numbers.Number) and src['Year'] < cur_year
+                        years = range(int(years.min()), int(years.max())+1 if complete else cur_year)
+                        cache.write(dataset_dir, loaded.table, date_field, [y for y in years if y < cur_year], complete=complete)
+                return loaded
+            
+            dfs = [_filter_cached(cache.read(dataset_dir, cache.get_years(dataset_dir), null_dates=True), src, columns, where)]
+        else:
+            cached_years = cache.get_years(dataset_dir)
+            years = list(range(date[0].year, date[1].year+1))
+            dfs = []
+            if any(y in cached_years for y in years):
+                dfs.append(_filter_cached(cache.read(dataset_dir, [y for y in years if y in cached_years]), src, columns, where, date))
+
+            # Request contiguous ranges of years that are not cached
+            missing = [y for y in years if y not in cached_years]
+            ranges = [[y,y] for k,y in enumerate(missing) if k==0 or missing[k-1]!=y-1]
+            for r in ranges:
+                while r[1]+1 in missing:
+                    r[1]+=1
+            
+            for start_year, stop_year in ranges:
+                sub_date = [max(date[0], pd.Timestamp(year=start_year, month=1, day=1)), min(date[1], pd.Timestamp(year=stop_year, month=12, day=31))]
+                loaded = self.__load(table_type, sub_date, agency, True, pbar, **load_args)
+                date_field = _find_column(loaded.table, src['date_field'])
+                if full_load and (date_field or len(loaded.table)==0):
+                    cache.write(dataset_dir, loaded.table, date_field, cache.get_complete_years(sub_date))
+                dfs.append(loaded.table)
+
+            if len(ranges)==0:
+                logger.debug(f"Request for {date_orig} was read from the cache")
+
+        dfs_not_empty = [x for x in dfs if len(x)>0]
+        if len(dfs_not_empty)>1:
+            table.table = pd.concat(dfs_not_empty, ignore_index=True)
+        else:
+            table.table = dfs_not_empty[0] if len(dfs_not_empty)==1 else dfs[0]
+        return table
+
+
+    def sync(self, 
+             table_type: str | defs.TableType, 
+             store_path: str,
+             agency: str | None = None,
+             refresh_year: bool = False,
+             pbar: bool = True,
+             verbose: bool | str | int = False,
+             url: str | None = None,
+             id: str | None = None,
+             mixed: bool = False
+             ) -> Table:
+        '''Update a local copy of a multi-year table by only downloading records that are newer than the records 
+        already stored. 
+
+        The table is stored in a parquet file at store_path. High-water marks (the latest date and the largest record ID, 
+        if the table has one) are stored next to it in a JSON file (store_path + '.sync.json'). The first time that a 
+        table is synced, the entire table is downloaded. After that, records from the date of the latest stored record 
+        onward are requested and replace the stored records from those dates (if any records are returned). Tables without a date field are updated 
+        by requesting records with IDs larger than the largest stored ID or, if there is no ID, by downloading the 
+        whole table.
+
+        Parameters
+        ----------
+        table_type - str or TableType enum
+            Table type to sync
+        store_path - str
+            Filename of parquet file containing the local copy of the table
+        agency - str
+            (Optional) If set, for datasets containing multiple agencies, data will
+            only be returned for this agency
+        refresh_year - bool
+            (Optional) If True, all records from the current year are downloaded again (in case older records of the 
+            current year were added or corrected). Default False
+        pbar - bool
+            (Optional) Whether to show progress bar when loading data. Default True
+        verbose : bool | str | int, optional
+            (Optional) If True, log level will be set to 'DEBUG' to print log messages. If a logging level ('WARNING', 'INFO', etc.), the log level
+            will be updated to the value of verbose. If any other string, verbose will specify the name of 
+            a file to log to with level 'DEBUG'
+        url - str | None
+            (Optional) If set, URL must contain this string. Can be used in combination with id when multiple datasets match a set of inputs.
+            After the first sync, the URL of the stored table is used by default.
+        id - str | None
+            (Optional) If set, dataset ID must equal this value. Can be used in combination with url when multiple datasets match a set of inputs.
+            After the first sync, the dataset ID of the stored table is used by default.
+        mixed - bool
+            (Optional) If True, columns with mixed dtypes will be converted to strings prior to saving. Default: False
+
+        Returns
+        -------
+        Table
+            Table object containing all stored data
+        '''
+
+        state_file = store_path + _sync_state_ext
+        state = None
+        if path.exists(store_path) and path.exists(state_file):
+            with open(state_file, 'r') as f:
+                state = json.load(f)
+            # Ensure that the same dataset is updated
+            url = url if url else state['url']
+            id = id if id!=None else state['dataset_id']
+
+        date = defs.MULTI
+        where = None
+        if state is not None:
+            if state['max_date'] is not None:
+                start_date = pd.Timestamp(state['max_date']).floor('D')
+                cur_year = datetime.now().year
+                if refresh_year:
+                    start_date = min(start_date, pd.Timestamp(year=cur_year, month=1, day=1))
+                # Records in the current year with a date in the future are also requested
+                date = [start_date, pd.Timestamp(year=max(cur_year, start_date.year), month=12, day=31)]
+            elif state['max_id'] is not None:
+                where = filters.col(state['id_field']) > state['max_id']
+
+        logger.debug(f"Syncing {store_path} using date {date} and filter {where}")
+        table = self.load(table_type, date, agency, pbar, verbose=verbose, url=url, id=id, where=where)
+        df = table.table
+
+        if state is not None:
+            local = _read_sync_store(store_path, state['geo'])
+            if df is not None and len(df)>0:
+                if isinstance(date, list) or where is not None:
+                    if isinstance(date, list) and state['date_field'] in local:
+                        # Stored records from the requested dates are replaced
+                        local = local[~(cache._to_timestamps(local[state['date_field']]) >= date[0])]
+                    df = pd.concat([local, df], ignore_index=True)
+                # Otherwise, there is no high-water mark and the whole table was downloaded again
+                # so it replaces the stored records
+            else:
+                # Stored records are kept if no records are returned in case the request failed silently
+                df = local
+
+            if state['id_field'] in df:
+                df = df.drop_duplicates(subset=state['id_field'], keep='last', ignore_index=True)
+
+            logger.debug(f"Sync added {len(df)-state['nrecords']} records to {store_path}")
+
+        if df is None:
+            raise ValueError(f"No data was loaded for table type {table_type}")
+        table.table = df
+
+        date_field = _find_column(df, table.date_field)
+        id_field = _find_column(df, *_sync_id_fields)
+        max_date = cache._to_timestamps(df[date_field]).max() if date_field else pd.NaT
+        max_id = df[id_field].max() if id_field else None
+        max_id = None if pd.isnull(max_id) else (max_id.item() if hasattr(max_id, 'item') else max_id)
+        new_state = {
+            'url':table.url,
+            'dataset_id':table._dataset_id,
+            'date_field':date_field,
+            'max_date':max_date.isoformat() if pd.notnull(max_date) else None,
+            'id_field':id_field,
+            'max_id':max_id,
+            'geo':has_gpd and isinstance(df, gpd.GeoDataFrame),
+            'nrecords':len(df),
+            'last_sync':datetime.now().isoformat(),
+            'version':__version__
+        }
+
+        # Write to a temporary file first so that the stored table is not corrupted if saving fails
+        tmp_file = store_path + '.tmp'
+        table.to_parquet(filename=tmp_file, mixed=mixed)
+        os.replace(tmp_file, store_path)
+        with open(state_file, 'w') as f:
+            json.dump(new_state, f, indent=4)
+
+        return table
 
     
     def __find_datasets(self, table_type, src=None):
@@ -1370,7 +1690,11 @@ class Source:
     
 
     def __load(self, table_type, date_orig, agency, load_table, pbar=True, return_count=False, force=False, 
-               nrows=None, offset=0, verbose=False, url_contains=None, id=None, format_date=True):
+               nrows=None, offset=0, verbose=False, url_contains=None, id=None, format_date=True, max_workers=1, aggregate=None, 
+               columns=None, where=None, nbatch=None, engine=None):
+        
+        if where is not None and not isinstance(where, filters.Expression):
+            raise TypeError(f"where must be a filter expression created with opd.col not {where}")
         
         date = data_loader._clean_date_input(date_orig)
         src = self.filter(table_type, date, url_contains, id, errors=True).iloc[0]
@@ -1423,10 +1747,27 @@ class Source:
                     logger.debug(f"Data URL: {src['readme']}")
 
                 if return_count:
-                    return loader.get_count(date=date_filter, agency=agency, opt_filter=opt_filter, force=force)
+                    return loader.get_count(date=date_filter, agency=agency, opt_filter=opt_filter, force=force, filter_expr=where)
+                elif aggregate is not None:
+                    try:
+                        return loader.aggregate(date=date_filter, agency=agency, opt_filter=opt_filter, filter_expr=where, **aggregate)
+                    except data_loader._ServerAggregateUnsupported as e:
+                        logger.debug(f"Unable to aggregate data on the server ({e}). Loading data to aggregate locally.")
+                    
+                    table = loader.load(date=date_filter, agency=agency, opt_filter=opt_filter, pbar=pbar, filter_expr=where)
+                    date_field = self.__fix_date_field(table, date_field, src.name)
+                    table = _check_date(table, date_field)
+                    return data_loader._aggregate_dataframe(table, date_field=date_field, **aggregate)
+                elif nbatch is not None:
+                    columns = data_loader._get_columns(columns, date_field, agency_field)
+                    batches = loader.load_iter(date=date_filter, nbatch=nbatch, offset=offset, agency=agency, opt_filter=opt_filter, pbar=pbar, 
+                                               format_date=format_date, columns=columns, filter_expr=where, engine=engine)
+                    return self.__iter_tables(batches, src, date_field, format_date, table_year, table_agency, verbose)
                 else:
+                    # Date and agency fields are always loaded so that the table can be filtered
+                    columns = data_loader._get_columns(columns, date_field, agency_field)
                     table = loader.load(date=date_filter, agency=agency, opt_filter=opt_filter, nrows=nrows, pbar=pbar, offset=offset, 
-                                        format_date=format_date)
+                                        format_date=format_date, max_workers=max_workers, columns=columns, filter_expr=where, engine=engine)
                     if format_date:
                         date_field = self.__fix_date_field(table, date_field, src.name)
                         table = _check_date(table, date_field)
@@ -1435,6 +1776,19 @@ class Source:
 
         return Table(src, table, year_filter=table_year, agency=table_agency, src_obj=self)
 
+    def __iter_tables(self, batches, src, date_field, format_date, table_year, table_agency, verbose):
+        # Batches are read after __load returns so the logging change is applied again while each batch is read
+        while True:
+            with log.temp_logging_change(verbose, if_verbose_true_level='DEBUG'):
+                try:
+                    table = next(batches)
+                except StopIteration:
+                    return
+                if format_date:
+                    date_field = self.__fix_date_field(table, date_field, src.name)
+                    table = _check_date(table, date_field)
+            yield Table(src, table, year_filter=table_year, agency=table_agency, src_obj=self)
+
     def load_csv(self, 
                 table_type: str | defs.TableType,
                 date: str | int | list[Union[int, str, pd.Timestamp]] = None,
@@ -2280,6 +2634,33 @@ def _get_years_to_check(years, cur_year, force, isfile):
 
     return years_to_check
 
+def _find_column(df, *names):
+    # Returns the first column matching any of names. Capitalization of column names sometimes changes.
+    for name in names:
+        if name is None:
+            continue
+        matches = [x for x in df.columns if isinstance(x, str) and x.lower()==name.lower()]
+        if len(matches)>0:
+            return matches[0]
+    return None
+
+def _filter_cached(df, src, columns=None, where=None, date=None):
+    # Apply filters of data request to data read from the cache
+    date_field = _find_column(df, src['date_field'])
+    if date is not None and date_field:
+        dates = cache._to_timestamps(df[date_field])
+        df = df[(dates >= date[0]) & (dates < date[1]+pd.Timedelta('1D'))]
+    if where is not None and len(df)>0:
+        df = df[where.mask(df)]
+
+    df = data_loader._select_columns(df, data_loader._get_columns(columns, src['date_field'], src['agency_field']))
+    return df.reset_index(drop=True)
+
+def _read_sync_store(filename, geo):
+    if geo and has_gpd:
+        return gpd.read_parquet(filename)
+    return pd.read_parquet(filename)
+
 def _check_whether_to_filter_by_date(src, date_orig):
     if isinstance(src, pd.DataFrame):
         assert len(src)==1
@@ -1,7 +1,8 @@
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
 import itertools
+import json
 from math import ceil
-from numpy import nan
 import pandas as pd
 import re
 import requests
@@ -10,18 +11,33 @@ from tqdm import tqdm
 from typing import Optional, Literal
 import warnings
 
-from .data_loader import Data_Loader, str2json, _url_error_msg, get_legacy_session, _process_date, _default_limit, _use_gpd_force, \
-    _has_gpd, _clean_date_input, _filter_inaccurate_date_query, _is_annual_date_query
+from .arcgis_pbf import decode_feature_collection
+from . import data_loader
+from .data_loader import Data_Loader, ColumnarPages, _build_point_geometry, str2json, _url_error_msg, get_legacy_session, http_get, _process_date, _default_limit, _use_gpd_force, \
+    _has_gpd, _clean_date_input, _filter_inaccurate_date_query, _is_annual_date_query, \
+    _check_aggregate_input, _format_aggregate, _get_columns, _ServerAggregateUnsupported
 from ..datetime_parser import to_datetime
 from ..exceptions import OPD_DataUnavailableError, OPD_arcgisAuthInfoError, OPD_TooManyRequestsError
 from .. import log
 
 if _has_gpd:
     import geopandas as gpd
-    from shapely.geometry import Point
 
 logger = log.get_logger()
 
+# Whether to request data in protocol buffer format (f=pbf) from tables and point layers that support it. Protocol buffer 
+# responses are smaller than JSON responses, but they are decoded in pure Python, which is several times slower than 
+# decoding JSON. Disabled by default. Enabling it may be faster when download speed is the limiting factor.
+use_pbf = False
+
+def _num_records(data):
+    # Number of records in a JSON result or a decoded protocol buffer result
+    return len(data["x"]) if "columns" in data else len(data["features"])
+
+class _OffsetPagingError(Exception):
+    # Raised when paging with resultOffset fails so that data can be requested by OBJECTID instead
+    pass
+
 class repeat_format(object):
     def __init__(self, string):
         self.string = string
@@ -36,6 +52,80 @@ class repeat_format(object):
             args.extend([date_field, date])
         args = tuple(args)
         return self.string.format(*args)
+
+
+@dataclass
+class LayerMetadata:
+    """
+    Metadata of an ArcGIS layer or table that is requested once and reused by later queries
+
+    Parameters
+    ----------
+    fields : list
+        Field definitions returned by the layer
+    objectid_field : str
+        Name of the OBJECTID field. None if not found
+    date_type : str
+        ArcGIS type of the date field (i.e. esriFieldTypeDate). None if no date field or if not found
+    max_record_count : int
+        Maximum number of records that can be returned per request
+    geometry_type : str
+        ArcGIS geometry type (i.e. esriGeometryPoint). None for tables
+    is_table : bool
+        Indicates if dataset is a table. Tables do not have GPS data
+    supports_pagination : bool
+        Indicates if the layer supports paging with resultOffset and resultRecordCount
+    supported_query_formats : list
+        Output formats supported by queries (i.e. JSON, geoJSON, PBF)
+    supports_statistics : bool
+        Indicates if the layer supports statistics queries (outStatistics)
+    """
+    fields: list
+    objectid_field: Optional[str] = None
+    date_type: Optional[str] = None
+    max_record_count: Optional[int] = None
+    geometry_type: Optional[str] = None
+    is_table: bool = False
+    supports_pagination: bool = True
+    supported_query_formats: tuple = ()
+    supports_statistics: bool = True
+
+    @classmethod
+    def from_json(cls, meta, date_field=None, max_record_count_limit=None):
+        fields = meta.get('fields') or []
+
+        # Prefer the layer's declared OBJECTID field. Otherwise, use the field type or name
+        objectid_field = meta.get('objectIdField')
+        if not objectid_field:
+            objectid_field = [x['name'] for x in fields if x.get('type')=='esriFieldTypeOID']
+            objectid_field = objectid_field[0] if len(objectid_field)>0 else None
+        if not objectid_field:
+            objectid_field = [x['name'] for x in fields if 'OBJECTID' in x['name'].upper()]
+            objectid_field = objectid_field[0] if len(objectid_field)>0 else None
+
+        date_type = None
+        if pd.notnull(date_field):
+            # ArcGIS field names are not case-sensitive
+            date_type = [x.get('type') for x in fields if x['name'].lower()==date_field.lower()]
+            date_type = date_type[0] if len(date_type)>0 else None
+
+        max_record_count = meta.get("maxRecordCount")
+        if max_record_count and max_record_count_limit and max_record_count>max_record_count_limit:
+            max_record_count = max_record_count_limit
+
+        if meta["type"]=="Feature Layer":
+            is_table = False
+        elif meta["type"]=="Table":
+            is_table = True
+        else:
+            raise ValueError("Unexpected ArcGIS layer type: {}".format(meta["type"]))
+        
+        adv = meta.get('advancedQueryCapabilities') or {}
+        query_formats = meta.get('supportedQueryFormats') or ''
+        query_formats = tuple([x.strip() for x in query_formats.split(',') if len(x.strip())>0])
+
+        return cls(fields, objectid_field, date_type, max_record_count, meta.get('geometryType'), is_table,
+                   adv.get('supportsPagination', True), query_formats, adv.get('supportsStatistics', True))
       
 
 class Arcgis(Data_Loader):
@@ -52,10 +142,12 @@ class Arcgis(Data_Loader):
         Maximum number of records that can be returned per request
     is_table : bool
         Indicates if dataset is a table. Tables do not have GPS data
+    metadata : LayerMetadata
+        Layer metadata requested when the object is created
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True)
+    load(date=None, nrows=None, offset=0, pbar=True, max_workers=1, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, where=None)
         Get number of records/rows generated by query
@@ -65,6 +157,11 @@ class Arcgis(Data_Loader):
 
     # Based on https://developers.arcgis.com/rest/services-reference/online/feature-layer.htm
     __max_maxRecordCount = 32000
+
+    metadata = LayerMetadata([])
+    _ineq_comp = False  # Whether date field can be compared with inequalities (and sorted)
+    _objectid_paging = False  # Whether to request batches using ranges of OBJECTIDs instead of resultOffset
+    _use_pbf = False  # Whether to request data in protocol buffer format
     
     def __init__(self, url, date_field=None, query=None):
         '''Create Arcgis object
@@ -101,17 +198,17 @@ class Arcgis(Data_Loader):
         if 'type' not in meta and meta['status']=='error':
             raise OPD_DataUnavailableError(self.url, meta['messages'], _url_error_msg.format(self.url))
 
-        if "maxRecordCount" in meta:
-            self.max_record_count = meta["maxRecordCount"] if meta['maxRecordCount']<self.__max_maxRecordCount else self.__max_maxRecordCount
-        else:
-            self.max_record_count = None
-
-        if meta["type"]=="Feature Layer":
-            self.is_table = False
-        elif meta["type"]=="Table":
-            self.is_table = True
-        else:
-            raise ValueError("Unexpected ArcGIS layer type: {}".format(meta["type"]))
+        # Metadata is stored so that later requests do not need to request it again
+        self.metadata = LayerMetadata.from_json(meta, date_field, self.__max_maxRecordCount)
+        self.max_record_count = self.metadata.max_record_count
+        self.is_table = self.metadata.is_table
+        # Date type is known without requesting data unless the date field was not found in the metadata
+        self._date_type = self.metadata.date_type
+        # Request batches using OBJECTID ranges if resultOffset is not supported
+        self._objectid_paging = not self.metadata.supports_pagination and pd.notnull(self.metadata.objectid_field)
+        # Protocol buffer results are only requested if enabled (see use_pbf). The decoder only supports point geometries.
+        self._use_pbf = use_pbf and "PBF" in [x.upper() for x in self.metadata.supported_query_formats] and \
+            (self.is_table or self.metadata.geometry_type=="esriGeometryPoint")
 
 
     def isfile(self):
@@ -124,7 +221,7 @@ class Arcgis(Data_Loader):
         return False
 
 
-    def get_count(self, date=None, *,  where=None, **kwargs):
+    def get_count(self, date=None, *,  where=None, filter_expr=None, **kwargs):
         '''Get number of records for a Arcgis data request
         
         Parameters
@@ -135,6 +232,8 @@ class Arcgis(Data_Loader):
                 2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
         where : str
             (Optional) SQL where query
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -146,16 +245,149 @@ class Arcgis(Data_Loader):
             raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
 
         date = _clean_date_input(date)
-        return self.__get_count(date, where, True)[0]
+        return self.__get_count(date, where, True, filter_expr)[0]
+        
+
+    def get_years(self, *, check=None, **kwargs):
+        '''Get years contained in data set
+        
+        Parameters
+        ----------
+        check : list
+            (Optional) If set, only years in check will be returned
+            
+        Returns
+        -------
+        list
+            list containing years in data set
+        '''
+
+        if self.date_field==None:
+            raise ValueError("A date field is required to get years")
+        
+        if check is not None and len(check)==0:
+            return []
+        
+        if self.metadata.supports_statistics:
+            if self._date_type in ['esriFieldTypeDate','esriFieldTypeDateOnly']:
+                group_by = f"EXTRACT(YEAR FROM {self.date_field})"
+            elif self._date_type in ['esriFieldTypeInteger','esriFieldTypeSmallInteger','esriFieldTypeDouble'] and \
+                (self.date_field.lower()=='yr' or 'year' in self.date_field.lower()):
+                group_by = self.date_field
+            else:
+                group_by = None
+
+            if group_by:
+                # Get the number of records in each year with a single request
+                count_field = "opd_count"
+                out_statistics = [{"statisticType":"count", "onStatisticField":self.metadata.objectid_field or self.date_field, 
+                                   "outStatisticFieldName":count_field}]
+                try:
+                    data = self.__request(where=self.__construct_where(), out_statistics=out_statistics, group_by=group_by)
+                    years = []
+                    for feat in data["features"]:
+                        year = [v for k,v in feat["attributes"].items() if k.lower()!=count_field]
+                        if count_field not in [k.lower() for k in feat["attributes"].keys()] or len(year)!=1:
+                            raise ValueError(f"Unexpected result of statistics query: {feat['attributes']}")
+                        if pd.notnull(year[0]):
+                            years.append(int(year[0]))
+                    
+                    years.sort(reverse=True)
+                    if check is not None:
+                        years = [x for x in years if x in check]
+                    return years
+                except OPD_TooManyRequestsError:
+                    raise
+                except Exception as e:
+                    logger.debug(f"Unable to get years with a statistics query ({e}). Checking years individually.")
+
+        return super().get_years(check=check, **kwargs)
+    
+
+    def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, filter_expr=None, **kwargs):
+        '''Count records in each group with a single outStatistics query
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to aggregate
+        group_by : str or list
+            (Optional) Field(s) to group by
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : str
+            (Optional) 'year' or 'month'. If set, results are also grouped by the year or month of the date field
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
+            
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the group_by fields, the date_part column (if requested) and the count
+        '''
+
+        group_by = _check_aggregate_input(group_by, agg, date_part, self.date_field)
+        if pd.isnull(self.date_field) and date!=None:
+            raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
+
+        date = _clean_date_input(date)
+        where_query = self.__construct_where(date, filter_expr=filter_expr)
+        if date!=None and self.count_precision!='day' and not _is_annual_date_query(date):
+            raise _ServerAggregateUnsupported(f"Date field {self.date_field} cannot be filtered exactly by {date} on the server")
         
+        if len(group_by)==0 and not date_part:
+            return pd.DataFrame({'count':[self.__request(where=where_query, return_count=True)["count"]]})
+        
+        if not self.metadata.supports_statistics:
+            raise _ServerAggregateUnsupported(f"Layer at {self.url} does not support statistics queries")
+
+        group_fields = group_by.copy()
+        if date_part:
+            if self._date_type in ['esriFieldTypeDate','esriFieldTypeDateOnly']:
+                group_fields.append(f"EXTRACT({date_part.upper()} FROM {self.date_field})")
+            elif date_part=='year' and self._date_type in ['esriFieldTypeInteger','esriFieldTypeSmallInteger','esriFieldTypeDouble'] and \
+                (self.date_field.lower()=='yr' or 'year' in self.date_field.lower()):
+                group_fields.append(self.date_field)
+            else:
+                raise _ServerAggregateUnsupported(f"The {date_part} of date field {self.date_field} cannot be computed on the server")
+
+        count_field = "opd_count"
+        out_statistics = [{"statisticType":"count", "onStatisticField":self.metadata.objectid_field or (group_by[0] if group_by else self.date_field), 
+                           "outStatisticFieldName":count_field}]
+        data = self.__request(where=where_query, out_statistics=out_statistics, group_by=",".join(group_fields))
+
+        if data.get("exceededTransferLimit"):
+            raise _ServerAggregateUnsupported("Number of groups exceeds the maximum number of records returned by the server")
+
+        rows = []
+        for feat in data["features"]:
+            # Field names may not be returned in the same case as requested
+            attributes = {k.lower():v for k,v in feat["attributes"].items()}
+            row = {}
+            for g in group_by:
+                if g.lower() not in attributes:
+                    raise ValueError(f"Unexpected result of statistics query: {feat['attributes']}")
+                row[g] = attributes.pop(g.lower())
+            if count_field not in attributes:
+                raise ValueError(f"Unexpected result of statistics query: {feat['attributes']}")
+            row["count"] = attributes.pop(count_field)
+            if date_part:
+                if len(attributes)!=1:
+                    raise ValueError(f"Unexpected result of statistics query: {feat['attributes']}")
+                row[date_part] = list(attributes.values())[0]
+            rows.append(row)
+
+        return _format_aggregate(pd.DataFrame(rows), group_by, date_part)
+    
 
-    def __get_count(self, date, where, throw_error):
-        if self._last_count is not None and self._last_count[0]==(date,where):
+    def __get_count(self, date, where, throw_error, filter_expr=None):
+        filter_sql = filter_expr.to_sql('arcgis') if filter_expr is not None else None
+        if self._last_count is not None and self._last_count[0]==(date,where,filter_sql):
             logger.debug("Request matches previous count request. Returning saved count.")
             record_count = self._last_count[1]
             where_query = self._last_count[2]
         else:
-            where_query = self.__construct_where(date, where=where)
+            where_query = self.__construct_where(date, where=where, filter_expr=filter_expr)
 
             if throw_error and date!=None and self.count_precision!='day'and not _is_annual_date_query(date):
                 raise ValueError(f"Count is not accurate for date input {date}. "
@@ -167,19 +399,15 @@ class Arcgis(Data_Loader):
             
             record_count = self.__request(where=where_query, return_count=True)["count"]
 
-        self._last_count = ((date,where), record_count, where_query)
+        self._last_count = ((date,where,filter_sql), record_count, where_query)
 
         return record_count, where_query
     
 
-    def __request(self, where=None, return_count=False, out_fields="*", out_type="json", offset=0, count=None, sp_ref=None, order_by_date=True):
+    def __request(self, where=None, return_count=False, out_fields="*", out_type="json", offset=0, count=None, sp_ref=None, order_by_date=True,
+                  return_ids=False, out_statistics=None, group_by=None):
 
-        try:
-            r=requests.get(self.url, params={'f':'json'})
-            # TODO: This should be only done once?
-            orderby = [x['name'] for x in r.json()['fields'] if 'OBJECTID' in x['name'].upper()][0]
-        except:
-            orderby = None
+        orderby = self.metadata.objectid_field
         
         # Running with no inputs or just an out_type will return metadata only
         url = self.url + "/"
@@ -190,10 +418,17 @@ class Arcgis(Data_Loader):
             params["outFields"] = out_fields
             if return_count:
                 params["returnCountOnly"] = True
+            elif return_ids:
+                params["returnIdsOnly"] = True
+            elif out_statistics is not None:
+                params["outStatistics"] = json.dumps(out_statistics)
+                if group_by:
+                    params["groupByFieldsForStatistics"] = group_by
             else:
                 # Don't add offset for returning record count. The maximum value returned appears to be the maxRecordCount not the total count of records.
                 # If it's ever desired to get the record with an offset, recommend getting the record count without the offset and then subtracting the offset.
-                params["resultOffset"] = offset
+                if offset!=None:
+                    params["resultOffset"] = offset
                 if sp_ref!=None:
                     params["outSR"] = sp_ref
                 if order_by_date and pd.notnull(self.date_field) and self._ineq_comp:
@@ -210,13 +445,11 @@ class Arcgis(Data_Loader):
             logger.debug(f"\t{k} = {v}")
 
         try:
-            r = requests.get(url, params=params)
+            r = http_get(url, params=params)
             r.raise_for_status()
         except requests.exceptions.SSLError as e:
             if "[SSL: UNSAFE_LEGACY_RENEGOTIATION_DISABLED] unsafe legacy renegotiation disabled" in str(e.args[0]):
-                with get_legacy_session() as session:
-                    r = session.get(url, params=params)
-                    
+                r = get_legacy_session(url).get(url, params=params)
                 r.raise_for_status()
             elif "[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed" in str(e.args[0]):
                 raise OPD_DataUnavailableError(self.url, e.args, _url_error_msg.format(self.url))
@@ -233,6 +466,10 @@ class Arcgis(Data_Loader):
         except Exception as e: 
             raise e
 
+        if out_type=="pbf" and "json" not in r.headers.get("Content-Type","").lower():
+            # Errors are returned as JSON
+            return decode_feature_collection(r.content)
+
         try:
             result = r.json()
         except requests.exceptions.JSONDecodeError:
@@ -251,16 +488,44 @@ class Arcgis(Data_Loader):
         return result
     
 
-    def __construct_where(self, date=None, where=None):
+    def __get_object_ids(self, where_query):
+        # Returns sorted OBJECTIDs of all records matching where_query. The number of IDs returned is not limited by maxRecordCount.
+        data = self.__request(where=where_query, return_ids=True)
+        return sorted(data.get("objectIds") or [])
+    
+
+    def __request_object_ids(self, where_query, object_ids, out_type="json", out_fields="*"):
+        # Request records whose OBJECTIDs are between the first and last values of object_ids (sorted).
+        # Combining with where_query ensures only records in object_ids are returned
+        oid = self.metadata.objectid_field
+        where = f"({where_query}) AND {oid} >= {object_ids[0]} AND {oid} <= {object_ids[-1]}"
+        data = self.__request(where=where, offset=None, order_by_date=False, out_type=out_type, out_fields=out_fields)
+        if "columns" in data:
+            if oid in data["columns"]:
+                idx = data["columns"][oid].argsort(kind="stable")
+                data["columns"] = {k:v[idx] for k,v in data["columns"].items()}
+                for k in ["x","y","has_geometry"]:
+                    data[k] = data[k][idx]
+        elif len(data["features"])>0 and oid in data["features"][0]["attributes"]:
+            data["features"].sort(key=lambda x: x["attributes"][oid])
+        return data
+
+
+    def __construct_where(self, date=None, where=None, filter_expr=None):
         where_query = " AND ".join([f"{k} = '{v}'" for k,v in self.query.items()]) if self.query else None
         if where:
             where_query = where_query + " AND " + where if where_query else where
+        if filter_expr is not None:
+            filter_sql = f"({filter_expr.to_sql('arcgis')})"
+            where_query = where_query + " AND " + filter_sql if where_query else filter_sql
 
         if date!=None:
             if self.date_field==None:
                 raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
             
-            where_query = self._build_date_query(date)
+            date_query = self._build_date_query(date)
+            # Parentheses keep OR statements in date query from combining with other conditions
+            where_query = f"({date_query}) AND ({where_query})" if where_query else date_query
         elif not where_query:
             where_query = '1=1'
 
@@ -284,6 +549,9 @@ class Arcgis(Data_Loader):
             where_query = self._build_date_query_date_type(date, is_numeric_year=True)
         elif self._date_type=='esriFieldTypeString':
             if not self._date_format:
+                if data is None:
+                    # Date type was found in the metadata. Sample data is still needed to determine the format
+                    data = self.__request(where=f'{self.date_field} IS NOT NULL', out_fields=self.date_field, count=1000, order_by_date=False)
                 self._find_string_type_date_query_format(data)
                 
             where_query = self._build_string_type_date_query(date)
@@ -401,7 +669,7 @@ class Arcgis(Data_Loader):
             # where_query = f"{self.date_field} >= TIMESTAMP '{start_date}' AND  {self.date_field} < TIMESTAMP '{stop_date_tmp}'"
 
 
-    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, max_workers=1, columns=None, filter_expr=None, **kwargs):
         '''Download table from ArcGIS to pandas or geopandas DataFrame
         
         Parameters
@@ -419,6 +687,14 @@ class Arcgis(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        max_workers : int, optional
+            Maximum number of batches of records to request simultaneously. Batches are combined in order after they are requested. 
+            The number of workers is limited to the connection pool size (see data_loader.set_transport_options).
+            By default 1 (batches are requested one at a time)
+        columns : list, optional
+            Fields to request. The date field is always included. By default None (all fields)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -430,8 +706,10 @@ class Arcgis(Data_Loader):
             raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
 
         date = _clean_date_input(date)
+        # Offset requested by the user. offset may be set to 0 below if the offset is applied after reading.
+        requested_offset = offset
         
-        record_count, where_query = self.__get_count(date, None, False)
+        record_count, where_query = self.__get_count(date, None, False, filter_expr)
 
         not_precise = date!=None and self.count_precision != 'day' and not _is_annual_date_query(date)
         if not_precise:
@@ -457,15 +735,54 @@ class Arcgis(Data_Loader):
         if pbar:
             bar = tqdm(desc=self.url, total=nrows, leave=False) 
             
-        features = []
-        for batch in range(num_batches):
+        # Paging by OBJECTID can be used if paging by offset fails
+        can_page_by_id = pd.notnull(self.metadata.objectid_field)
+        object_ids = None
+
+        out_fields = "*"
+        drop_objectid = False
+        columns = _get_columns(columns, self.date_field)
+        if columns is not None:
+            # Field names are not case-sensitive. Fields not in the layer are ignored
+            field_names = {x['name'].lower():x['name'] for x in self.metadata.fields}
+            if len(field_names)>0:
+                columns = [field_names[x.lower()] for x in columns if x.lower() in field_names]
+            if can_page_by_id and self.metadata.objectid_field not in columns:
+                # OBJECTID is needed to sort records requested by OBJECTID ranges
+                columns.append(self.metadata.objectid_field)
+                drop_objectid = True
+            out_fields = ",".join(columns)
+
+        def fetch_page(batch, bs, out_type):
+            if object_ids is None:
+                return self.__request(where=where_query, offset=offset+batch*batch_size, count=bs, out_type=out_type, out_fields=out_fields)
+            else:
+                return self.__request_object_ids(where_query, object_ids[batch*batch_size:batch*batch_size+bs], out_type=out_type, 
+                                                 out_fields=out_fields)
+
+        # Format of results. The format is decided by the 1st batch, which is requested before any other batches, 
+        # so that all batches have the same format.
+        out_type = "pbf" if self._use_pbf else "json"
+
+        def request_page(batch, bs):
+            nonlocal out_type
+            if batch==0 and out_type=="pbf":
+                try:
+                    return fetch_page(batch, bs, "pbf")
+                except Exception as e:
+                    logger.debug(f"Unable to request data in protocol buffer format ({e}). Requesting JSON instead.")
+                    out_type = "json"
+            
+            return fetch_page(batch, bs, out_type)
+
+        def request_batch(batch):
             bs = batch_size if batch<num_batches-1 else nrows-batch*batch_size
             try:
                 try:
                     max_tries = 1 + (batch==0 and num_batches>1)
                     for k in range(max_tries):
-                        data = self.__request(where=where_query, offset=offset+batch*batch_size, count=bs)
-                        if len(data['features'])==batch_size:
+                        data = request_page(batch, bs)
+                        if _num_records(data)==batch_size:
                             break
                         elif k+1<max_tries:
                             sleep(2)  # https://maps2.dcgis.dc.gov/dcgis/rest/services/FEEDS/MPD/MapServer/35 has returned 1000 before when it should return 2000
@@ -473,34 +790,107 @@ class Arcgis(Data_Loader):
                     if batch>0:
                         # There may have been an error due to too many requests over a short time. Wait and try again
                         sleep(10)
-                        data = self.__request(where=where_query, offset=offset+batch*batch_size, count=bs)
+                        data = request_page(batch, bs)
                     else:
                         raise
 
-                features.extend(data["features"])
-
-                if batch==0:
-                    date_cols = [x["name"] for x in data["fields"] if x["type"]=='esriFieldTypeDate' and x['name'].lower()!='time']
-                    if not self.is_table:
-                        wkid = data["spatialReference"]["wkid"]
-                    if len(data["features"]) not in [batch_size, nrows]:
-                        num_rows = len(data["features"])
-                        raise ValueError(f"Number of rows is {num_rows} but is expected to be max rows to read {batch_size} or total number of rows {nrows}")
+                if batch==0 and _num_records(data) not in [batch_size, nrows]:
+                    num_rows = _num_records(data)
+                    raise ValueError(f"Number of rows is {num_rows} but is expected to be max rows to read {batch_size} or total number of rows {nrows}")
+                elif object_ids is None and batch>0 and can_page_by_id and _num_records(data)!=bs:
+                    # Server may be ignoring the offset
+                    raise _OffsetPagingError(f"Number of rows is {_num_records(data)} but is expected to be {bs}")
+            except _OffsetPagingError:
+                raise
             except Exception as e:
-                if len(e.args)>0 and "Error Code: 429" in e.args[0]:
+                if len(e.args)>0 and isinstance(e.args[0], str) and "Error Code: 429" in e.args[0]:
                     raise OPD_TooManyRequestsError(self.url, *e.args, _url_error_msg.format(self.url))
+                elif object_ids is None and batch>0 and can_page_by_id:
+                    # Requests with large offsets are slow or fail on some servers
+                    raise _OffsetPagingError(*e.args) from e
                 else:
                     raise
-            except:
-                raise
 
             if pbar:
-                bar.update(len(data["features"]))
+                bar.update(_num_records(data))
+
+            return data
+
+        if _use_gpd_force is not None:
+            use_gpd = _use_gpd_force
+        else:
+            use_gpd = _has_gpd
+
+        def add_page(data):
+            # Add page to columns so that the page can be discarded
+            if "columns" in data:
+                geometry = None
+                if not use_gpd:
+                    geometry = [{"x":a, "y":b} if has else None for a,b,has in zip(data["x"].tolist(), data["y"].tolist(), data["has_geometry"])]
+                pages.add_columns(data["columns"], _num_records(data), data["x"], data["y"], data["has_geometry"], geometry)
+            else:
+                pages.add_records([x["attributes"] for x in data["features"]], geometry=[x.get("geometry") for x in data["features"]])
+
+        while True:
+            if self._objectid_paging:
+                # Records are requested by ranges of OBJECTIDs, which does not require the server to support offsets
+                object_ids = self.__get_object_ids(where_query)[offset:offset+nrows]
+                nrows = len(object_ids)
+                if nrows==0:
+                    if pbar:
+                        bar.close()
+                    return pd.DataFrame()
+                batch_size = min(batch_size, nrows)
+                num_batches = ceil(nrows / batch_size)
+
+            pages = ColumnarPages(keep_geometry=not use_gpd)
+            try:
+                # 1st batch is requested alone to validate the number of rows returned and get the field information
+                data = request_batch(0)
+                # Later loads use the format that worked
+                self._use_pbf = out_type=="pbf"
+                date_cols = [x["name"] for x in data["fields"] if x["type"]=='esriFieldTypeDate' and x['name'].lower()!='time']
+                if not self.is_table:
+                    wkid = data["spatialReference"]["wkid"]
+                add_page(data)
+
+                if max_workers>1 and num_batches>2:
+                    # More workers than connections in the session's pool would repeatedly open and discard connections
+                    num_workers = min(max_workers, data_loader.pool_maxsize)
+                    logger.debug(f"Requesting {num_batches-1} remaining batches using {num_workers} workers")
+                    executor = ThreadPoolExecutor(max_workers=num_workers)
+                    try:
+                        # map returns results in the order of the batches
+                        for data in executor.map(request_batch, range(1, num_batches)):
+                            add_page(data)
+                    finally:
+                        # Remaining batches are not needed if a batch failed
+                        executor.shutdown(wait=True, cancel_futures=True)
+                else:
+                    for batch in range(1, num_batches):
+                        add_page(request_batch(batch))
+                break
+            except _OffsetPagingError as e:
+                if requested_offset>0:
+                    # Records requested by OBJECTID are ordered by OBJECTID instead of by date. Switching would change
+                    # which records are skipped by the offset compared to previous requests (i.e. batches of load_iter)
+                    raise OPD_DataUnavailableError(self.url, *e.args, _url_error_msg.format(self.url)) from e
+                logger.debug(f"Requesting data using offsets failed ({e}). Restarting request using OBJECTID ranges.")
+                self._objectid_paging = True
+                if pbar:
+                    bar.reset()
 
         if pbar:
             bar.close()
 
-        df = pd.DataFrame.from_records([x["attributes"] for x in features])
+        df = pages.to_frame()
+        x, y, has_geometry = pages.get_coordinates()
+        geometry = pages.get_geometry()
+        del pages
+
+        if drop_objectid:
+            df = df.drop(columns=self.metadata.objectid_field, errors='ignore')
+
         if format_date:
             for col in date_cols:
                 if col in df:
@@ -510,32 +900,23 @@ class Arcgis(Data_Loader):
         if not_precise:
             df['tmp_idx'] = range(0,len(df))
             df = _filter_inaccurate_date_query(df, self.date_field, date, format_date, offset_after_read, nrows_after_read)
-            features = [x for k,x in enumerate(features) if k in df['tmp_idx']]
+            idx = df['tmp_idx'].to_numpy()
+            x, y, has_geometry = x[idx], y[idx], has_geometry[idx]
+            if not use_gpd:
+                geometry = [geometry[k] for k in idx]
             df = df.drop(columns='tmp_idx')
 
         if len(df) > 0:
-            has_point_geometry = any("geometry" in x and "x" in x["geometry"] for x in features)
-            if not self.is_table and has_point_geometry:
-                if _use_gpd_force is not None:
-                    if not _has_gpd and _use_gpd_force:
-                        raise ValueError("User cannot force GeoPandas usage when it is not installed")
-                    use_gpd = _use_gpd_force
-                else:
-                    use_gpd = _has_gpd
+            if not self.is_table and has_geometry.any():
+                if _use_gpd_force and not _has_gpd:
+                    raise ValueError("User cannot force GeoPandas usage when it is not installed")
 
                 if use_gpd:
                     # pyproj installs with geopandas
                     from pyproj.exceptions import CRSError
                     from pyproj import CRS
 
-                    geometry = []
-                    for feat in features:
-                        if "geometry" not in feat:
-                            geometry.append(None)
-                        elif feat["geometry"]["x"]=="NaN":
-                            geometry.append(Point(nan, nan))
-                        else:
-                            geometry.append(Point(feat["geometry"]["x"], feat["geometry"]["y"]))
+                    geometry = _build_point_geometry(x, y, has_geometry)
 
                     logger.debug("Geometry found. Contructing geopandas GeoDataFrame")
                     try:
@@ -547,8 +928,6 @@ class Arcgis(Data_Loader):
                     except Exception as e:
                         raise e
                 else:
-                    geometry = [feat["geometry"] if "geometry" in feat else None for feat in features]
-
                     if "geolocation" not in df:
                         logger.debug("Adding geometry column generated from spatial data provided by request.")
                         df["geolocation"] = geometry
@@ -0,0 +1,254 @@
+'''Decoder for ArcGIS feature query results requested in protocol buffer format (f=pbf)
+
+Based on the FeatureCollection.proto (esriPBuffer) definition at https://github.com/Esri/arcgis-pbf.
+Only the parts of the format needed to load attributes and point geometries are decoded.
+'''
+import numpy as np
+import struct
+
+# FeatureCollectionPBuffer.FieldType enumeration
+_field_types = ["esriFieldTypeSmallInteger", "esriFieldTypeInteger", "esriFieldTypeSingle", "esriFieldTypeDouble",
+                "esriFieldTypeString", "esriFieldTypeDate", "esriFieldTypeOID", "esriFieldTypeGeometry",
+                "esriFieldTypeBlob", "esriFieldTypeRaster", "esriFieldTypeGUID", "esriFieldTypeGlobalID",
+                "esriFieldTypeXML", "esriFieldTypeBigInteger", "esriFieldTypeDateOnly", "esriFieldTypeTimeOnly",
+                "esriFieldTypeTimestampOffset"]
+
+_int_types = ["esriFieldTypeSmallInteger", "esriFieldTypeInteger", "esriFieldTypeOID", "esriFieldTypeBigInteger"]
+# Dates are returned as milliseconds since epoch like they are for JSON
+_float_types = ["esriFieldTypeSingle", "esriFieldTypeDouble", "esriFieldTypeDate"]
+
+# Wire types
+_VARINT = 0
+_FIXED64 = 1
+_LEN = 2
+_FIXED32 = 5
+
+class PbfDecodeError(ValueError):
+    pass
+
+
+def _read_varint(buf, pos):
+    result = 0
+    shift = 0
+    while True:
+        b = buf[pos]
+        pos+=1
+        result |= (b & 0x7f) << shift
+        if b < 0x80:
+            return result, pos
+        shift += 7
+
+
+def _zigzag(n):
+    return (n >> 1) ^ -(n & 1)
+
+
+def _to_signed64(n):
+    return n - (1 << 64) if n >= (1 << 63) else n
+
+
+def _iter_fields(buf):
+    # Yields field number, wire type, and value of each field in a message.
+    # Values of length-delimited fields are returned as memoryviews of buf
+    pos = 0
+    end = len(buf)
+    try:
+        while pos < end:
+            key, pos = _read_varint(buf, pos)
+            wire_type = key & 0x7
+            if wire_type==_VARINT:
+                value, pos = _read_varint(buf, pos)
+            elif wire_type==_LEN:
+                n, pos = _read_varint(buf, pos)
+                value = buf[pos:pos+n]
+                pos+=n
+            elif wire_type==_FIXED64:
+                value = buf[pos:pos+8]
+                pos+=8
+            elif wire_type==_FIXED32:
+                value = buf[pos:pos+4]
+                pos+=4
+            else:
+                raise PbfDecodeError(f"Unsupported protocol buffer wire type {wire_type}")
+
+            if pos > end:
+                raise PbfDecodeError("Protocol buffer message is truncated")
+
+            yield key >> 3, wire_type, value
+    except IndexError as e:
+        raise PbfDecodeError("Protocol buffer message is truncated") from e
+
+
+def _read_packed_varints(buf):
+    values = []
+    pos = 0
+    end = len(buf)
+    while pos < end:
+        v, pos = _read_varint(buf, pos)
+        values.append(v)
+    return values
+
+
+def _decode_value(buf):
+    # FeatureCollectionPBuffer.Value. An empty message is a null value
+    for num, _, v in _iter_fields(buf):
+        if num==1:
+            return bytes(v).decode('utf-8')
+        elif num==2:
+            return struct.unpack('<f', v)[0]
+        elif num==3:
+            return struct.unpack('<d', v)[0]
+        elif num in [4,8]:
+            return _zigzag(v)
+        elif num in [5,7]:
+            return v
+        elif num==6:
+            return _to_signed64(v)
+        elif num==9:
+            return bool(v)
+    return None
+
+
+def _decode_point(buf):
+    # FeatureCollectionPBuffer.Geometry: coordinates are zigzag-encoded and delta-encoded
+    coords = []
+    for num, wire_type, v in _iter_fields(buf):
+        if num==3:
+            coords.extend(_read_packed_varints(v) if wire_type==_LEN else [v])
+    if len(coords) < 2:
+        return None
+    return _zigzag(coords[0]), _zigzag(coords[1])
+
+
+def _decode_field(buf):
+    name = None
+    field_type = 0
+    for num, _, v in _iter_fields(buf):
+        if num==1:
+            name = bytes(v).decode('utf-8')
+        elif num==2:
+            field_type = v
+    field_type = _field_types[field_type] if field_type < len(_field_types) else None
+    return {"name":name, "type":field_type}
+
+
+def _decode_transform(buf):
+    # Returns quantization origin position (0 is upper left), scale, and translation
+    origin = 0
+    scale = [1.0, 1.0]
+    translate = [0.0, 0.0]
+    for num, _, v in _iter_fields(buf):
+        if num==1:
+            origin = v
+        elif num in [2,3]:
+            vals = scale if num==2 else translate
+            for k, _, x in _iter_fields(v):
+                if k in [1,2]:
+                    vals[k-1] = struct.unpack('<d', x)[0]
+    return origin, scale, translate
+
+
+def _to_array(values, field_type):
+    if field_type in _int_types:
+        if any(x is None for x in values):
+            return np.array([np.nan if x is None else x for x in values], dtype=float)
+        return np.array(values, dtype=np.int64)
+    elif field_type in _float_types:
+        return np.array([np.nan if x is None else x for x in values], dtype=float)
+    else:
+        arr = np.empty(len(values), dtype=object)
+        arr[:] = values
+        return arr
+
+
+def decode_feature_collection(content):
+    '''Decode the result of an ArcGIS feature query in protocol buffer format
+
+    Parameters
+    ----------
+    content : bytes
+        Content of response to a query with f=pbf
+
+    Returns
+    -------
+    dict
+        Dictionary with the following keys:
+            fields: list of dictionaries containing the name and type of each field (like JSON results)
+            spatialReference: dictionary containing wkid
+            columns: dictionary of NumPy arrays of the values of each field
+            x, y: NumPy arrays of point coordinates (NaN if a feature has no geometry)
+            has_geometry: NumPy boolean array indicating if each feature has geometry
+            exceededTransferLimit: bool
+    '''
+
+    buf = memoryview(content)
+    feature_result = None
+    for num, _, v in _iter_fields(buf):
+        if num==2:  # queryResult
+            for k, _, x in _iter_fields(v):
+                if k==1:  # featureResult
+                    feature_result = x
+                elif k in [2,3]:
+                    raise PbfDecodeError("Query result is not a feature result")
+
+    if feature_result is None:
+        raise PbfDecodeError("No feature result found in protocol buffer message")
+
+    fields = []
+    wkid = None
+    transform = None
+    exceeded_limit = False
+    features = []
+    for num, _, v in _iter_fields(feature_result):
+        if num==8:  # spatialReference
+            for k, _, x in _iter_fields(v):
+                if k==1:
+                    wkid = x
+                elif k==2 and wkid is None:
+                    wkid = x
+        elif num==9:
+            exceeded_limit = bool(v)
+        elif num==12:
+            transform = _decode_transform(v)
+        elif num==13:
+            fields.append(_decode_field(v))
+        elif num==15:
+            features.append(v)
+
+    nfields = len(fields)
+    values = [[None]*len(features) for _ in range(nfields)]
+    qx = np.zeros(len(features), dtype=float)
+    qy = np.zeros(len(features), dtype=float)
+    has_geometry = np.zeros(len(features), dtype=bool)
+    for k, feat in enumerate(features):
+        m = 0
+        for num, _, v in _iter_fields(feat):
+            if num==1:
+                if m < nfields:
+                    values[m][k] = _decode_value(v)
+                m+=1
+            elif num==2:
+                pt = _decode_point(v)
+                if pt is not None:
+                    qx[k], qy[k] = pt
+                    has_geometry[k] = True
+
+    # Convert quantized coordinates
+    origin, scale, translate = transform if transform else (0, [1.0, 1.0], [0.0, 0.0])
+    x = qx*scale[0] + translate[0]
+    if origin==0:  # Upper left
+        y = translate[1] - qy*scale[1]
+    else:
+        y = translate[1] + qy*scale[1]
+    x[~has_geometry] = np.nan
+    y[~has_geometry] = np.nan
+
+    return {
+        "fields":fields,
+        "spatialReference":{"wkid":wkid},
+        "columns":{f["name"]:_to_array(v, f["type"]) for f,v in zip(fields, values)},
+        "x":x,
+        "y":y,
+        "has_geometry":has_geometry,
+        "exceededTransferLimit":exceeded_limit
+    }
@@ -3,15 +3,14 @@ import pandas as pd
 import requests
 from tqdm import tqdm
 
-from .data_loader import Data_Loader, str2json, _url_error_msg, _process_date, _default_limit, _use_gpd_force, _has_gpd, _clean_date_input, \
-    _is_annual_date_query
+from .data_loader import Data_Loader, ColumnarPages, _build_point_geometry, str2json, _url_error_msg, http_get, _process_date, _default_limit, _use_gpd_force, _has_gpd, _clean_date_input, \
+    _is_annual_date_query, _check_aggregate_input, _format_aggregate, _get_columns, _column_matcher, _ServerAggregateUnsupported
 from ..datetime_parser import to_datetime
 from ..exceptions import OPD_DataUnavailableError, OPD_TooManyRequestsError
 from .. import log
 
 if _has_gpd:
     import geopandas as gpd
-    from shapely.geometry import Point
 
 logger = log.get_logger()
 
@@ -32,7 +31,7 @@ class Carto(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True)
+    load(date=None, nrows=None, offset=0, pbar=True, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, where=None)
         Get number of records/rows generated by query
@@ -87,7 +86,7 @@ class Carto(Data_Loader):
         return f'{self.url}?q=SELECT * FROM {self.data_set}'
 
 
-    def get_count(self, date=None, **kwargs):
+    def get_count(self, date=None, *, filter_expr=None, **kwargs):
         '''Get number of records for a data request
         
         Parameters
@@ -96,6 +95,8 @@ class Carto(Data_Loader):
             (Optional) Define timespan of data to request count for:
                 1. Request data for an entire year by inputting the year (i.e. 2023)
                 2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -104,19 +105,20 @@ class Carto(Data_Loader):
         '''
 
         date = _clean_date_input(date)
-        return self.__get_count(date, True)[0]
+        return self.__get_count(date, True, filter_expr)[0]
     
 
-    def __get_count(self, date, throw_error):
+    def __get_count(self, date, throw_error, filter_expr=None):
         if pd.isnull(self.date_field) and date!=None:
             raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
         
-        if self._last_count is not None and self._last_count[0]==date:
+        filter_sql = filter_expr.to_sql('carto') if filter_expr is not None else None
+        if self._last_count is not None and self._last_count[0]==date and self._last_count[3]==filter_sql:
             logger.debug("Request matches previous count request. Returning saved count.")
             record_count = self._last_count[1]
             where_query = self._last_count[2]
         else:
-            where_query = self.__construct_where(date)
+            where_query = self.__construct_where(date, filter_expr)
 
             if throw_error and date!=None and self.count_precision!='day'and not _is_annual_date_query(date):
                 raise ValueError(f"Count is not accurate for date input {date}. "
@@ -129,12 +131,12 @@ class Carto(Data_Loader):
             json = self.__request(where=where_query, return_count=True)
             record_count = json["rows"][0]["count"]
 
-        self._last_count = (date, record_count, where_query)
+        self._last_count = (date, record_count, where_query, filter_sql)
 
         return record_count, where_query
 
 
-    def __request(self, where=None, return_count=False, out_fields="*", out_type="GeoJSON", offset=0, count=None):
+    def __request(self, where=None, return_count=False, out_fields="*", out_type="GeoJSON", offset=0, count=None, group_by=None):
 
         query = "SELECT "
         params = {}
@@ -161,7 +163,9 @@ class Carto(Data_Loader):
             else:
                 query+=" WHERE"+ default_where[4:]
 
-        if not return_count and count!=0:
+        if group_by is not None:
+            query+=f" GROUP BY {group_by}"
+        elif not return_count and count!=0:
             # Order results to ensure data order remains constant if paging
             query+=" ORDER BY cartodb_id"
 
@@ -176,7 +180,7 @@ class Carto(Data_Loader):
         for k,v in params.items():
             logger.debug(f"\t{k} = {v}")
 
-        r = requests.get(self.url, params=params)
+        r = http_get(self.url, params=params)
 
         try:
             r.raise_for_status()
@@ -193,31 +197,135 @@ class Carto(Data_Loader):
         return r.json()
 
 
-    def __construct_where(self, date=None):
+    def __get_date_type(self):
+        # Returns 'date' for date fields, 'year' for numeric year fields, and the Carto type otherwise
+        type_info = self.__request(count=0, out_type="JSON", out_fields=self.date_field)
+        date_type = type_info['fields'][self.date_field]['type']
+        if date_type=='number' and 'year' in self.date_field.lower():
+            date_type = 'year'
+        return date_type
+
+
+    def __get_date_part_expr(self, date_part):
+        # SQL expression for the year or month of the date field.
+        # Same date types that can be filtered in __construct_where
+        date_type = self.__get_date_type()
+        if date_type=='date':
+            return f"EXTRACT({date_part.upper()} FROM {self.date_field})"
+        elif date_type=='year' and date_part=='year':
+            return self.date_field
+        else:
+            raise _ServerAggregateUnsupported(f"Unable to get the {date_part} from field of type {date_type}")
+
+
+    def get_years(self, *, check=None, **kwargs):
+        '''Get years contained in data set
+        
+        Parameters
+        ----------
+        check : list
+            (Optional) If set, only years in check will be returned
+            
+        Returns
+        -------
+        list
+            list containing years in data set
+        '''
+
+        if self.date_field==None:
+            raise ValueError("A date field is required to get years")
+        
+        if check is not None and len(check)==0:
+            return []
+        
+        try:
+            year_expr = self.__get_date_part_expr('year')
+            # Count records in each year with a single request
+            json = self.__request(out_fields=f"{year_expr} AS year, count(*) AS count", out_type="JSON", group_by="1")
+            years = [int(x["year"]) for x in json["rows"] if pd.notnull(x["year"]) and x["count"]>0]
+        except (NotImplementedError, OPD_DataUnavailableError, requests.HTTPError) as e:
+            logger.debug(f"Unable to get years with a single request ({e}). Checking years individually.")
+            return super().get_years(check=check, **kwargs)
+
+        years.sort(reverse=True)
+        if check is not None:
+            years = [x for x in years if x in check]
+
+        return years
+
+
+    def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, filter_expr=None, **kwargs):
+        '''Count records in each group with a SQL GROUP BY query
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to aggregate
+        group_by : str or list
+            (Optional) Field(s) to group by
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : str
+            (Optional) 'year' or 'month'. If set, results are also grouped by the year or month of the date field
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
+            
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the group_by fields, the date_part column (if requested) and the count
+        '''
+
+        group_by = _check_aggregate_input(group_by, agg, date_part, self.date_field)
+        date = _clean_date_input(date)
+        if len(group_by)==0 and not date_part:
+            return pd.DataFrame({'count':[self.get_count(date, filter_expr=filter_expr)]})
+        
+        if pd.isnull(self.date_field) and date!=None:
+            raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
+        where_query = self.__construct_where(date, filter_expr)
+        if date!=None and self.count_precision!='day' and not _is_annual_date_query(date):
+            raise _ServerAggregateUnsupported(f"Date field {self.date_field} cannot be filtered exactly by {date} on the server")
+
+        out_fields = group_by.copy()
+        if date_part:
+            out_fields.append(f"{self.__get_date_part_expr(date_part)} AS {date_part}")
+        group_by_cols = ", ".join(str(k+1) for k in range(len(out_fields)))
+        out_fields.append("count(*) AS count")
+
+        json = self.__request(where=where_query, out_fields=", ".join(out_fields), out_type="JSON", group_by=group_by_cols)
+        df = pd.DataFrame.from_records(json["rows"], columns=group_by+([date_part] if date_part else [])+["count"])
+        return _format_aggregate(df, group_by, date_part)
+
+
+    def __construct_where(self, date=None, filter_expr=None):
         if date!=None:
             if self.date_field==None:
                 raise ValueError('Date filtering requested for a dataset with no recorded date field')
             
             start_date, stop_date = _process_date(date)
-            type_info = self.__request(count=0, out_type="JSON", out_fields=self.date_field)
-            if type_info['fields'][self.date_field]['type']=='date':
+            date_type = self.__get_date_type()
+            if date_type=='date':
                 self.count_precision = 'day'
                 where_query = f"{self.date_field} >= '{start_date}' AND {self.date_field} <= '{stop_date}'"
-            elif type_info['fields'][self.date_field]['type']=='number' and 'year' in self.date_field.lower():
+            elif date_type=='year':
                 self.count_precision = 'year'
                 where_query = f"{self.date_field} >= {start_date[:4]} AND {self.date_field} <= {stop_date[:4]}"
-            elif type_info['fields'][self.date_field]['type']=='string':
-                raise NotImplementedError()
             else:
                 raise NotImplementedError()
             
         else:
             where_query = None
 
+        if filter_expr is not None:
+            # Parentheses keep OR statements in filter from combining with other conditions
+            filter_sql = f"({filter_expr.to_sql('carto')})"
+            where_query = f"{where_query} AND {filter_sql}" if where_query else filter_sql
+
         return where_query
 
     
-    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, columns=None, filter_expr=None, **kwargs):
         '''Download table to pandas or geopandas DataFrame
         
         Parameters
@@ -235,6 +343,10 @@ class Carto(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Fields to request. The date field is always included. By default None (all fields)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -244,7 +356,7 @@ class Carto(Data_Loader):
 
         date = _clean_date_input(date)
         
-        record_count, where_query = self.__get_count(date, False)
+        record_count, where_query = self.__get_count(date, False, filter_expr)
 
         record_count-=offset
         if record_count<=0:
@@ -261,16 +373,29 @@ class Carto(Data_Loader):
 
         # When requesting data as GeoJSON, no type information is returned so request it now
         type_info = self.__request(count=0, out_type="JSON")
+
+        out_fields = "*"
+        columns = _get_columns(columns, self.date_field)
+        if columns is not None:
+            # Fields not in the dataset are ignored. the_geom contains the geometry of GeoJSON features
+            match = _column_matcher(columns)
+            out_fields = ", ".join([x for x in type_info["fields"].keys() if match(x) or x=="the_geom"])
+
+        if _use_gpd_force is not None:
+            use_gpd = _use_gpd_force
+        else:
+            use_gpd = _has_gpd
             
-        features = []
+        # Records are added to columns as each page is received
+        pages = ColumnarPages(keep_geometry=not use_gpd)
         for batch in range(num_batches):
             bs = batch_size if batch<num_batches-1 else nrows-batch*batch_size
 
             try:
-                data = self.__request(where=where_query, offset=offset+batch*batch_size, count=bs)
-                features.extend(data["features"])
+                data = self.__request(where=where_query, offset=offset+batch*batch_size, count=bs, out_fields=out_fields)
+                pages.add_records([x["properties"] for x in data["features"]], geometry=[x.get("geometry") for x in data["features"]])
 
-                if batch==0 and len(features)>0:
+                if batch==0 and len(pages)>0:
                     date_cols = [key for key, x in type_info["fields"].items() if x["type"]=='date']
                     if len(data["features"]) not in [batch_size, nrows]:
                         num_rows = len(data["features"])
@@ -289,7 +414,11 @@ class Carto(Data_Loader):
         if pbar:
             bar.close()
 
-        df = pd.DataFrame.from_records([x["properties"] for x in features])
+        df = pages.to_frame()
+        x, y, has_geometry = pages.get_coordinates()
+        geometry = pages.get_geometry()
+        del pages
+
         if format_date:
             for col in date_cols:
                 if col in df:
@@ -297,28 +426,17 @@ class Carto(Data_Loader):
                     df[col] = to_datetime(df[col])
 
         if len(df) > 0:
-            has_point_geometry = any("geometry" in x and x["geometry"]!=None for x in features)
+            has_point_geometry = has_geometry.any()
             if has_point_geometry:
-                if _use_gpd_force is not None:
-                    if not _has_gpd and _use_gpd_force:
-                        raise ValueError("User cannot force GeoPandas usage when it is not installed")
-                    use_gpd = _use_gpd_force
-                else:
-                    use_gpd = _has_gpd
+                if _use_gpd_force and not _has_gpd:
+                    raise ValueError("User cannot force GeoPandas usage when it is not installed")
 
                 if use_gpd:
-                    geometry = []
-                    for feat in features:
-                        if "geometry" not in feat or feat["geometry"]==None or len(feat["geometry"]["coordinates"])<2:
-                            geometry.append(None)
-                        else:
-                            geometry.append(Point(feat["geometry"]["coordinates"][0], feat["geometry"]["coordinates"][1]))
+                    geometry = _build_point_geometry(x, y, has_geometry)
 
                     logger.debug("Geometry found. Contructing geopandas GeoDataFrame")
                     df = gpd.GeoDataFrame(df, crs=4326, geometry=geometry)
                 else:
-                    geometry = [feat["geometry"] if "geometry" in feat else None for feat in features]
-
                     if "geolocation" not in df:
                         logger.debug("Adding geometry column generated from spatial data provided by request.")
                         df["geolocation"] = geometry
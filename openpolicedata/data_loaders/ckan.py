@@ -5,7 +5,8 @@ import re
 import requests
 from tqdm import tqdm
 
-from .data_loader import Data_Loader, _url_error_msg, str2json, _process_date, _clean_date_input, _filter_inaccurate_date_query
+from .data_loader import Data_Loader, _url_error_msg, str2json, http_get, _process_date, _clean_date_input, _filter_inaccurate_date_query, \
+    _check_aggregate_input, _format_aggregate, _get_columns, _column_matcher, _append_filter, _ServerAggregateUnsupported
 from ..datetime_parser import to_datetime
 from ..exceptions import OPD_DataUnavailableError, OPD_TooManyRequestsError
 from .. import log
@@ -29,7 +30,7 @@ class Ckan(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True)
+    load(date=None, nrows=None, offset=0, pbar=True, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, where=None)
         Get number of records/rows generated by query
@@ -81,7 +82,7 @@ class Ckan(Data_Loader):
         return f'{self.url}?sql=SELECT * FROM "{self.data_set}"'
 
 
-    def get_count(self, date=None, opt_filter=None, **kwargs):
+    def get_count(self, date=None, opt_filter=None, filter_expr=None, **kwargs):
         '''Get number of records for a data request
         
         Parameters
@@ -90,6 +91,8 @@ class Ckan(Data_Loader):
             (Optional) Define timespan of data to request count for:
                 1. Request data for an entire year by inputting the year (i.e. 2023)
                 2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -98,6 +101,7 @@ class Ckan(Data_Loader):
         '''
 
         date = _clean_date_input(date)
+        opt_filter = _append_filter(opt_filter, filter_expr, 'ckan')
 
         if self._last_count is not None and self._last_count[0]==date and self._last_count[1]==opt_filter:
             logger.debug("Request matches previous count request. Returning saved count.")
@@ -122,7 +126,7 @@ class Ckan(Data_Loader):
         return count
 
 
-    def __request(self, where=None, return_count=False, out_fields="*", out_type="json", offset=0, count=None, orderby="_id"):
+    def __request(self, where=None, return_count=False, out_fields="*", out_type="json", offset=0, count=None, orderby="_id", group_by=None):
 
         if isinstance(out_fields, list):
             out_fields = '"' + '", "'.join(out_fields) + '"'
@@ -157,7 +161,9 @@ class Ckan(Data_Loader):
             else:
                 query+=" WHERE"+ default_where[4:]
 
-        if not return_count and count!=0 and not out_fields.startswith("DISTINCT"):
+        if group_by is not None:
+            query+=f" GROUP BY {group_by}"
+        elif not return_count and count!=0 and not out_fields.startswith("DISTINCT"):
             # Order results to ensure data order remains constant if paging
             query+=' ORDER BY "'+ orderby + '"'
 
@@ -173,7 +179,7 @@ class Ckan(Data_Loader):
             logger.debug(f"\t{k} = {v}")
 
         try:
-            r = requests.get(self.url, params=params)
+            r = http_get(self.url, params=params)
         except requests.exceptions.SSLError as e:
             raise OPD_DataUnavailableError(self.url, e.args, _url_error_msg.format(self.get_api_url()))
 
@@ -192,42 +198,154 @@ class Ckan(Data_Loader):
         return r.json()
 
 
+    def __get_date_info(self, sample_data=None):
+        # Returns the CKAN type of the date field, whether the date field can only be filtered by year (text),
+        # and the datetime format of text dates that can be compared to date strings
+        datetime_format = None
+        if not sample_data:
+            sample_data = self.__request(count=100)
+        
+        date_col_info = [x for x in sample_data['result']["fields"] if x["id"]==self.date_field]
+        if len(date_col_info)==0:
+            raise ValueError(f"Date column {self.date_field} not found")
+        filter_year = date_col_info[0]["type"] not in ['timestamp','date']
+        if filter_year and date_col_info[0]["type"] == 'text':
+            # See if year can be filtered by YYYY-MM-DD 
+            dates = [x[self.date_field] for x in sample_data['result']['records']]
+            p = re.compile(r'^20\d{2}\-\d{2}\-\d{2}')
+            if all([p.search(x) for x in dates]):
+                filter_year = False
+                # Identify time format
+                times = [p.sub('', x) for x in dates]
+                if len(times[0])>0:
+                    if times[0][0]==' ':
+                        times = [x[1:] for x in times]
+                    else:
+                        raise ValueError(f"Dates in {self.date_field} are text (not date) values and have unknown format (i.e. {dates[0]})")
+                    
+                    if all([re.search(r'^\d{2}:\d{2}:\d{2}$',x) for x in times]):
+                        datetime_format = r'%Y-%m-%d %H:%M:%S'
+                    elif all(m:=[re.search(r'^\d{2}:\d{2}:\d{2}\+(\d{2})$',x) for x in times]):
+                        utc_offsets = [x.groups(1)[0] for x in m]
+                        if all([x==utc_offsets[0] for x in utc_offsets]):
+                            datetime_format = r'%Y-%m-%d %H:%M:%S+' + utc_offsets[0]
+                        else:
+                            raise ValueError(f"Dates in {self.date_field} are text (not date) values and have varying UTC offset")
+                    else:
+                        raise ValueError(f"Dates in {self.date_field} are text (not date) values and have unknown format (i.e. {dates[0]})")
+
+        return date_col_info[0]["type"], filter_year, datetime_format
+
+
+    def __get_date_part_expr(self, date_part):
+        # SQL expression for the year or month of the date field.
+        # Same type detection used for date filtering in __construct_where
+        date_type, filter_year, _ = self.__get_date_info()
+        if not filter_year:
+            if date_type in ['timestamp','date']:
+                return f'EXTRACT({date_part.upper()} FROM "{self.date_field}")'
+            elif date_part=='year':
+                # Text that starts with YYYY-MM-DD
+                return f'LEFT("{self.date_field}", 4)'
+            else:
+                return f'SUBSTRING("{self.date_field}", 6, 2)'
+        elif date_part=='year':
+            if date_type=='text':
+                # Years are found by LIKE '%YYYY%' when filtering text dates. Use the first year-like number in the text
+                return f"""SUBSTRING("{self.date_field}" FROM '(?:19|20)[0-9]{{2}}')"""
+            elif 'year' in self.date_field.lower():
+                return f'"{self.date_field}"'
+            
+        raise _ServerAggregateUnsupported(f"Unable to get the {date_part} from field of type {date_type}")
+
+
+    def get_years(self, *, check=None, **kwargs):
+        '''Get years contained in data set
+        
+        Parameters
+        ----------
+        check : list
+            (Optional) If set, only years in check will be returned
+            
+        Returns
+        -------
+        list
+            list containing years in data set
+        '''
+
+        if self.date_field==None:
+            raise ValueError("A date field is required to get years")
+        
+        if check is not None and len(check)==0:
+            return []
+        
+        try:
+            year_expr = self.__get_date_part_expr('year')
+            # Count records in each year with a single request
+            json = self.__request(out_fields=f'{year_expr} AS "year", COUNT(*) AS "count"', group_by="1")
+            years = [int(float(x["year"])) for x in json['result']['records'] if pd.notnull(x["year"]) and int(x["count"])>0]
+        except (NotImplementedError, OPD_DataUnavailableError, requests.HTTPError) as e:
+            logger.debug(f"Unable to get years with a single request ({e}). Checking years individually.")
+            return super().get_years(check=check, **kwargs)
+
+        years.sort(reverse=True)
+        if check is not None:
+            years = [x for x in years if x in check]
+
+        return years
+
+
+    def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, opt_filter=None, filter_expr=None, **kwargs):
+        '''Count records in each group with a SQL GROUP BY query
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to aggregate
+        group_by : str or list
+            (Optional) Field(s) to group by
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : str
+            (Optional) 'year' or 'month'. If set, results are also grouped by the year or month of the date field
+        opt_filter : str
+            (Optional) Additional filter to apply to the where query
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
+            
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the group_by fields, the date_part column (if requested) and the count
+        '''
+
+        group_by = _check_aggregate_input(group_by, agg, date_part, self.date_field)
+        date = _clean_date_input(date)
+        opt_filter = _append_filter(opt_filter, filter_expr, 'ckan')
+        where = self.__construct_where(date, opt_filter)
+        if not self.__accurate_count:
+            raise _ServerAggregateUnsupported(f"Date field {self.date_field} cannot be filtered exactly by {date} on the server")
+
+        if len(group_by)==0 and not date_part:
+            json = self.__request(where=where, return_count=True)
+            return pd.DataFrame({'count':[json['result']['records'][0]['count']]})
+
+        out_fields = [f'"{x}"' for x in group_by]
+        if date_part:
+            out_fields.append(f'{self.__get_date_part_expr(date_part)} AS "{date_part}"')
+        group_by_cols = ", ".join(str(k+1) for k in range(len(out_fields)))
+        out_fields.append('COUNT(*) AS "count"')
+
+        json = self.__request(where=where, out_fields=", ".join(out_fields), group_by=group_by_cols)
+        df = pd.DataFrame.from_records(json['result']['records'], columns=group_by+([date_part] if date_part else [])+["count"])
+        return _format_aggregate(df, group_by, date_part)
+
+
     def __construct_where(self, date=None, opt_filter=None, filter_year=False, sample_data=None):
         self.__accurate_count = True
 
         if self.date_field!=None and date!=None:
-            datetime_format = None
-            if not sample_data:
-                sample_data = self.__request(count=100)
-            
-            date_col_info = [x for x in sample_data['result']["fields"] if x["id"]==self.date_field]
-            if len(date_col_info)==0:
-                raise ValueError(f"Date column {self.date_field} not found")
-            filter_year = date_col_info[0]["type"] not in ['timestamp','date']
-            if filter_year and date_col_info[0]["type"] == 'text':
-                # See if year can be filtered by YYYY-MM-DD 
-                dates = [x[self.date_field] for x in sample_data['result']['records']]
-                p = re.compile(r'^20\d{2}\-\d{2}\-\d{2}')
-                if all([p.search(x) for x in dates]):
-                    filter_year = False
-                    # Identify time format
-                    times = [p.sub('', x) for x in dates]
-                    if len(times[0])>0:
-                        if times[0][0]==' ':
-                            times = [x[1:] for x in times]
-                        else:
-                            raise ValueError(f"Dates in {self.date_field} are text (not date) values and have unknown format (i.e. {dates[0]})")
-                        
-                        if all([re.search(r'^\d{2}:\d{2}:\d{2}$',x) for x in times]):
-                            datetime_format = r'%Y-%m-%d %H:%M:%S'
-                        elif all(m:=[re.search(r'^\d{2}:\d{2}:\d{2}\+(\d{2})$',x) for x in times]):
-                            utc_offsets = [x.groups(1)[0] for x in m]
-                            if all([x==utc_offsets[0] for x in utc_offsets]):
-                                datetime_format = r'%Y-%m-%d %H:%M:%S+' + utc_offsets[0]
-                            else:
-                                raise ValueError(f"Dates in {self.date_field} are text (not date) values and have varying UTC offset")
-                        else:
-                            raise ValueError(f"Dates in {self.date_field} are text (not date) values and have unknown format (i.e. {dates[0]})")
+            _, filter_year, datetime_format = self.__get_date_info(sample_data)
 
             if filter_year:
                 start_date, stop_date = _process_date(date)
@@ -260,7 +378,7 @@ class Ckan(Data_Loader):
 
     
     def load(self, date=None, nrows=None, offset=0, *, pbar=True, opt_filter=None, select=None, output_type=None, sortby='_id', 
-             format_date=True, **kwargs):
+             format_date=True, columns=None, filter_expr=None, **kwargs):
         '''Download table to pandas or geopandas DataFrame
         
         Parameters
@@ -286,6 +404,10 @@ class Ckan(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Fields to request. The date field is always included. Ignored if select is set. By default None (all fields)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -294,6 +416,7 @@ class Ckan(Data_Loader):
         '''
 
         date = _clean_date_input(date)
+        opt_filter = _append_filter(opt_filter, filter_expr, 'ckan')
 
         data = self.__request(count=100)
         date_cols = [x['id'] for x in data['result']["fields"] if x["type"] in ['timestamp','date']]
@@ -334,6 +457,11 @@ class Ckan(Data_Loader):
             # Get info on columns in order to exclude these columns from the returned data
             
             fields = [x['id'] for x in data['result']['fields'] if x['id'] not in ['_id','_full_text']]
+            columns = _get_columns(columns, self.date_field)
+            if columns is not None:
+                # Fields not in the dataset are ignored
+                match = _column_matcher(columns)
+                fields = [x for x in fields if match(x)]
 
         if sortby=="date":
             if self.date_field:
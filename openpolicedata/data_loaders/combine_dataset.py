@@ -4,7 +4,7 @@ from time import sleep
 import warnings
 
 from .csv_class import Csv
-from .data_loader import Data_Loader
+from .data_loader import Data_Loader, _get_columns, _select_columns
 
 class CombinedDataset(Data_Loader):
     """
@@ -48,6 +48,8 @@ class CombinedDataset(Data_Loader):
         self.datasets = datasets
         
         self.loaders = []
+        # Arguments for creating a Csv loader for loaders whose file may be a CSV file instead of an Excel file
+        self.__csv_args = {}
         url = url[:-1] if url[-1]=='/' else url
         iter = tqdm(datasets, desc='Building Data Loaders', leave=False) if pbar else datasets
         for ds in iter:
@@ -64,21 +66,30 @@ class CombinedDataset(Data_Loader):
                 ds = ds.copy()
                 cur_url = url + '/' + ds.pop('url') if 'url' in ds else url
                 loc_kwargs['data_set'] = ds
-                try:
-                    self.loaders.append(data_class(cur_url, *args, **loc_kwargs))
-                except ValueError as e:
-                    if str(e)=='Excel file format cannot be determined, you must specify an engine manually.':
-                        try:
-                            # This may be a CSV file instead of an Excel file
-                            self.loaders.append(Csv(cur_url, *args, **loc_kwargs))
-                        except:
-                            raise e
+                if data_class!=Csv:
+                    self.__csv_args[len(self.loaders)] = (cur_url, args, loc_kwargs)
+                self.loaders.append(data_class(cur_url, *args, **loc_kwargs))
                         
                 if ds!=datasets[-1]:
                     sleep(0.5)  # Reduce likelihood of timeout due to repeated requests
 
 
 
+    def __run(self, k, method, *args, **kwargs):
+        try:
+            return getattr(self.loaders[k], method)(*args, **kwargs)
+        except ValueError as e:
+            if k in self.__csv_args and str(e)=='Excel file format cannot be determined, you must specify an engine manually.':
+                # Excel files are not opened until they are used. This may be a CSV file instead of an Excel file
+                url, csv_args, csv_kwargs = self.__csv_args.pop(k)
+                try:
+                    self.loaders[k] = Csv(url, *csv_args, **csv_kwargs)
+                except:
+                    raise e
+                return getattr(self.loaders[k], method)(*args, **kwargs)
+            raise
+
+
     def isfile(self):
         '''Returns True to indicate that Csv data is file-based
 
@@ -100,15 +111,18 @@ class CombinedDataset(Data_Loader):
         first_time = True
         if '_first_time' in kwargs:
             kwargs.pop('_first_time')
+        # Columns are selected after combining because column names may change between files
+        columns = kwargs.pop('columns', None)
         iter = tqdm(self.loaders, desc='Loading data files', leave=False) if pbar else self.loaders
         for k, loader in enumerate(iter):
             if isinstance(self.datasets[k],list):
                 # Tables in dfs will be merged
                 on.append(self.datasets[k][0]['on'])
 
-            dfs.append(loader.load(date=date, _first_time=first_time, **kwargs))
+            dfs.append(self.__run(k, 'load', date=date, _first_time=first_time, **kwargs))
+            loader = self.loaders[k]
             first_time = False
-            if loader!=self.loaders[-1]:
+            if k<len(self.loaders)-1:
                 sleep(0.5)  # Reduce likelihood of timeout due to repeated requests
 
             if 'www.albemarle.org' in loader.url:
@@ -137,6 +151,9 @@ class CombinedDataset(Data_Loader):
             for k in range(1,len(dfs)):
                 df = df.merge(dfs[k], how='outer', left_on=on[0], right_on=on[k])
 
+        columns = _get_columns(columns, getattr(self.loaders[0], 'date_field', None), getattr(self.loaders[0], 'agency_field', None))
+        df = _select_columns(df, columns)
+
         if offset!=None:
             df = df.iloc[offset:]
         if nrows!=None:
@@ -152,8 +169,8 @@ class CombinedDataset(Data_Loader):
 
         count = 0
         first_time = True
-        for loader in self.loaders:
-            count+=loader.get_count(*args, _first_time=first_time, **kwargs)
+        for k in range(len(self.loaders)):
+            count+=self.__run(k, 'get_count', *args, _first_time=first_time, **kwargs)
             first_time = False
 
         return count
@@ -166,8 +183,8 @@ class CombinedDataset(Data_Loader):
         """
 
         years = []
-        for loader in self.loaders:
-            years.extend(loader.get_years(*args, **kwargs))
+        for k in range(len(self.loaders)):
+            years.extend(self.__run(k, 'get_years', *args, **kwargs))
 
         return years
 
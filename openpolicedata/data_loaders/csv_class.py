@@ -1,6 +1,8 @@
-from io import BytesIO
+from contextlib import nullcontext
 import logging
 import pandas as pd
+import pyarrow
+import pyarrow.csv
 import re
 import requests
 from tqdm import tqdm
@@ -8,7 +10,9 @@ import urllib
 import warnings
 from zipfile import ZipFile
 
-from .data_loader import Data_Loader, str2json, download_zip_and_extract, _url_error_msg, get_legacy_session, _filter_dataframe, _clean_date_input
+from .data_loader import Data_Loader, str2json, get_block_cache_dir, open_zip, get_single_file_in_zip, spool_file, _url_error_msg, get_legacy_session, get_session, http_get, http_head, \
+    download_file, get_cached_file, get_download_info, _filter_dataframe, _clean_date_input, _get_columns, _column_matcher, \
+    _csv_engines, _excel_engines
 from ..datetime_parser import to_datetime
 from ..exceptions import OPD_DataUnavailableError
 from .. import httpio, log
@@ -17,13 +21,17 @@ logger = log.get_logger()
 
 # https://stackoverflow.com/questions/73093656/progress-in-bytes-when-reading-csv-from-url-with-pandas
 class TqdmReader:
+    '''File-like reader of a streamed response that shows download progress. Data is received in blocks
+    of block_size bytes and read returns up to n bytes so that parsers can read large blocks at a time.
+    If nrows is set, reading stops after nrows lines (including the header).
+    '''
     # Older versions of pandas check if reader has these properties even though they are not used
     write = []
     __iter__ = []
-    def __init__(self, resp, pbar=True, nrows=None):
+    def __init__(self, resp, pbar=True, nrows=None, block_size=2**16):
         total_size = int(resp.headers.get("Content-Length", 0))
 
-        self.rows_read = 0
+        self.lines_read = 0
         if nrows != None:
             self.nrows = nrows
         else:
@@ -40,53 +48,111 @@ class TqdmReader:
                 leave=False
             )
 
-        self.reader = self.read_from_stream()
+        self.blocks = resp.iter_content(chunk_size=block_size)
+        self.buffer = bytearray()
+        self.done = False
 
-    def read_from_stream(self):
-        for line in self.resp.iter_lines():
-            line += b"\n"
-            if self.pbar:
-                self.bar.update(len(line))
-            yield line
-
-    def read(self, n=0):
+    def __read_block(self):
         try:
-            if self.rows_read >= self.nrows:
-                # Number of rows read is greater than user-requested limit
-                return ""
-            self.rows_read += 1
-            return next(self.reader)
+            block = next(self.blocks)
         except StopIteration:
+            self.done = True
             if self.pbar:
                 self.bar.update(self.bar.total - self.bar.n)
-            return ""
+            return
+        
+        if self.pbar:
+            self.bar.update(len(block))
+
+        if self.nrows != float("inf"):
+            num_lines = block.count(b"\n")
+            if self.lines_read + num_lines >= self.nrows:
+                # Keep data up to the end of line nrows. Remaining data is not needed.
+                end = len(block)
+                for _ in range(self.lines_read + num_lines - self.nrows + 1):
+                    end = block.rfind(b"\n", 0, end)
+                block = block[:end+1]
+                self.done = True
+                if self.pbar:
+                    self.bar.close()
+            self.lines_read += num_lines
+
+        self.buffer += block
+
+    def read(self, n=-1):
+        while not self.done and (n is None or n<0 or len(self.buffer) < n):
+            self.__read_block()
+
+        if n is None or n<0 or n>=len(self.buffer):
+            data = bytes(self.buffer)
+            self.buffer.clear()
+        else:
+            data = bytes(self.buffer[:n])
+            del self.buffer[:n]
+        return data
 
-def read_zipped_csv(url, pbar=True, block_size=2**20, data_set=None):
+def read_zipped_csv(url, pbar=True, block_size=2**20, data_set=None, usecols=None, nrows=None):
 
     if data_set:
         logging.debug('Load CSV from zip using httpio method')
-        # Load only requested dataset to minimize download size
-        with httpio.open(url, block_size=block_size) as fp:
-            with ZipFile(fp, 'r') as z:
-                return pd.read_csv(BytesIO(z.read(data_set['file'])), encoding_errors='surrogateescape')
+        # Load only requested dataset to minimize download size. The member is decompressed sequentially
+        # so the next blocks are requested while the current ones are parsed.
+        with httpio.open(url, block_size=block_size, session=get_session(url), read_ahead=4,
+                         cache_dir=get_block_cache_dir()) as fp:
+            with ZipFile(fp, 'r') as z, z.open(data_set['file']) as f:
+                return pd.read_csv(f, encoding_errors='surrogateescape', usecols=usecols, nrows=nrows)
     else:
         logging.debug('Load CSV from zip by downloading and converting to pandas DataFrame')
 
-        zip_data = download_zip_and_extract(url, block_size, pbar)
-        zip_bytes_io = BytesIO(zip_data)
-        logger.debug('Converting BytesIO to DataFrame')
-        unicode_error = None
-        for encoding_errors in ['surrogateescape', 'ignore']:
-            try:
-                return pd.read_csv(zip_bytes_io, encoding_errors=encoding_errors)
-            except UnicodeEncodeError as e:
-                if unicode_error:
-                    raise unicode_error
-                unicode_error = e
-                zip_bytes_io.seek(0)
-                continue
+        with open_zip(url, block_size, pbar) as z:
+            file = get_single_file_in_zip(z, url)
+            logger.debug('Reading CSV from zip file')
+            unicode_error = None
+            for encoding_errors in ['surrogateescape', 'ignore']:
+                # File is decompressed as it is parsed
+                with z.open(file) as f:
+                    try:
+                        return pd.read_csv(f, encoding_errors=encoding_errors, usecols=usecols, nrows=nrows)
+                    except UnicodeEncodeError as e:
+                        if unicode_error:
+                            raise unicode_error
+                        unicode_error = e
+                        continue
   
 
+def _read_csv_pyarrow(filename, usecols=None):
+    # Reads CSV file with pyarrow's multithreaded parser. Raises an error if the file cannot be read the same way as by pandas.
+    read_options = pyarrow.csv.ReadOptions(use_threads=True, block_size=2**24)
+    # Types are inferred from the first block
+    with pyarrow.csv.open_csv(filename, read_options=read_options) as reader:
+        schema = reader.schema
+
+    names = schema.names
+    if len(set(names))!=len(names) or any(len(x.strip())==0 for x in names):
+        # pandas renames duplicate and empty column names
+        raise ValueError("CSV file has duplicate or empty column names")
+    
+    # Dates are kept as text to match pandas
+    column_types = {f.name:pyarrow.string() for f in schema if pyarrow.types.is_temporal(f.type)}
+    include_columns = [x for x in names if usecols(x)] if usecols else None
+    convert_options = pyarrow.csv.ConvertOptions(column_types=column_types, include_columns=include_columns, strings_can_be_null=True)
+    table = pyarrow.csv.read_csv(filename, read_options=read_options, convert_options=convert_options)
+
+    df = table.to_pandas()
+    for f in table.schema:
+        if pyarrow.types.is_binary(f.type):
+            # Text that is not valid UTF-8. Decode with the same encoding error handlers as when reading with pandas
+            for encoding_errors in ['surrogateescape', 'ignore']:
+                try:
+                    df[f.name] = pd.Series([x.decode('utf-8', errors=encoding_errors) if isinstance(x, bytes) else x for x in df[f.name]], 
+                                           index=df.index)
+                    break
+                except UnicodeEncodeError:
+                    continue
+    
+    return df
+
+
 def count_csv_rows(chunk_iter):
     if isinstance(chunk_iter, bytes):
         # Convert to iterator
@@ -142,7 +208,7 @@ class Csv(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True, agency=None)
+    load(date=None, nrows=None, offset=0, pbar=True, agency=None, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, agency=None, force=False)
         Get number of records/rows generated by query
@@ -184,7 +250,7 @@ class Csv(Data_Loader):
         return True
 
 
-    def get_count(self, date=None, *,  agency=None, force=False, **kwargs):
+    def get_count(self, date=None, *,  agency=None, force=False, filter_expr=None, **kwargs):
         '''Get number of records for a Csv data request
         
         Parameters
@@ -197,6 +263,8 @@ class Csv(Data_Loader):
             (Optional) Name of agency to filter for.
         force : bool
             (Optional) get_count for CSV file will only run if force=true. In many use cases, it will be more efficient to load the file and manually get the count.
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data
             
         Returns
         -------
@@ -205,25 +273,31 @@ class Csv(Data_Loader):
         '''
 
         logger.debug(f"Calculating row count for {self.url}")
-        if self._last_count is not None and self._last_count[0] == (self.url, date, agency):
+        filter_key = repr(filter_expr)
+        if self._last_count is not None and self._last_count[0] == (self.url, date, agency, filter_key):
             logger.debug("Request matches previous count request. Returning saved count.")
             return self._last_count[1]
-        if ".zip" not in self.url and date==None and agency==None and not self.query:
+        if ".zip" not in self.url and date==None and agency==None and not self.query and filter_expr is None:
             logger.debug(f"Loading file to count rows from {self.url}")
-            with requests.get(self.url, stream=True) as r:
-                count = count_csv_rows(r.iter_content(chunk_size=2**16))
+            filename, use_legacy, headers = self.__download(pbar=False)
+            if filename:
+                with open(filename, 'rb') as f:
+                    count = count_csv_rows(iter(lambda: f.read(2**16), b''))
+            else:
+                with self.__get(use_legacy, headers) as r:
+                    count = count_csv_rows(r.iter_content(chunk_size=2**16))
         elif force:
-            count = len(self.load(date=date, agency=agency))
+            count = len(self.load(date=date, agency=agency, filter_expr=filter_expr))
         else:
             raise ValueError("Extracting the number of records for a date range of a CSV file requires reading the whole file in. In most cases, "+
                 "running load() with a date argument to load in the data and manually finding the record count will be more "
                 "efficient. If running get_count with a date argument is still desired, set force=True")
         
-        self._last_count = ((self.url, date, agency), count)
+        self._last_count = ((self.url, date, agency, filter_key), count)
         return count
 
 
-    def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, format_date=True, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, format_date=True, columns=None, filter_expr=None, engine=None, **kwargs):
         '''Download CSV file to pandas DataFrame
         
         Parameters
@@ -243,6 +317,15 @@ class Csv(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Columns to read. The date and agency fields are always included. By default None (all columns)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data. Columns used in the filter are always read.
+        engine : str
+            (Optional) CSV parser to use: 'c' (pandas C parser) or 'pyarrow'. The pyarrow parser reads the file 
+            with multiple threads after it is downloaded. If pyarrow is unable to read the file or only the first 
+            rows are requested, the pandas C parser is used. Zipped files are always read with the pandas C parser. Excel engines
+            ('calamine' and 'openpyxl') are ignored. Default 'c'
             
         Returns
         -------
@@ -250,17 +333,28 @@ class Csv(Data_Loader):
             DataFrame containing table imported from CSV
         '''
 
+        if engine in _excel_engines:
+            logger.debug(f"Ignoring Excel engine {engine} for CSV file")
+            engine = None
+        elif engine not in [None, *_csv_engines]:
+            raise ValueError(f"Unknown CSV engine {engine}. Engine must be 'c' or 'pyarrow'")
+
         date = _clean_date_input(date)
 
         if isinstance(nrows, float):
             nrows = int(nrows)
+
+        columns = _get_columns(columns, self.date_field, self.agency_field, *self.query.keys(), 
+                               *(sorted(filter_expr.columns()) if filter_expr is not None else []))
+        usecols = _column_matcher(columns) if columns is not None else None
         
+        nrows_read = offset+nrows if nrows is not None and not self.query and filter_expr is None else None
         logger.debug(f"Loading file from {self.url}")
         if ".zip" in self.url:
             with warnings.catch_warnings():
                 warnings.simplefilter("ignore", category=pd.errors.DtypeWarning)
                 try:
-                    table = read_zipped_csv(self.url, pbar=pbar, data_set=self.data_set)
+                    table = read_zipped_csv(self.url, pbar=pbar, data_set=self.data_set, usecols=usecols, nrows=nrows_read)
                     logger.debug("Completed reading CSV from zip file")
                 except requests.exceptions.HTTPError as e:
                     if len(e.args) and 'Forbidden' in e.args[0]:
@@ -278,7 +372,7 @@ class Csv(Data_Loader):
                             'Sec-Fetch-User': '?1',
                         }
                         try:
-                            table = pd.read_csv(self.url, encoding_errors='surrogateescape', storage_options=headers)
+                            table = pd.read_csv(self.url, encoding_errors='surrogateescape', storage_options=headers, usecols=usecols)
                         except urllib.error.HTTPError as e:
                             raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
                         except:
@@ -288,106 +382,268 @@ class Csv(Data_Loader):
                 except Exception as e:
                     raise e
         else:
-            use_legacy = False
-            headers = None
-            try:
-                r = requests.head(self.url)
-            except requests.exceptions.SSLError as e:
-                if "[SSL: UNSAFE_LEGACY_RENEGOTIATION_DISABLED] unsafe legacy renegotiation disabled" in str(e.args[0]) or \
-                    "[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed: unable to get local issuer certificate" in str(e.args[0]):
-                    use_legacy = True
-                elif 'Max retries exceeded' in str(e):
-                    raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
-                else:
-                    raise e
-            except requests.ConnectionError as e:
-                if 'Max retries exceeded' in str(e):
-                    raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
-                else:
-                    raise e
-            except Exception as e:
-                raise
-                
-            if not use_legacy:
-                if r.status_code in [400,404]:
-                    # Try get instead
-                    r = requests.get(self.url)
-                try:
-                    r.raise_for_status()
-                    r.close()
-                except requests.exceptions.HTTPError as e:
+            if engine=='pyarrow' and nrows_read is None:
+                filename, use_legacy, headers = self.__download(pbar)
+                # pyarrow reads from a local file
+                with nullcontext(filename) if filename else spool_file(self.url, pbar, headers, use_legacy) as filename:
                     try:
-                        headers = {
-                            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0',
-                            'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-                            'Accept-Language': 'en-US,en;q=0.5',
-                            # 'Accept-Encoding': 'gzip, deflate, br',
-                            'DNT': '1',
-                            'Connection': 'keep-alive',
-                            'Upgrade-Insecure-Requests': '1',
-                            'Sec-Fetch-Dest': 'document',
-                            'Sec-Fetch-Mode': 'navigate',
-                            'Sec-Fetch-Site': 'none',
-                            'Sec-Fetch-User': '?1',
-                        }
-                        r = requests.get(self.url, headers=headers)
-                        r.raise_for_status()
-                        r.close()
-                    except:
-                        raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
-                except Exception as e:
-                    raise e
+                        table = _read_csv_pyarrow(filename, usecols)
+                    except (pyarrow.lib.ArrowException, ValueError) as e:
+                        logger.debug(f"Unable to read {self.url} with pyarrow: {e}. Reading with the pandas C parser instead.")
+                        table = self.__read_csv(filename, use_legacy, headers, pbar, nrows_read, usecols)
+            else:
+                filename, use_legacy, headers = self.__download(pbar, nrows_read)
+                table = self.__read_csv(filename, use_legacy, headers, pbar, nrows_read, usecols)
+                
+        table = self.__filter(table, date, agency, format_date, columns, filter_expr)
+
+        if offset>0:
+            rows_limit = offset+nrows if nrows is not None and offset+nrows<len(table) else len(table)
+            logger.debug(f"Extracting {rows_limit} rows starting at {offset}")
+            table = table.iloc[offset:rows_limit].reset_index(drop=True)
+        if nrows is not None and len(table)>nrows:
+            logger.debug(f"Extracting the first {nrows} rows")
+            table = table.head(nrows)
+
+        return table
+
+
+    def load_iter(self, date=None, nbatch=10000, offset=0, *, pbar=True, agency=None, format_date=True, columns=None, filter_expr=None, **kwargs):
+        '''Generator that loads CSV file in batches. The file is downloaded and parsed once.
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to request:
+                1. Request data for an entire year by inputting the year (i.e. 2023)
+                2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
+        nbatch : int
+            (Optional) Number of records in each batch. Default 10000
+        offset - int
+            (Optional) Number of records to offset from first record. Default is 0 to return records starting from the first.
+        pbar : bool
+            (Optional) If true (default), a progress bar will be displayed
+        agency : str
+            (Optional) Name of the agency to filter for. None value returns data for all agencies.
+        format_date : bool, optional
+            If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
+            to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Columns to read. The date and agency fields are always included. By default None (all columns)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data. Columns used in the filter are always read.
             
-            def get(url, use_legacy, headers=None):
-                if use_legacy:
-                    return get_legacy_session().get(url, params=None, stream=True, headers=headers)
-                else:
-                    return requests.get(url, params=None, stream=True, headers=headers)
+        Yields
+        ------
+        pandas DataFrame
+            DataFrame containing the next nbatch records
+        '''
 
-            header = 'infer'
-            unicode_error = None
-            nrows_read = offset+nrows if nrows is not None and not self.query else None
-            for encoding_errors in ['surrogateescape', 'ignore']:
-                with get(self.url, use_legacy, headers) as resp:
-                    try:
-                        with warnings.catch_warnings():
-                            warnings.filterwarnings("ignore", message=r"Columns \(.+\) have mixed types", category=pd.errors.DtypeWarning)
-                            table = pd.read_csv(TqdmReader(resp, pbar=pbar), nrows=nrows_read, 
-                                encoding_errors=encoding_errors, 
-                                header=header)
-                    except UnicodeEncodeError as e:
-                        if unicode_error:
-                            raise unicode_error
-                        unicode_error = e
+        if ".zip" in self.url:
+            # Zipped files are read all at once
+            yield from super().load_iter(date, nbatch, offset, pbar=pbar, agency=agency, format_date=format_date, 
+                                         columns=columns, filter_expr=filter_expr)
+            return
+
+        date = _clean_date_input(date)
+        columns = _get_columns(columns, self.date_field, self.agency_field, *self.query.keys(), 
+                               *(sorted(filter_expr.columns()) if filter_expr is not None else []))
+        usecols = _column_matcher(columns) if columns is not None else None
+
+        filename, use_legacy, headers = self.__download(pbar)
+
+        logger.debug(f"Loading file from {self.url} in batches of {nbatch} rows")
+        batches = []
+        num_batched = 0
+        num_read = 0
+        unicode_error = None
+        for encoding_errors in ['surrogateescape', 'ignore']:
+            try:
+                # If reading is repeated, rows that were already processed are skipped
+                for table in self.__read_chunks(filename, use_legacy, headers, pbar, nbatch, usecols, encoding_errors, num_read):
+                    num_read+=len(table)
+                    table = self.__filter(table, date, agency, format_date, columns, filter_expr)
+                    if offset>0:
+                        num_skip = min(offset, len(table))
+                        table = table.iloc[num_skip:]
+                        offset-=num_skip
+                    if len(table)==0:
                         continue
-                    except (urllib.error.HTTPError, pd.errors.ParserError) as e:
-                        raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
-                    except Exception as e:
-                        raise e
-                    
-                break
-                
+
+                    batches.append(table)
+                    num_batched+=len(table)
+                    # Filtering reduces the size of chunks. Combine chunks into batches of nbatch records
+                    while num_batched>=nbatch:
+                        table = pd.concat(batches, ignore_index=True) if len(batches)>1 else batches[0].reset_index(drop=True)
+                        yield table.iloc[:nbatch].reset_index(drop=True)
+                        batches = [table.iloc[nbatch:]] if len(table)>nbatch else []
+                        num_batched = len(table)-nbatch
+            except UnicodeEncodeError as e:
+                if unicode_error:
+                    raise unicode_error
+                unicode_error = e
+                continue
+
+            break
+
+        if num_batched>0:
+            yield pd.concat(batches, ignore_index=True) if len(batches)>1 else batches[0].reset_index(drop=True)
+
+
+    def __filter(self, table, date, agency, format_date, columns, filter_expr):
         if len(table.columns)==1 and ('?xml' in table.columns[0] or re.search(r'^\<.+\>', table.columns[0])):
             # Read data was not a CSV file. It was an error code or HTML
             raise OPD_DataUnavailableError(table.iloc[0,0], _url_error_msg.format(self.url))
+        elif columns is not None and len(table.columns)==0:
+            # Read data may not be a CSV file or it does not contain any requested columns
+            raise OPD_DataUnavailableError(f"None of columns {columns} were found in the file", _url_error_msg.format(self.url))
         
         table = _filter_dataframe(table, date_field=self.date_field, date_filter=date, 
-            agency_field=self.agency_field, agency=agency, format_date=format_date)
+            agency_field=self.agency_field, agency=agency, format_date=format_date, filter_expr=filter_expr)
         
         if bool(self.query):
             for k,v in self.query.items():
                 table = table[table[k]==v].reset_index(drop=True)
 
-        if offset>0:
-            rows_limit = offset+nrows if nrows is not None and offset+nrows<len(table) else len(table)
-            logger.debug(f"Extracting {rows_limit} rows starting at {offset}")
-            table = table.iloc[offset:rows_limit].reset_index(drop=True)
-        if nrows is not None and len(table)>nrows:
-            logger.debug(f"Extracting the first {nrows} rows")
-            table = table.head(nrows)
+        return table
+
+
+    def __read_chunks(self, filename, use_legacy, headers, pbar, nbatch, usecols, encoding_errors, skip):
+        # Generator that reads local file if filename is set and streams file from URL otherwise in chunks of nbatch rows.
+        # The first skip rows are not returned.
+        with nullcontext() if filename else self.__get(use_legacy, headers) as resp:
+            try:
+                reader = pd.read_csv(filename if filename else TqdmReader(resp, pbar=pbar), chunksize=nbatch, 
+                                     encoding_errors=encoding_errors, usecols=usecols)
+            except (urllib.error.HTTPError, pd.errors.ParserError) as e:
+                raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+            
+            with reader:
+                while True:
+                    try:
+                        with warnings.catch_warnings():
+                            warnings.filterwarnings("ignore", message=r"Columns \(.+\) have mixed types", category=pd.errors.DtypeWarning)
+                            table = next(reader)
+                    except StopIteration:
+                        break
+                    except (urllib.error.HTTPError, pd.errors.ParserError) as e:
+                        raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+
+                    if skip>0:
+                        # Rows were already read when reading was previously attempted
+                        num_skip = min(skip, len(table))
+                        table = table.iloc[num_skip:]
+                        skip-=num_skip
+                        if len(table)==0:
+                            continue
+
+                    yield table
+
+
+    def __read_csv(self, filename, use_legacy, headers, pbar, nrows, usecols):
+        # Reads local file if filename is set and streams file from URL otherwise
+        header = 'infer'
+        unicode_error = None
+        for encoding_errors in ['surrogateescape', 'ignore']:
+            # Cached file is read again if reading needs to be repeated
+            with nullcontext() if filename else self.__get(use_legacy, headers) as resp:
+                try:
+                    with warnings.catch_warnings():
+                        warnings.filterwarnings("ignore", message=r"Columns \(.+\) have mixed types", category=pd.errors.DtypeWarning)
+                        table = pd.read_csv(filename if filename else TqdmReader(resp, pbar=pbar), nrows=nrows, 
+                            encoding_errors=encoding_errors, 
+                            header=header, usecols=usecols)
+                except UnicodeEncodeError as e:
+                    if unicode_error:
+                        raise unicode_error
+                    unicode_error = e
+                    continue
+                except (urllib.error.HTTPError, pd.errors.ParserError) as e:
+                    raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+                except Exception as e:
+                    raise e
+                
+            break
 
         return table
 
+
+    def __download(self, pbar, nrows=None):
+        # Returns the filename of the file in the download cache (None if the download cache is disabled) and whether a 
+        # legacy session and/or browser headers are required to request the file. If only the first nrows rows are needed,
+        # the file is only read from the cache if it is already there so that the rest of the file is not downloaded.
+        info = get_download_info(self.url)
+        if info and (filename:=get_cached_file(self.url)):
+            return filename, info['legacy'], info['headers']
+        
+        # Options that worked previously do not need to be checked again
+        use_legacy, headers = (info['legacy'], info['headers']) if info else self.__check_url()
+        filename = download_file(self.url, pbar=pbar, headers=headers, legacy=use_legacy) if nrows is None else None
+        return filename, use_legacy, headers
+
+
+    def __check_url(self):
+        # Returns whether a legacy session and/or browser headers are required to request the file
+        use_legacy = False
+        headers = None
+        try:
+            r = http_head(self.url)
+        except requests.exceptions.SSLError as e:
+            if "[SSL: UNSAFE_LEGACY_RENEGOTIATION_DISABLED] unsafe legacy renegotiation disabled" in str(e.args[0]) or \
+                "[SSL: CERTIFICATE_VERIFY_FAILED] certificate verify failed: unable to get local issuer certificate" in str(e.args[0]):
+                use_legacy = True
+            elif 'Max retries exceeded' in str(e):
+                raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+            else:
+                raise e
+        except requests.ConnectionError as e:
+            if 'Max retries exceeded' in str(e):
+                raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+            else:
+                raise e
+        except Exception as e:
+            raise
+            
+        if not use_legacy:
+            if r.status_code in [400,404]:
+                # Try get instead
+                r = http_get(self.url)
+            try:
+                r.raise_for_status()
+                r.close()
+            except requests.exceptions.HTTPError as e:
+                try:
+                    headers = {
+                        'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:106.0) Gecko/20100101 Firefox/106.0',
+                        'Accept': 'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+                        'Accept-Language': 'en-US,en;q=0.5',
+                        # 'Accept-Encoding': 'gzip, deflate, br',
+                        'DNT': '1',
+                        'Connection': 'keep-alive',
+                        'Upgrade-Insecure-Requests': '1',
+                        'Sec-Fetch-Dest': 'document',
+                        'Sec-Fetch-Mode': 'navigate',
+                        'Sec-Fetch-Site': 'none',
+                        'Sec-Fetch-User': '?1',
+                    }
+                    r = http_get(self.url, headers=headers)
+                    r.raise_for_status()
+                    r.close()
+                except:
+                    raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
+            except Exception as e:
+                raise e
+
+        return use_legacy, headers
+
+
+    def __get(self, use_legacy, headers=None):
+        if use_legacy:
+            return get_legacy_session(self.url).get(self.url, params=None, stream=True, headers=headers)
+        else:
+            return http_get(self.url, params=None, stream=True, headers=headers)
+
+
     def get_years(self, *, force=False, **kwargs):
         '''Get years contained in data set
         
@@ -1,15 +1,25 @@
 from abc import ABC, abstractmethod
+from contextlib import contextmanager
 from dataclasses import dataclass
 from datetime import datetime, date
 from io import BytesIO
+import itertools
 import numbers
 import json
+import numpy as np
 import pandas as pd
+import hashlib
 from math import ceil
+import os
+import os.path as path
 import requests
+import tempfile
+import threading
+import time
 from time import sleep
 from tqdm import tqdm
 import urllib
+import urllib.parse
 import urllib3
 import warnings
 from zipfile import ZipFile
@@ -34,6 +44,23 @@ _default_limit = 100000
 
 sleep_time = 0.1
 
+# When checking years one at a time, stop after this many consecutive years without data 
+# before any data is found (_oldest_recent) and after data is found (_max_misses_gap)
+_oldest_recent = 20
+_max_misses_gap = 10
+# Engines that can be used to read CSV and Excel files. Loaders ignore engines for other file types
+# so that the same engine input can be used for datasets that combine CSV and Excel files.
+_csv_engines = ['c', 'pyarrow']
+_excel_engines = ['calamine', 'openpyxl']
+# Size of blocks requested when reading remote zip files with HTTP range requests
+_zip_block_size = 2**20
+
+class _ServerAggregateUnsupported(NotImplementedError):
+	# Raised by aggregate when the data source cannot compute the aggregate on the server. 
+	# The data should be loaded and aggregated locally instead.
+	pass
+
+
 _url_error_msg = "There is likely an issue with the website. Open the URL {} with a web browser to confirm. " + \
 					"See a list of known site outages at https://github.com/openpolicedata/opd-data/blob/main/outages.csv"
 
@@ -117,8 +144,8 @@ def _process_date(date, datetime_format=None, is_date_string=False):
 	return start_date, stop_date
 
 
-def _filter_dataframe(df, date_field=None, date_filter=None, agency_field=None, agency=None, format_date=True):
-	'''Filter dataframe by agency and/or date range
+def _filter_dataframe(df, date_field=None, date_filter=None, agency_field=None, agency=None, format_date=True, filter_expr=None):
+	'''Filter dataframe by agency, date range, and/or filter expression
 	
 	Parameters
 	----------
@@ -137,6 +164,8 @@ def _filter_dataframe(df, date_field=None, date_filter=None, agency_field=None,
 	format_date : bool, optional
 		If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
 		to be pandas datetimes (or pandas Period in rare cases), by default True
+	filter_expr : openpolicedata.filters.Expression
+		(Optional) Filter expression to apply to data
 	'''
 
 	date_filter = _clean_date_input(date_filter)
@@ -188,9 +217,249 @@ def _filter_dataframe(df, date_field=None, date_filter=None, agency_field=None,
 		else:
 			raise ValueError(f"Column {date_field} has been identfied as a year column and cannot be filtered by dates: {date_filter}")
 
+	if filter_expr is not None:
+		logger.debug(f"Keeping rows that match filter {filter_expr}")
+		df = df[filter_expr.mask(df)]
+
 	return df
 
-def get_legacy_session():
+
+def _append_filter(opt_filter, filter_expr, dialect):
+	'''Add filter expression compiled to dialect to optional filter(s)'''
+	if filter_expr is None:
+		return opt_filter
+	
+	opt_filter = [] if opt_filter is None else (opt_filter.copy() if isinstance(opt_filter, list) else [opt_filter])
+	opt_filter.append(f"({filter_expr.to_sql(dialect)})")
+	return opt_filter
+
+def _get_columns(columns, *required):
+	'''Get the list of columns to request. Required columns (i.e. the date and agency fields) are 
+	always included so that data can still be filtered. Returns None if all columns are requested.
+	'''
+	if columns is None:
+		return None
+	
+	columns = [columns] if isinstance(columns, str) else list(columns)
+	lower_columns = [x.lower() for x in columns]
+	for c in required:
+		if isinstance(c, str) and c.lower() not in lower_columns:
+			columns.append(c)
+			lower_columns.append(c.lower())
+
+	return columns
+
+
+def _column_matcher(columns):
+	'''Get function that returns True if a column name is in columns. Matches are case-insensitive 
+	because the capitalization of column names sometimes changes. The function can be used as the 
+	usecols input to pandas readers so that columns not in the file are ignored.
+	'''
+	lower_columns = set(x.lower() for x in columns)
+	return lambda c: isinstance(c, str) and c.lower() in lower_columns
+
+
+def _select_columns(df, columns):
+	'''Keep only columns of df that are in columns. Columns not in df are ignored.'''
+	if columns is None:
+		return df
+	
+	match = _column_matcher(columns)
+	keep = [c for c in df.columns if match(c)]
+	if _has_gpd and isinstance(df, gpd.GeoDataFrame) and df.geometry.name not in keep:
+		keep.append(df.geometry.name)
+	return df[keep]
+
+
+_aggregations = ['count']
+_date_parts = ['year', 'month']
+
+def _check_aggregate_input(group_by=None, agg='count', date_part=None, date_field=None):
+	'''Validate inputs to aggregate functions. Returns group_by as a list.'''
+	if agg not in _aggregations:
+		raise ValueError(f"Unsupported aggregation {agg}. Supported aggregations are {_aggregations}")
+	if date_part is not None:
+		if date_part not in _date_parts:
+			raise ValueError(f"Unsupported date_part {date_part}. Supported values are {_date_parts}")
+		if pd.isnull(date_field):
+			raise ValueError("A date field is required to group by date_part")
+
+	if group_by is None:
+		group_by = []
+	elif isinstance(group_by, str):
+		group_by = [group_by]
+	else:
+		group_by = list(group_by)
+
+	if date_part in group_by:
+		raise ValueError(f"Group by column {date_part} conflicts with the date_part output column")
+	if 'count' in group_by:
+		raise ValueError("Group by column count conflicts with the aggregation output column")
+
+	return group_by
+
+
+def _format_aggregate(df, group_by, date_part=None):
+	'''Put the result of an aggregation into the standard form: one column for each group_by column,
+	a date_part column (if requested), and a count column, sorted by the group columns.
+	'''
+	keys = group_by + ([date_part] if date_part else [])
+	if len(df)==0:
+		return pd.DataFrame(columns=keys+['count'])
+	
+	df = df[keys+['count']].copy()
+	df['count'] = pd.to_numeric(df['count']).astype('int64')
+	if date_part:
+		df[date_part] = pd.to_numeric(df[date_part])
+		df[date_part] = df[date_part].astype('Int64' if df[date_part].isnull().any() else 'int64')
+
+	if len(keys)>0:
+		# Results requested in multiple queries may contain the same group more than once
+		df = df.groupby(keys, dropna=False, sort=True)['count'].sum().reset_index()
+
+	return df.reset_index(drop=True)
+
+
+def _aggregate_dataframe(df, group_by=None, agg='count', date_field=None, date_part=None):
+	'''Aggregate a loaded table locally. This is used for data sources that cannot compute
+	aggregates on the server.
+	
+	Parameters
+	----------
+	df : pandas or geopandas dataframe
+		Dataframe containing the data
+	group_by : str or list
+		(Optional) Column(s) to group by
+	agg : str
+		(Optional) Aggregation to compute. Currently, only 'count' is supported.
+	date_field : str
+		(Optional) Name of the column that contains the date. Required if date_part is not None
+	date_part : str
+		(Optional) 'year' or 'month'. If set, results are also grouped by the year or month of date_field
+
+	Returns
+	-------
+	pandas.DataFrame
+		Dataframe containing the group_by columns, the date_part column (if requested) and the count
+	'''
+	group_by = _check_aggregate_input(group_by, agg, date_part, date_field)
+
+	if df is None:
+		df = pd.DataFrame(columns=group_by+([date_field] if date_part else []))
+
+	keys = [df[k] for k in group_by]
+	if date_part:
+		dates = df[date_field]
+		if hasattr(dates, "dt"):
+			dates = getattr(dates.dt, date_part)
+		elif date_part=='year' and pd.api.types.is_numeric_dtype(dates):
+			pass
+		else:
+			dates = getattr(pd.to_datetime(dates, errors='coerce').dt, date_part)
+		keys.append(dates.rename(date_part))
+
+	if len(keys)==0:
+		result = pd.DataFrame({'count':[len(df)]})
+	else:
+		result = df.groupby(keys, dropna=False).size().reset_index(name='count')
+
+	return _format_aggregate(result, group_by, date_part)
+
+
+# Settings for the HTTP sessions shared by all data loaders. Sessions are pooled per host so that
+# repeated requests to the same server (i.e. paging) reuse open connections rather than
+# performing a new TCP and TLS handshake for each request.
+pool_connections = 10
+pool_maxsize = 10
+request_timeout = None  # Default timeout (in seconds) for requests. None waits indefinitely.
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def set_transport_options(pool_connections=None, pool_maxsize=None, timeout=None):
+	'''Update settings of the HTTP sessions shared by all data loaders. Existing sessions
+	are closed so that new settings are applied to subsequent requests.
+
+	Parameters
+	----------
+	pool_connections : int
+		(Optional) Number of connection pools to cache per session
+	pool_maxsize : int
+		(Optional) Maximum number of connections to keep open per host. Should be at least the number of 
+		threads making simultaneous requests to the same host
+	timeout : float or tuple
+		(Optional) Default timeout in seconds (or a (connect, read) tuple) for requests that do not specify one
+	'''
+	settings = globals()
+	if pool_connections is not None:
+		settings['pool_connections'] = pool_connections
+	if pool_maxsize is not None:
+		settings['pool_maxsize'] = pool_maxsize
+	if timeout is not None:
+		settings['request_timeout'] = timeout
+
+	close_sessions()
+
+
+def close_sessions():
+	'''Close all HTTP sessions shared by the data loaders'''
+	with _sessions_lock:
+		for session in _sessions.values():
+			session.close()
+		_sessions.clear()
+
+
+def _get_host(url):
+	if url is None:
+		return None
+	parts = urllib.parse.urlsplit(url)
+	return (parts.scheme.lower(), parts.netloc.lower())
+
+
+def get_session(url=None, legacy=False):
+	'''Get the shared HTTP session for the host of a URL. Sessions keep connections to the
+	host alive and negotiate compressed (gzip) responses.
+
+	Parameters
+	----------
+	url : str
+		(Optional) URL to get a session for. Sessions are shared by all URLs with the same host
+	legacy : bool
+		(Optional) If True, return a session that allows unsafe legacy SSL renegotiation. Only use
+		for servers that require it.
+
+	Returns
+	-------
+	requests.Session
+	'''
+	key = (_get_host(url), legacy)
+	with _sessions_lock:
+		if key not in _sessions:
+			ssl_context = _get_legacy_ssl_context() if legacy else None
+			adapter = CustomHttpAdapter(ssl_context, timeout=request_timeout, 
+							   pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+			session = requests.Session()
+			session.headers['Accept-Encoding'] = 'gzip, deflate'
+			session.mount('https://', adapter)
+			if not legacy:
+				session.mount('http://', adapter)
+			_sessions[key] = session
+
+		return _sessions[key]
+
+
+def http_get(url, legacy=False, **kwargs):
+	'''Send GET request using the shared session for the URL's host. kwargs are passed to requests'''
+	return get_session(url, legacy).get(url, **kwargs)
+
+
+def http_head(url, legacy=False, **kwargs):
+	'''Send HEAD request using the shared session for the URL's host. kwargs are passed to requests'''
+	return get_session(url, legacy).head(url, **kwargs)
+
+
+def _get_legacy_ssl_context():
 	try:
 		import ssl
 	except:
@@ -198,9 +467,204 @@ def get_legacy_session():
 						  " but is not for some Python versions like the one used by Jupyter Lite. To install, run 'pip install ssl'")
 	ctx = ssl.create_default_context(ssl.Purpose.SERVER_AUTH)
 	ctx.options |= 0x4  # OP_LEGACY_SERVER_CONNECT
-	session = requests.session()
-	session.mount('https://', CustomHttpAdapter(ctx))
-	return session
+	return ctx
+
+
+def get_legacy_session(url=None):
+	'''Get the shared session for the host of url that allows unsafe legacy SSL renegotiation'''
+	return get_session(url, legacy=True)
+
+
+# Settings for the cache of downloaded files. Files (i.e. CSV, Excel, and HTML files) are downloaded 
+# once to the cache so that loading, counting, and getting years of the same file do not download it again.
+# Cached files are used without checking the server if they were checked less than download_cache_max_age
+# seconds ago. Otherwise, the server is asked if the file has changed (using its ETag and Last-Modified headers).
+# Files are not removed from the cache so the cache is disabled by default (download_cache_dir is None). It is 
+# enabled with set_download_cache.
+download_cache_dir = None
+download_cache_max_age = 600
+
+
+def set_download_cache(cache_dir, max_age=None):
+	'''Update settings of the cache of downloaded files
+
+	Parameters
+	----------
+	cache_dir : str or None
+		Directory to store downloaded files (and blocks of files read with range requests) in. If None (default), files 
+		are not cached. Files are not removed from the cache automatically.
+	max_age : float
+		(Optional) Number of seconds that a cached file is used without checking if the file has changed on the server
+	'''
+	settings = globals()
+	settings['download_cache_dir'] = cache_dir
+	if max_age is not None:
+		settings['download_cache_max_age'] = max_age
+
+
+def get_block_cache_dir():
+	'''Get directory where blocks of files read with HTTP range requests (see httpio.open) are saved.
+	Blocks are saved in the download cache so they are only saved if the download cache is enabled 
+	with set_download_cache. Returns None if files are not cached.'''
+	return path.join(download_cache_dir, 'blocks') if download_cache_dir is not None else None
+
+
+def _get_download_info_file(url):
+	return path.join(download_cache_dir, hashlib.sha256(url.encode()).hexdigest()+'.json')
+
+
+def get_download_info(url):
+	'''Get information about a cached file (i.e. the request options used to download it). 
+	Returns None if url has not been downloaded or the download cache is disabled.
+	'''
+	if download_cache_dir is None or not path.exists(info_file:=_get_download_info_file(url)):
+		return None
+	with open(info_file, 'r') as f:
+		info = json.load(f)
+	
+	# Files are stored by the hash of their contents
+	info['file'] = path.join(download_cache_dir, 'objects', info['sha256'])
+	return info if path.exists(info['file']) else None
+
+
+def get_cached_file(url):
+	'''Get the cached copy of url if it was checked less than download_cache_max_age seconds ago. Otherwise, returns None.'''
+	info = get_download_info(url)
+	if info and time.time()-info['checked'] < download_cache_max_age:
+		logger.debug(f"Using cached copy of {url}")
+		return info['file']
+	return None
+
+
+def _write_download_info(url, info):
+	info = {k:v for k,v in info.items() if k!='file'}
+	info_file = _get_download_info_file(url)
+	with open(info_file+'.tmp', 'w') as f:
+		json.dump(info, f)
+	os.replace(info_file+'.tmp', info_file)
+
+
+def download_file(url, pbar=True, headers=None, legacy=False, block_size=2**20):
+	'''Download a file to the download cache. The cached file is returned if it was checked less than 
+	download_cache_max_age seconds ago or if the server reports that it has not changed.
+
+	Parameters
+	----------
+	url : str
+		URL of file
+	pbar : bool
+		(Optional) If True (default), a progress bar will be displayed while downloading
+	headers : dict
+		(Optional) Headers to send with the request
+	legacy : bool
+		(Optional) If True, use a session that allows unsafe legacy SSL renegotiation
+	block_size : int
+		(Optional) Number of bytes to write at a time
+
+	Returns
+	-------
+	str or None
+		Local filename or None if the download cache is disabled
+	'''
+	if download_cache_dir is None:
+		return None
+	
+	info = get_download_info(url)
+	if filename:=get_cached_file(url):
+		return filename
+	
+	req_headers = dict(headers) if headers else {}
+	if info:
+		if info.get('etag'):
+			req_headers['If-None-Match'] = info['etag']
+		if info.get('last_modified'):
+			req_headers['If-Modified-Since'] = info['last_modified']
+
+	os.makedirs(path.join(download_cache_dir, 'objects'), exist_ok=True)
+	with http_get(url, legacy=legacy, stream=True, headers=req_headers) as r:
+		if info and r.status_code==304:
+			logger.debug(f"{url} has not changed. Using cached copy.")
+			info['checked'] = time.time()
+			_write_download_info(url, info)
+			return info['file']
+		
+		r.raise_for_status()
+
+		logger.debug(f"Downloading {url} to {download_cache_dir}")
+		fd, tmp_file = tempfile.mkstemp(dir=download_cache_dir, suffix='.tmp')
+		try:
+			with os.fdopen(fd, 'wb') as f:
+				sha = _write_response(r, f, url, pbar, block_size)
+			
+			filename = path.join(download_cache_dir, 'objects', sha.hexdigest())
+			os.replace(tmp_file, filename)
+		except:
+			if path.exists(tmp_file):
+				os.remove(tmp_file)
+			raise
+
+		if info and info['file']!=filename and path.exists(info['file']):
+			# File has changed. Remove old copy.
+			os.remove(info['file'])
+
+		_write_download_info(url, {'url':url, 'sha256':sha.hexdigest(), 'etag':r.headers.get('ETag'), 
+							   'last_modified':r.headers.get('Last-Modified'), 'checked':time.time(),
+							   'legacy':legacy, 'headers':headers})
+		
+	return filename
+
+
+def _write_response(r, f, url, pbar, block_size):
+	# Writes streamed response to file and returns hash of the contents
+	total_size = int(r.headers.get("Content-Length", 0))
+	pbar = pbar and total_size > block_size
+	if pbar:
+		bar = tqdm(desc=f"Downloading {url}", total=total_size, unit="iB", unit_scale=True, unit_divisor=1024, leave=False)
+
+	sha = hashlib.sha256()
+	try:
+		for data in r.iter_content(block_size):
+			sha.update(data)
+			f.write(data)
+			if pbar:
+				bar.update(len(data))
+	finally:
+		if pbar:
+			bar.close()
+	
+	logger.debug(f'Completed downloading {url}')
+	return sha
+
+
+@contextmanager
+def spool_file(url, pbar=True, headers=None, legacy=False, block_size=2**20):
+	'''Context manager that downloads a file to disk and returns the local filename. The file is saved to the 
+	download cache or, if the cache is disabled, to a temporary file that is deleted on exit.
+	'''
+	filename = download_file(url, pbar=pbar, headers=headers, legacy=legacy, block_size=block_size)
+	if filename:
+		yield filename
+		return
+
+	fd, filename = tempfile.mkstemp(suffix='.tmp')
+	try:
+		with os.fdopen(fd, 'wb') as f, http_get(url, legacy=legacy, stream=True, headers=headers) as r:
+			r.raise_for_status()
+			_write_response(r, f, url, pbar, block_size)
+		yield filename
+	finally:
+		os.remove(filename)
+
+
+def try_download_file(url, **kwargs):
+	'''Download a file to the download cache (see download_file). Returns None if the file cannot be downloaded 
+	so that the file can be requested with the error handling of the data loader instead.
+	'''
+	try:
+		return download_file(url, **kwargs)
+	except requests.exceptions.RequestException as e:
+		logger.debug(f"Unable to download {url} to the download cache: {e}")
+		return None
 
 
 @dataclass
@@ -213,25 +677,211 @@ class Where:
 		return self.where < y.where
 
 
+def _get_point_coordinates(geometry):
+	'''Get coordinates of point geometries
+
+	Parameters
+	----------
+	geometry : list
+		Geometry of each record. Geometries can be ArcGIS points ({"x":..., "y":...}), GeoJSON, or Socrata locations 
+		({"latitude":..., "longitude":...}). Socrata locations that only contain a human_address have NaN coordinates.
+		Records without geometry are None.
+
+	Returns
+	-------
+	x : NumPy array
+		x coordinate (longitude) of each record. NaN if record does not have a point geometry
+	y : NumPy array
+		y coordinate (latitude) of each record. NaN if record does not have a point geometry
+	has_geometry : NumPy array
+		Whether each record has a geometry
+	other_geometry : dict
+		GeoJSON geometries that are not points (i.e. lines) keyed by record index
+	'''
+	n = len(geometry)
+	x = np.full(n, np.nan)
+	y = np.full(n, np.nan)
+	has_geometry = np.zeros(n, dtype=bool)
+	other_geometry = {}
+	for k, g in enumerate(geometry):
+		if not g:
+			continue
+		elif "x" in g:
+			# ArcGIS point. Coordinates may be "NaN"
+			x[k] = g["x"]
+			y[k] = g["y"]
+		elif "coordinates" in g:
+			if g.get("type", "Point")!="Point":
+				other_geometry[k] = g
+			elif len(g["coordinates"])>=2:
+				x[k] = g["coordinates"][0]
+				y[k] = g["coordinates"][1]
+			else:
+				continue
+		elif "longitude" in g and "latitude" in g:
+			x[k] = float(g["longitude"])
+			y[k] = float(g["latitude"])
+		elif list(g.keys())!=["human_address"]:
+			continue
+		
+		has_geometry[k] = True
+
+	return x, y, has_geometry, other_geometry
+
+
+def _build_point_geometry(x, y, has_geometry=None, other_geometry=None):
+	'''Create GeoPandas geometry array of points from coordinates in a single vectorized call
+
+	Parameters
+	----------
+	x : list or NumPy array
+		x coordinate (longitude) of each point
+	y : list or NumPy array
+		y coordinate (latitude) of each point
+	has_geometry : list or NumPy array
+		(Optional) Whether each record has a geometry. Geometry is set to None for records without a geometry. 
+		By default, all records have a geometry (NaN coordinates create points with NaN coordinates).
+	other_geometry : dict
+		(Optional) GeoJSON geometries that are not points keyed by record index
+
+	Returns
+	-------
+	geopandas.array.GeometryArray
+	'''
+	geometry = gpd.points_from_xy(x, y)
+	if has_geometry is not None:
+		geometry[~np.asarray(has_geometry, dtype=bool)] = None
+	if other_geometry:
+		from shapely.geometry import shape
+		for k, g in other_geometry.items():
+			geometry[k] = shape(g)
+
+	return geometry
+
+
+class ColumnarPages:
+	"""
+	Accumulates pages of records into per-column arrays so that each page can be discarded after it is added
+
+	Parameters
+	----------
+	keep_geometry : bool
+		If True, geometry objects input with each page are stored (i.e. for outputting geometry without GeoPandas)
+	"""
+
+	def __init__(self, keep_geometry=False):
+		self.nrows = 0
+		self.keep_geometry = keep_geometry
+		self.__columns = {}
+		self.__x = []
+		self.__y = []
+		self.__has_geometry = []
+		self.__geometry = []
+
+	def __len__(self):
+		return self.nrows
+
+	def add_records(self, records, x=None, y=None, has_geometry=None, geometry=None):
+		'''Add a page of records where each record is a dictionary of values. See add_columns for other inputs'''
+		if len(records)==0:
+			return
+		keys = records[0].keys()
+		if any(len(r)!=len(keys) for r in records):
+			# Not all records have the same fields. Use all fields in the order that they are found
+			keys = dict.fromkeys(k for r in records for k in r)
+		self.add_columns({k:[r.get(k) for r in records] for k in keys}, len(records), x, y, has_geometry, geometry)
+
+	def add_columns(self, columns, nrows, x=None, y=None, has_geometry=None, geometry=None):
+		'''Add a page of records
+
+		Parameters
+		----------
+		columns : dict
+			Dictionary of lists or NumPy arrays (all of length nrows) of the values of each column
+		nrows : int
+			Number of records in page
+		x : list or NumPy array
+			(Optional) x coordinates of point geometry of each record. NaN if record does not have a point geometry.
+			If not input, coordinates are found from geometry
+		y : list or NumPy array
+			(Optional) y coordinates of point geometry of each record
+		has_geometry : list or NumPy array
+			(Optional) Whether each record has a geometry. By default, records have geometry if x is not NaN
+		geometry : list
+			(Optional) Geometry objects of each record (see _get_point_coordinates). Only stored if keep_geometry is True
+		'''
+		if nrows==0:
+			return
+		for k in self.__columns:
+			if k not in columns:
+				self.__columns[k].append([None]*nrows)
+		for k,v in columns.items():
+			if k not in self.__columns:
+				self.__columns[k] = [[None]*self.nrows] if self.nrows>0 else []
+			self.__columns[k].append(v)
+
+		if x is None and geometry is not None:
+			x, y, has_geometry, _ = _get_point_coordinates(geometry)
+		elif x is None:
+			x = y = np.full(nrows, np.nan)
+			has_geometry = np.zeros(nrows, dtype=bool)
+		elif has_geometry is None:
+			has_geometry = pd.notnull(np.asarray(x, dtype=float))
+		self.__x.append(np.asarray(x, dtype=float))
+		self.__y.append(np.asarray(y, dtype=float))
+		self.__has_geometry.append(np.asarray(has_geometry, dtype=bool))
+		if self.keep_geometry:
+			self.__geometry.extend(geometry if geometry is not None else [None]*nrows)
+
+		self.nrows+=nrows
+
+	def to_frame(self):
+		'''Returns DataFrame containing all added records'''
+		data = {}
+		for k,chunks in self.__columns.items():
+			if all(isinstance(x, np.ndarray) for x in chunks):
+				data[k] = np.concatenate(chunks)
+			else:
+				data[k] = list(itertools.chain.from_iterable(chunks))
+		return pd.DataFrame(data)
+	
+	def get_coordinates(self):
+		'''Returns NumPy arrays of x and y point coordinates and whether each record has a geometry'''
+		if self.nrows==0:
+			return np.zeros(0), np.zeros(0), np.zeros(0, dtype=bool)
+		return np.concatenate(self.__x), np.concatenate(self.__y), np.concatenate(self.__has_geometry)
+	
+	def get_geometry(self):
+		'''Returns stored geometry objects if keep_geometry is True'''
+		return self.__geometry
+
+
 # Based on https://stackoverflow.com/a/73519818/9922439
 class CustomHttpAdapter (requests.adapters.HTTPAdapter):
-	# "Transport adapter" that allows us to use custom ssl_context.
+	# "Transport adapter" that allows us to use custom ssl_context and a default timeout.
 
-	def __init__(self, ssl_context=None, **kwargs):
+	def __init__(self, ssl_context=None, timeout=None, **kwargs):
 		self.ssl_context = ssl_context
+		self.timeout = timeout
 		super().__init__(**kwargs)
 
-	def init_poolmanager(self, connections, maxsize, block=False):
+	def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+		if self.ssl_context is not None:
+			pool_kwargs['ssl_context'] = self.ssl_context
 		self.poolmanager = urllib3.poolmanager.PoolManager(
 			num_pools=connections, maxsize=maxsize,
-			block=block, ssl_context=self.ssl_context)
+			block=block, **pool_kwargs)
+		
+	def send(self, request, timeout=None, **kwargs):
+		timeout = self.timeout if timeout is None else timeout
+		return super().send(request, timeout=timeout, **kwargs)
 		
 
 class UrlIoContextManager:
 	def __init__(self, url) -> None:
 		self.url = url
 		try:
-			self.file = httpio.open(url)
+			self.file = httpio.open(url, block_size=_zip_block_size, session=get_session(url), cache_dir=get_block_cache_dir())
 			self.ishttp = True
 		except httpio.HTTPIOError:
 			open_url =  urllib.request.urlopen(url)
@@ -246,43 +896,29 @@ class UrlIoContextManager:
 			self.file.close()
 		
 
+@contextmanager
+def open_zip(url, block_size=2**20, pbar=True):
+	'''Context manager that downloads a zip file and returns it as an open ZipFile. The zip file is saved 
+	to disk (see spool_file) so that the archive is not held in memory. Members can then be decompressed 
+	as they are read with ZipFile.open.
+	'''
+	with spool_file(url, pbar=pbar, block_size=block_size) as filename, ZipFile(filename, 'r') as z:
+		yield z
+
+
 def download_zip_and_extract(url, block_size, pbar=True):
-	r = requests.get(url, stream=True)
-	r.raise_for_status()
-	total_size = int(r.headers.get("Content-Length", 0))
-	pbar = pbar and total_size > block_size
-	if pbar:
-		bar = tqdm(
-			desc=f"Downloading zip file: {url}",
-			total=total_size,
-			unit="iB",
-			unit_scale=True,
-			unit_divisor=1024,
-			leave=False
-		)
-	b = BytesIO()
-	for data in r.iter_content(block_size):
-		b.write(data)
-		if pbar:
-			bar.update(len(data))
-	r.close()
+	with open_zip(url, block_size, pbar) as z:
+		logger.debug('Reading from zip file')
+		return z.read(get_single_file_in_zip(z, url))
 
-	logger.debug(f'Completed downloading CSV zip file: {url}')
-	if pbar:
-		bar.close()
-	b.seek(0)
 
-	logger.debug('Creating zip file')
-	with ZipFile(b, 'r') as z:
-		if len(z.namelist())>1:
-			raise ValueError(f"More than 1 file found in {url} but no file was specified by the user. Please specify 1 or more files in the dataset input.")
+def get_single_file_in_zip(z, url):
+	'''Get name of the only file in a zip file. Raises ValueError if there is more than 1 file.'''
+	if len(z.namelist())>1:
+		raise ValueError(f"More than 1 file found in {url} but no file was specified by the user. Please specify 1 or more files in the dataset input.")
 
-		logger.debug('Reading from zip file')
-		zip_data = z.read(z.namelist()[0])
-		b.close()
-		logger.debug('Converting to BytesIO')
+	return z.namelist()[0]
 
-	return zip_data
 
 def str2json(json_str):
 	if pd.isnull(json_str):
@@ -299,12 +935,16 @@ class Data_Loader(ABC):
 
 	Methods
 	-------
-	load(date=None, nrows=None, pbar=True, agency=None, opt_filter=None, select=None, output_type=None)
+	load(date=None, nrows=None, pbar=True, agency=None, opt_filter=None, select=None, output_type=None, columns=None)
 		Load data for query
 	get_count(date=None, agency=None, force=False, opt_filter=None, where=None)
 		Get number of records/rows generated by query
+	load_iter(date=None, nbatch=10000, offset=0, pbar=True, agency=None, opt_filter=None, columns=None)
+		Load data for query in batches
 	get_years(nrows=1)
 		Get years contained in data set
+	aggregate(date=None, group_by=None, agg='count', date_part=None, opt_filter=None)
+		Compute aggregate statistics of query on the server
 	"""
 
 	_last_count = None
@@ -314,13 +954,30 @@ class Data_Loader(ABC):
 		pass
 
 	@abstractmethod
-	def get_count(self, date=None, *, agency=None, force=False, opt_filter=None, where=None):
+	def get_count(self, date=None, *, agency=None, force=False, opt_filter=None, where=None, filter_expr=None):
 		pass
 
 	@abstractmethod
-	def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, opt_filter=None, select=None, output_type=None, format_date=True):
+	def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, opt_filter=None, select=None, output_type=None, format_date=True, columns=None, filter_expr=None):
 		pass
 
+	def load_iter(self, date=None, nbatch=10000, offset=0, *, pbar=True, agency=None, opt_filter=None, format_date=True, columns=None, filter_expr=None, 
+			   engine=None, **kwargs):
+		'''Generator that loads data in batches of nbatch records. By default, the data is loaded once 
+		and split into batches, which is the most efficient way to read file-based data. 
+		'''
+		table = self.load(date, pbar=pbar, agency=agency, opt_filter=opt_filter, format_date=format_date, 
+					columns=columns, filter_expr=filter_expr, engine=engine)
+		for k in range(offset, len(table), nbatch):
+			yield table.iloc[k:k+nbatch].reset_index(drop=True)
+
+	def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, opt_filter=None, filter_expr=None, **kwargs):
+		'''Compute aggregate statistics (i.e. counts per group) of a query on the server. 
+		Raises _ServerAggregateUnsupported if the data source cannot compute the aggregate without 
+		loading the data. In that case, the data should be loaded and aggregated locally.
+		'''
+		raise _ServerAggregateUnsupported(f"{type(self).__name__} data cannot be aggregated on the server")
+
 	def get_years(self, *, nrows=1, check=None, **kwargs):
 		'''Get years contained in data set
 		
@@ -350,9 +1007,7 @@ class Data_Loader(ABC):
 		else:
 			year = date.today().year
 
-		oldest_recent = 20
-		max_misses_gap = 10
-		max_misses = oldest_recent
+		max_misses = _oldest_recent
 		misses = 0
 		years = []
 		while misses < max_misses:
@@ -362,7 +1017,7 @@ class Data_Loader(ABC):
 				misses+=1
 			else:
 				misses = 0
-				max_misses = max_misses_gap
+				max_misses = _max_misses_gap
 				years.append(year)
 
 			sleep(sleep_time)
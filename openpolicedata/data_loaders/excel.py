@@ -1,4 +1,5 @@
 import calendar
+from concurrent.futures import ProcessPoolExecutor
 import copy
 import datetime
 from io import BytesIO
@@ -9,16 +10,24 @@ from pandas.api.types import is_datetime64_any_dtype as is_datetime
 from rapidfuzz import fuzz
 import re
 import requests
-import tempfile
-import urllib
+import threading
+import urllib.request
 import warnings
 from xlrd.biffh import XLRDError
 from zipfile import ZipFile
 
-from .data_loader import Data_Loader, UrlIoContextManager, _url_error_msg, get_legacy_session, _filter_dataframe, _clean_date_input
+from .data_loader import Data_Loader, UrlIoContextManager, get_block_cache_dir, _url_error_msg, get_legacy_session, get_session, http_get, _filter_dataframe, _clean_date_input, \
+    _get_columns, _select_columns, try_download_file, _csv_engines, _excel_engines, _zip_block_size
 from .. import dataset_id, log, httpio
 from ..exceptions import OPD_DataUnavailableError
 
+try:
+    # Fast Rust-based Excel reader used by pandas for engine='calamine'
+    import python_calamine
+    _has_calamine = True
+except:
+    _has_calamine = False
+
 logger = log.get_logger()
 
 class Excel(Data_Loader):
@@ -34,11 +43,11 @@ class Excel(Data_Loader):
     agency_field : str
         Name of column that contains agency names
     excel_file : Pandas ExcelFile
-        Object for use in reading data
+        Object for use in reading data. The Excel file is requested the first time that it is used.
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True, agency=None)
+    load(date=None, nrows=None, offset=0, pbar=True, agency=None, columns=None, filter_expr=None, engine=None)
         Load data for query
     get_count(date=None, agency=None, force=False)
         Get number of records/rows generated by query
@@ -69,9 +78,51 @@ class Excel(Data_Loader):
         is_zip = ".zip" in self.url
         self.sheet, file_in_zip = dataset_id.parse_excel_dataset(is_zip, data_set)
         
+        self.__file_in_zip = file_in_zip
+        # Workbook is not requested until data is loaded. The buffer is shared with copies of this loader.
+        self._buffer = _WorkbookBuffer()
+        # pandas ExcelFile objects for each engine
+        self._excel_files = {}
+
+
+    @property
+    def excel_file(self):
+        return self.__get_excel_file()
+
+
+    @excel_file.setter
+    def excel_file(self, value):
+        self._excel_files[None] = value
+
+
+    def __get_excel_file(self, engine=None):
+        if engine=='calamine' and not _has_calamine:
+            logger.debug("python-calamine is not installed. Reading Excel file with the default engine.")
+            engine = None
+
+        if engine not in self._excel_files:
+            data = self._buffer.get(self.__read_workbook)
+            if engine=='calamine':
+                try:
+                    self._excel_files[engine] = pd.ExcelFile(BytesIO(data), engine=engine)
+                except Exception as e:
+                    # i.e. encrypted workbooks
+                    logger.debug(f"Unable to open {self.url} with calamine: {e}. Reading Excel file with the default engine.")
+                    return self.__get_excel_file()
+            else:
+                self._excel_files[engine] = self.__open_excel_file(data, engine)
+
+        return self._excel_files[engine]
+
+
+    def __read_workbook(self):
+        # Returns the contents of the Excel file
+        # Local copy of file. Loader requests the file itself if it cannot be downloaded.
+        filename = try_download_file(self.url, pbar=False)
         try:
-            if is_zip:
-                with UrlIoContextManager(self.url) as fp, ZipFile(fp, 'r') as z:
+            if ".zip" in self.url:
+                with open(filename, 'rb') if filename else UrlIoContextManager(self.url) as fp, ZipFile(fp, 'r') as z:
+                    file_in_zip = self.__file_in_zip
                     if not file_in_zip:
                         if len(z.namelist())>1:
                             raise ValueError(f"More than one file found in zip file at {self.url}. One file must be specified if there is more than one file.")
@@ -80,9 +131,13 @@ class Excel(Data_Loader):
                     elif file_in_zip not in z.namelist():
                         raise ValueError(f'Unable to find file {file_in_zip} in {self.url}')
 
-                    self.excel_file = pd.ExcelFile(BytesIO(z.read(file_in_zip)))
+                    return z.read(file_in_zip)
+            elif filename:
+                with open(filename, 'rb') as f:
+                    return f.read()
             else:
-                self.excel_file = pd.ExcelFile(self.url)
+                with urllib.request.urlopen(self.url) as r:
+                    return r.read()
         except urllib.error.HTTPError as e:
             if str(e) in ["HTTP Error 406: Not Acceptable", 'HTTP Error 403: Forbidden']:
                 # 406 error: https://stackoverflow.com/questions/34832970/http-error-406-not-acceptable-python-urllib2
@@ -102,29 +157,30 @@ class Excel(Data_Loader):
                     'Sec-Fetch-User': '?1',
                 }
                 for k, h in enumerate([headers, headers2]):
-                    r = requests.get(self.url, stream=True, headers=h)
+                    r = http_get(self.url, stream=True, headers=h)
                     try:
                         r.raise_for_status()
                         break
                     except:
                         if k==1:
                             raise
-                file_like = BytesIO(r.content)
-                self.excel_file = pd.ExcelFile(file_like)
+                return r.content
             else:
                 raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
         except urllib.error.URLError as e:
             if "[SSL: UNSAFE_LEGACY_RENEGOTIATION_DISABLED] unsafe legacy renegotiation disabled" in str(e.args[0]):
-                with get_legacy_session() as session:
-                    r = session.get(self.url)
-                    
+                r = get_legacy_session(self.url).get(self.url)
                 r.raise_for_status()
-                file_like = BytesIO(r.content)
-                self.excel_file = pd.ExcelFile(file_like)
+                return r.content
             elif isinstance(e.args[0],TimeoutError):
                 raise OPD_DataUnavailableError(*e.args, _url_error_msg.format(self.url))
             else:
                 raise e
+        
+
+    def __open_excel_file(self, data, engine=None):
+        try:
+            return pd.ExcelFile(BytesIO(data), engine=engine)
         except XLRDError as e:
             if len(e.args)>0 and e.args[0] == "Workbook is encrypted" and \
                 any([self.url.startswith(x) for x in ["http://www.rutlandcitypolice.com"]]):  # Only perform on known datasets to prevent security issues
@@ -133,41 +189,40 @@ class Excel(Data_Loader):
                 except:
                     raise ImportError(f"{self.url} is encrypted. OpenPoliceData may be able to open it if msoffcrypto-tool " + 
                         "(https://pypi.org/project/msoffcrypto-tool/) is installed (pip install msoffcrypto-tool)")
-                # Download file to temporary file
-                r = requests.get(self.url)
-                r.raise_for_status()
                 # https://stackoverflow.com/questions/22789951/xlrd-error-workbook-is-encrypted-python-3-2-3
-                fp_decrypt = tempfile.TemporaryFile(suffix=".xls")
-                with tempfile.TemporaryFile() as fp:
-                    fp.write(r.content)
-                    fp.seek(0)
-
-                    # Try and unencrypt workbook with magic password
-                    wb_msoffcrypto_file = msoffcrypto.OfficeFile(fp)
+                # Try and unencrypt workbook with magic password
+                wb_msoffcrypto_file = msoffcrypto.OfficeFile(BytesIO(data))
 
-                    # https://nakedsecurity.sophos.com/2013/04/11/password-excel-velvet-sweatshop/
-                    wb_msoffcrypto_file.load_key(password='VelvetSweatshop')
-                    wb_msoffcrypto_file.decrypt(fp_decrypt)
+                # https://nakedsecurity.sophos.com/2013/04/11/password-excel-velvet-sweatshop/
+                wb_msoffcrypto_file.load_key(password='VelvetSweatshop')
+                fp_decrypt = BytesIO()
+                wb_msoffcrypto_file.decrypt(fp_decrypt)
 
                 fp_decrypt.seek(0)
-                self.excel_file = pd.ExcelFile(fp_decrypt)
+                return pd.ExcelFile(fp_decrypt)
             else:
                 raise
-        except Exception as e:
-            raise e
-        
+
 
     def __deepcopy__(self, memo):
-        # Overwriting deep copy because excel_file can no longer be deep copied
-        url = copy.deepcopy(self.url, memo)
-        data_set = copy.deepcopy(self.data_set, memo)
-        date_field = copy.deepcopy(self.date_field, memo)
-        agency_field = copy.deepcopy(self.agency_field, memo)
-        excel = Excel(url, data_set=data_set, date_field=date_field, agency_field=agency_field)
-        excel.excel_file = None
+        # Overwriting deep copy because excel_file can no longer be deep copied. The workbook buffer
+        # is shared so that the copy does not request the file again.
+        excel = copy.copy(self)
+        memo[id(self)] = excel
+        for k,v in self.__dict__.items():
+            if k not in ['_buffer', '_excel_files']:
+                setattr(excel, k, copy.deepcopy(v, memo))
+        excel._excel_files = {}
         return excel
 
 
+    def __getstate__(self):
+        # pandas ExcelFile cannot be pickled. It is recreated from the buffer when needed.
+        state = self.__dict__.copy()
+        state['_excel_files'] = {}
+        return state
+
+
     def isfile(self):
         '''Returns True to indicate that Excel data is file-based
 
@@ -178,7 +233,7 @@ class Excel(Data_Loader):
         return True
 
 
-    def get_count(self, date=None, *,  agency=None, force=False, _first_time=True, **kwargs):
+    def get_count(self, date=None, *,  agency=None, force=False, filter_expr=None, _first_time=True, **kwargs):
         '''Get number of records for a Excel data request
         
         Parameters
@@ -191,6 +246,8 @@ class Excel(Data_Loader):
             (Optional) Name of agency to filter for.
         force : bool
             (Optional) get_count for Excel file will only run if force=true. In many use cases, it will be more efficient to load the file and manually get the count.
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data
             
         Returns
         -------
@@ -199,12 +256,13 @@ class Excel(Data_Loader):
         '''
 
         logger.debug(f"Calculating row count for {self.url}")
-        if self._last_count is not None and self._last_count[0]==(self.url, date, agency):
+        filter_key = repr(filter_expr)
+        if self._last_count is not None and self._last_count[0]==(self.url, date, agency, filter_key):
             logger.debug("Request matches previous count request. Returning saved count.")
             return self._last_count[1]
         elif force:
-            count = len(self.load(date=date, agency=agency, _first_time=_first_time))
-            self._last_count = ((self.url, date, agency), count)
+            count = len(self.load(date=date, agency=agency, filter_expr=filter_expr, _first_time=_first_time))
+            self._last_count = ((self.url, date, agency, filter_key), count)
             return count
         else:
             raise ValueError("Extracting the number of records for an Excel file requires reading the whole file in. In most cases, "+
@@ -212,8 +270,8 @@ class Excel(Data_Loader):
                 "efficient. If running get_count with a date argument is still desired, set force=True")
 
 
-    def __get_sheets(self):
-        names = self.excel_file.sheet_names
+    def __get_sheets(self, excel_file):
+        names = excel_file.sheet_names
         if sum([x.isdigit() for x in names]) / len(names) > 0.75 and len(names)>1:
             logger.debug("Different years of data may be stored in separate Excel sheets. Evaluating...")
             possible_years = [int(x) for x in names if x.isdigit()]
@@ -253,7 +311,8 @@ class Excel(Data_Loader):
         return names, False
 
 
-    def load(self, date=None, nrows=None, offset=0, *, agency=None, format_date=True, _first_time=True, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, agency=None, format_date=True, columns=None, filter_expr=None, engine=None,
+             max_workers=1, _first_time=True, **kwargs):
         '''Download Excel file to pandas DataFrame
         
         Parameters
@@ -271,6 +330,17 @@ class Excel(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Columns to keep. The date and agency fields are always included. By default None (all columns)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data. Columns used in the filter are always kept.
+        engine : str
+            (Optional) Excel reader to use: 'calamine' (Rust-based reader that is much faster for large files) or 'openpyxl'.
+            If python-calamine is not installed or cannot open the file, 'calamine' uses the default engine instead. CSV engines
+            ('c' and 'pyarrow') are ignored. Default is None (pandas default engine for the file type)
+        max_workers : int
+            (Optional) Maximum number of processes used to parse sheets simultaneously when data is stored in multiple sheets.
+            Default is 1 (sheets are parsed one at a time)
             
         Returns
         -------
@@ -280,66 +350,82 @@ class Excel(Data_Loader):
         Note: Older Excel files (.xls) and OpenDocument file formats (.odf, .ods, .odt) are not supported. Please submit an issue if this is needed.
         '''
 
+        if engine in _csv_engines:
+            logger.debug(f"Ignoring CSV engine {engine} for Excel file")
+            engine = None
+        elif engine not in [None, *_excel_engines]:
+            raise ValueError(f"Unknown Excel engine {engine}. Engine must be 'calamine' or 'openpyxl'")
+
         logger.debug(f"Loading file from {self.url}")
-        nrows_read = offset+nrows if nrows is not None else None
-        sheets, has_year_sheets = self.__get_sheets()
+        # All rows must be read to apply filter
+        nrows_read = offset+nrows if nrows is not None and filter_expr is None else None
+        excel_file = self.__get_excel_file(engine)
+        sheets, has_year_sheets = self.__get_sheets(excel_file)
 
         date = _clean_date_input(date)
 
         if has_year_sheets:
-            date_sheets = date
-            if date_sheets==None:
+            if date==None:
                 date_sheets = list(sheets.keys())
                 date_sheets.sort()
                 date_sheets = [date_sheets[0], date_sheets[-1]]
+            else:
+                # Sheets containing the requested dates
+                date_sheets = [date[0].year, date[1].year]
 
-            table = pd.DataFrame()
+            year_sheets = [y for y in range(date_sheets[0], date_sheets[1]+1) if y in sheets]
+            dfs = []
+            num_rows = 0
             cols_added = 0
-            for y in range(date_sheets[0], date_sheets[1]+1):
-                if y in sheets:
-                    logger.debug(f"Loading data from sheet {sheets[y]}")
-                    with warnings.catch_warnings():
-                        warnings.filterwarnings("ignore", category=UserWarning, message='Data validation extension is not supported')
-                        df = pd.read_excel(self.excel_file, nrows=nrows_read, sheet_name=sheets[y])
-
-                    df = self.__clean(df, sheets[y], has_year_sheets)
-
-                    if len(table)==0:
-                        table = df
-                        col_matches = [[k] for k in range(len(df.columns))]
-                    else:
-                        if not df.columns.equals(table.columns):
-                            # Conditional for preventing column names from being too different
-                            if len(df.columns)+cols_added == len(table.columns) and \
-                                (df.columns == table.columns[:len(df.columns)]).sum()>=len(df.columns)-3-cols_added:
-                                # Try to find a typo
-                                for m in [j for j in range(len(df.columns)) if table.columns[j]!=df.columns[j]]:
-                                    for k in col_matches[m]:
-                                        if table.columns[k]==df.columns[m]:
-                                            break
-
-                                        if fuzz.ratio(table.columns[k], df.columns[m]) > 80 or \
-                                            fuzz.token_sort_ratio(table.columns[k], df.columns[m])>90:
-                                            warnings.warn(f"Identified difference in column names when combining sheets {sheets[y-1]} and {sheets[y]}. " + 
-                                                f"Column names are '{table.columns[k]}' and '{df.columns[m]}'. This appears to be a typo. " + 
-                                                f"These columns are assumed to be the same and will be combined as column '{table.columns[k]}'")
-                                            df.columns = [table.columns[k] if j==m else df.columns[j] for j in range(len(df.columns))]
-                                            break
-                                    else:
-                                        warnings.warn(f"Column '{table.columns[m]}' in current DataFrame does not match '{df.columns[m]}' in new DataFrame. "+ 
-                                            "When they are concatenated, both columns will be included.")
-                                        col_matches[m].append(len(table.columns))
-                                        cols_added+=1
-                                        # raise ValueError(f"Column {table.columns[k]} in table does not match {df.columns[k]} in df")
-                            else:
-                                raise ValueError("Columns don't match")
-                        logger.debug("Concatenating data from multiple year sheets")
-                        table = pd.concat([table, df], ignore_index=True)
-
-                    if nrows_read!=None and len(table)>=nrows_read:
-                        break
+            sheet_tables = self.__read_sheets([sheets[y] for y in year_sheets], nrows_read, engine, True, max_workers)
+            for y, df in zip(year_sheets, sheet_tables):
+                logger.debug(f"Loaded data from sheet {sheets[y]}")
+                if num_rows==0:
+                    dfs = [df]
+                    num_rows = len(df)
+                    # Columns of the combined table
+                    combined_columns = df.columns
+                    col_matches = [[k] for k in range(len(df.columns))]
+                else:
+                    if not df.columns.equals(combined_columns):
+                        # Conditional for preventing column names from being too different
+                        if len(df.columns)+cols_added == len(combined_columns) and \
+                            (df.columns == combined_columns[:len(df.columns)]).sum()>=len(df.columns)-3-cols_added:
+                            # Try to find a typo
+                            for m in [j for j in range(len(df.columns)) if combined_columns[j]!=df.columns[j]]:
+                                for k in col_matches[m]:
+                                    if combined_columns[k]==df.columns[m]:
+                                        break
+
+                                    if fuzz.ratio(combined_columns[k], df.columns[m]) > 80 or \
+                                        fuzz.token_sort_ratio(combined_columns[k], df.columns[m])>90:
+                                        warnings.warn(f"Identified difference in column names when combining sheets {sheets[y-1]} and {sheets[y]}. " + 
+                                            f"Column names are '{combined_columns[k]}' and '{df.columns[m]}'. This appears to be a typo. " + 
+                                            f"These columns are assumed to be the same and will be combined as column '{combined_columns[k]}'")
+                                        df.columns = [combined_columns[k] if j==m else df.columns[j] for j in range(len(df.columns))]
+                                        break
+                                else:
+                                    warnings.warn(f"Column '{combined_columns[m]}' in current DataFrame does not match '{df.columns[m]}' in new DataFrame. "+ 
+                                        "When they are concatenated, both columns will be included.")
+                                    col_matches[m].append(len(combined_columns))
+                                    cols_added+=1
+                                    # raise ValueError(f"Column {combined_columns[k]} in table does not match {df.columns[k]} in df")
+                        else:
+                            raise ValueError("Columns don't match")
+                    dfs.append(df)
+                    num_rows += len(df)
+                    combined_columns = combined_columns.append(df.columns[~df.columns.isin(combined_columns)])
+
+                if nrows_read!=None and num_rows>=nrows_read:
+                    break
+            # Stop parsing remaining sheets
+            sheet_tables.close()
+
+            if len(dfs)>1:
+                logger.debug("Concatenating data from multiple year sheets")
+            table = pd.concat(dfs, ignore_index=True) if len(dfs)>0 else pd.DataFrame()
         else:
-            dfs = []
+            sheet_names = []
             for s in (self.sheet if self.sheet else [None]):
                 if isinstance(s,str):
                     s = s.strip()
@@ -350,17 +436,15 @@ class Excel(Data_Loader):
                         s = s[0]
                 
                 self.__check_sheet(s, sheets)
-                sheet_name = 0 if s is None else s
-                logger.debug(f"Loading sheet: {sheet_name}")
-                table = pd.read_excel(self.excel_file, nrows=nrows_read, sheet_name=sheet_name)
-                dfs.append(table)
+                sheet_names.append(0 if s is None else s)
+            dfs = list(self.__read_sheets(sheet_names, nrows_read, engine, False, max_workers))
             table = pd.concat(dfs, ignore_index=True)
 
             if _first_time and \
                 self.url=='https://data-openjustice.doj.ca.gov/sites/default/files/dataset/2023-12/RIPA-Stop-Data-2022.zip':
                 # According to https://data-openjustice.doj.ca.gov/sites/default/files/dataset/2024-01/RIPA Dataset Read Me 2022.pdf,
                 # cases need to be added in that did not originally upload
-                with httpio.open(self.url) as fp:
+                with httpio.open(self.url, block_size=_zip_block_size, session=get_session(self.url), cache_dir=get_block_cache_dir()) as fp:
                     with ZipFile(fp) as z:
                         df = pd.read_excel(BytesIO(z.read('12312022 Supplement RIPA SD.xlsx')))
 
@@ -384,8 +468,12 @@ class Excel(Data_Loader):
         # Clean up column names
         table.columns = [x.strip() if isinstance(x, str) else x for x in table.columns]
 
+        # Columns are selected after the column names are found and the sheets are combined
+        table = _select_columns(table, _get_columns(columns, self.date_field, self.agency_field, 
+                                                    *(sorted(filter_expr.columns()) if filter_expr is not None else [])))
+
         table = _filter_dataframe(table, date_field=self.date_field, date_filter=date, 
-            agency_field=self.agency_field, agency=agency, format_date=format_date)
+            agency_field=self.agency_field, agency=agency, format_date=format_date, filter_expr=filter_expr)
         
         if offset>0:
             rows_limit = nrows_read if nrows_read is not None and nrows_read<len(table) else len(table)
@@ -398,6 +486,43 @@ class Excel(Data_Loader):
         return table
 
 
+    def _read_sheet(self, sheet_name, nrows=None, engine=None, clean=False):
+        # Parses a single sheet. clean indicates that the sheet contains a year of data that is cleaned separately.
+        excel_file = self.__get_excel_file(engine)
+        with warnings.catch_warnings():
+            warnings.filterwarnings("ignore", category=UserWarning, message='Data validation extension is not supported')
+            df = pd.read_excel(excel_file, nrows=nrows, sheet_name=sheet_name)
+
+        if clean:
+            df = self.__clean(df, sheet_name, True)
+        return df
+
+
+    def __read_sheets(self, sheet_names, nrows, engine, clean, max_workers):
+        # Generator of parsed sheets in the order of sheet_names
+        if max_workers is None or max_workers<=1 or len(sheet_names)<=1:
+            for s in sheet_names:
+                logger.debug(f"Loading sheet: {s}")
+                yield self._read_sheet(s, nrows, engine, clean)
+            return
+
+        logger.debug(f"Loading sheets {sheet_names} in {min(max_workers, len(sheet_names))} processes")
+        # Read the file before the loader is copied to the worker processes
+        self._buffer.get(self.__read_workbook)
+        with ProcessPoolExecutor(max_workers=min(max_workers, len(sheet_names)), initializer=_init_sheet_worker, initargs=(self,)) as executor:
+            futures = [executor.submit(_read_sheet_in_worker, s, nrows, engine, clean) for s in sheet_names]
+            try:
+                for f in futures:
+                    df, caught = f.result()
+                    # Warnings raised in worker processes
+                    for w in caught:
+                        warnings.warn(w)
+                    yield df
+            finally:
+                for f in futures:
+                    f.cancel()
+
+
     def __check_sheet(self, cur_sheet, sheets):
         if cur_sheet is not None and cur_sheet not in sheets:
             raise ValueError(f"Sheet {cur_sheet} not found in Excel file at {self.url}")
@@ -556,9 +681,8 @@ class Excel(Data_Loader):
             if sum([pd.notnull(x) for x in new_cols]) / len(new_cols) < 0.2 and \
                 df.iloc[col_row+1].apply(lambda x: isinstance(x,str)).all():  # Most columns are null. Check if the next rows is all strings
                 # There are likely multiple rows of columns
-                r = requests.get(self.url)
-                r.raise_for_status()
-                wb = openpyxl.load_workbook(BytesIO(r.content))
+                # Workbook is read from the contents that were already requested
+                wb = openpyxl.load_workbook(BytesIO(self._buffer.get(self.__read_workbook)))
                 if sheet_name:
                     sheet = wb[sheet_name]
                 else:
@@ -726,7 +850,7 @@ class Excel(Data_Loader):
             list containing years in data set
         '''
 
-        sheets, has_year_sheets = self.__get_sheets()
+        sheets, has_year_sheets = self.__get_sheets(self.excel_file)
 
         if has_year_sheets:
             years = list(sheets.keys())
@@ -747,3 +871,38 @@ class Excel(Data_Loader):
             else:
                 raise TypeError("Unknown date column format")
             return [int(x) for x in years]
+
+
+# Excel loader used by worker processes to parse sheets in parallel
+_worker_loader = None
+
+def _init_sheet_worker(loader):
+    global _worker_loader
+    _worker_loader = loader
+
+
+def _read_sheet_in_worker(sheet_name, nrows, engine, clean):
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        df = _worker_loader._read_sheet(sheet_name, nrows, engine, clean)
+    return df, [w.message for w in caught]
+
+
+class _WorkbookBuffer:
+    # Contents of an Excel file. Shared by copies of an Excel loader so that the file is only requested once.
+    def __init__(self):
+        self.data = None
+        self._lock = threading.Lock()
+
+    def get(self, read):
+        with self._lock:
+            if self.data is None:
+                self.data = read()
+            return self.data
+
+    def __getstate__(self):
+        return {'data':self.data}
+
+    def __setstate__(self, state):
+        self.data = state['data']
+        self._lock = threading.Lock()
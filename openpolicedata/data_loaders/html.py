@@ -1,6 +1,6 @@
 import pandas as pd
 
-from .data_loader import Data_Loader, _filter_dataframe, _clean_date_input
+from .data_loader import Data_Loader, _filter_dataframe, _clean_date_input, _get_columns, _select_columns, try_download_file
 from ..datetime_parser import to_datetime
 from .. import log
 
@@ -22,7 +22,7 @@ class Html(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True, agency=None)
+    load(date=None, nrows=None, offset=0, pbar=True, agency=None, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, agency=None, force=False)
         Get number of records/rows generated by query
@@ -58,7 +58,7 @@ class Html(Data_Loader):
         return True
 
 
-    def get_count(self, date=None, *,  agency=None, force=False, **kwargs):
+    def get_count(self, date=None, *,  agency=None, force=False, filter_expr=None, **kwargs):
         '''Get number of records for a Html data request
         
         Parameters
@@ -71,6 +71,8 @@ class Html(Data_Loader):
             (Optional) Name of agency to filter for.
         force : bool
             (Optional) get_count for HLT file will only run if force=true. In many use cases, it will be more efficient to load the file and manually get the count.
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data
             
         Returns
         -------
@@ -79,22 +81,23 @@ class Html(Data_Loader):
         '''
 
         logger.debug(f"Calculating row count for {self.url}")
-        if self._last_count is not None and self._last_count[0] == (self.url, date, agency):
+        filter_key = repr(filter_expr)
+        if self._last_count is not None and self._last_count[0] == (self.url, date, agency, filter_key):
             logger.debug("Request matches previous count request. Returning saved count.")
             return self._last_count[1]
         
         if force:
-            count = len(self.load(date=date, agency=agency))
+            count = len(self.load(date=date, agency=agency, filter_expr=filter_expr))
         else:
             raise ValueError("Extracting the number of records for a date range of a HTML website requires reading the whole file in. In most cases, "+
                 "running load() with a date argument to load in the data and manually finding the record count will be more "
                 "efficient. If running get_count with a date argument is still desired, set force=True")
         
-        self._last_count = ((self.url, date, agency), count)
+        self._last_count = ((self.url, date, agency, filter_key), count)
         return count
 
 
-    def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, format_date=True, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, pbar=True, agency=None, format_date=True, columns=None, filter_expr=None, **kwargs):
         '''Download HTML file to pandas DataFrame
         
         Parameters
@@ -114,6 +117,10 @@ class Html(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Columns to keep. The date and agency fields are always included. By default None (all columns)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression to apply to data. Columns used in the filter are always kept.
             
         Returns
         -------
@@ -128,7 +135,11 @@ class Html(Data_Loader):
         logger.debug(f"Loading file from {self.url}")
 
         header = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/126.0.0.0 Safari/537.36 Edg/126.0.0.0'}
-        table = pd.read_html(self.url, storage_options=header)
+        filename = try_download_file(self.url, pbar=pbar, headers=header)
+        if filename:
+            table = pd.read_html(filename)
+        else:
+            table = pd.read_html(self.url, storage_options=header)
                 
         if len(table)>1:
             raise ValueError(f"More than 1 table found at {self.url}")
@@ -149,9 +160,10 @@ class Html(Data_Loader):
                 if len(newvals)==len(table.columns):
                     table.loc[994,:] = newvals
 
-        
+        table = _select_columns(table, _get_columns(columns, self.date_field, self.agency_field, 
+                                                    *(sorted(filter_expr.columns()) if filter_expr is not None else [])))
         table = _filter_dataframe(table, date_field=self.date_field, date_filter=date, 
-            agency_field=self.agency_field, agency=agency, format_date=format_date)
+            agency_field=self.agency_field, agency=agency, format_date=format_date, filter_expr=filter_expr)
 
         if offset>0:
             rows_limit = offset+nrows if nrows is not None and offset+nrows<len(table) else len(table)
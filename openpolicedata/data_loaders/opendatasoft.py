@@ -3,7 +3,8 @@ import pandas as pd
 import requests
 import urllib3
 
-from .data_loader import Data_Loader, str2json, _url_error_msg, _process_date, _clean_date_input
+from .data_loader import Data_Loader, str2json, _url_error_msg, http_get, _process_date, _clean_date_input, \
+    _check_aggregate_input, _format_aggregate, _get_columns, _column_matcher, _ServerAggregateUnsupported
 from .csv_class import TqdmReader
 from ..exceptions import OPD_DataUnavailableError
 from .. import log
@@ -27,7 +28,7 @@ class Opendatasoft(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True)
+    load(date=None, nrows=None, offset=0, pbar=True, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, where=None)
         Get number of records/rows generated by query
@@ -66,6 +67,7 @@ class Opendatasoft(Data_Loader):
         self.data_set = data_set
         self.date_field = date_field
         self.query = str2json(query)
+        self._fields = None  # Names of dataset fields. Requested once and reused by later requests
 
     
     def isfile(self):
@@ -81,7 +83,7 @@ class Opendatasoft(Data_Loader):
         return f'{self.url}/{self.data_set}/records/'
 
 
-    def get_count(self, date=None, **kwargs):
+    def get_count(self, date=None, *, filter_expr=None, **kwargs):
         '''Get number of records for a data request
         
         Parameters
@@ -90,6 +92,8 @@ class Opendatasoft(Data_Loader):
             (Optional) Define timespan of data to request count for:
                 1. Request data for an entire year by inputting the year (i.e. 2023)
                 2. Request data from a start year or datetime to a stop year or datetime using a length 2 list (i.e. [2021, '2023-02-01'] for start of 2021 to end of 2023-02-01)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -99,11 +103,11 @@ class Opendatasoft(Data_Loader):
 
         date = _clean_date_input(date)
 
-        if self._last_count is not None and self._last_count[0]==date:
+        where = self.__construct_where(date, filter_expr)
+        if self._last_count is not None and self._last_count[0]==date and self._last_count[2]==where:
             logger.debug("Request matches previous count request. Returning saved count.")
             return self._last_count[1]
         else:
-            where = self.__construct_where(date)
             json = self.__request(where=where, return_count=True)
             count = json["total_count"]
 
@@ -112,7 +116,7 @@ class Opendatasoft(Data_Loader):
         return count
 
 
-    def __request(self, where=None, return_count=False, out_fields="*", out_type='csv', offset=0, count=None, pbar=False, sortby=None):
+    def __request(self, where=None, return_count=False, out_fields="*", out_type='csv', offset=0, count=None, pbar=False, sortby=None, group_by=None):
 
         query = ""
         params = {}
@@ -125,6 +129,8 @@ class Opendatasoft(Data_Loader):
 
             if sortby:
                 params['order_by'] = sortby
+            if group_by:
+                params['group_by'] = group_by
 
         if where != None:
             query+=where
@@ -156,7 +162,7 @@ class Opendatasoft(Data_Loader):
             logger.debug(f"\t{k} = {v}")
 
         if return_count:
-            r = requests.get(url, params=params)
+            r = http_get(url, params=params)
 
             try:
                 r.raise_for_status()
@@ -181,7 +187,7 @@ class Opendatasoft(Data_Loader):
                 count = params.pop('limit')
             
             try:
-                r = requests.get(url, params=params, stream=True)
+                r = http_get(url, params=params, stream=True)
                 r.raise_for_status()
             except requests.ConnectionError as e:
                 if len(e.args)>0 and isinstance(e.args[0], urllib3.exceptions.MaxRetryError):
@@ -195,21 +201,77 @@ class Opendatasoft(Data_Loader):
                 df = df.iloc[start:stop].reset_index(drop=True)
 
             return df
+        elif out_type.lower()=='json':
+            r = http_get(url, params=params)
+            r.raise_for_status()
+            return r.json()
         else:
             raise NotImplementedError(f"Unable to format output type: {out_type}")
 
 
-    def __construct_where(self, date=None):
+    def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, filter_expr=None, **kwargs):
+        '''Count records in each group with a group_by query
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to aggregate
+        group_by : str or list
+            (Optional) Field(s) to group by
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : str
+            (Optional) 'year' or 'month'. If set, results are also grouped by the year or month of the date field
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
+            
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the group_by fields, the date_part column (if requested) and the count
+        '''
+
+        group_by = _check_aggregate_input(group_by, agg, date_part, self.date_field)
+        date = _clean_date_input(date)
+        if len(group_by)==0 and not date_part:
+            return pd.DataFrame({'count':[self.get_count(date, filter_expr=filter_expr)]})
+
+        select = group_by.copy()
+        groups = group_by.copy()
+        if date_part:
+            select.append(f"{date_part}({self.date_field}) as {date_part}")
+            groups.append(f"{date_part}({self.date_field})")
+        select.append("count(*) as count")
+
+        try:
+            results = self.__request(where=self.__construct_where(date, filter_expr), out_fields=", ".join(select), out_type='json', 
+                                     group_by=", ".join(groups))
+        except requests.HTTPError as e:
+            if date_part:
+                # Date field may be text, which cannot be used in date functions
+                raise _ServerAggregateUnsupported(f"The {date_part} of date field {self.date_field} cannot be computed on the server") from e
+            raise
+        
+        df = pd.DataFrame.from_records(results, columns=group_by+([date_part] if date_part else [])+["count"])
+        return _format_aggregate(df, group_by, date_part)
+
+
+    def __construct_where(self, date=None, filter_expr=None):
         if self.date_field!=None and date!=None:
             start_date, stop_date = _process_date(date)
             where_query = f"{self.date_field} >= '{start_date}' AND {self.date_field} <= '{stop_date}'"
         else:
             where_query = None
 
+        if filter_expr is not None:
+            # Parentheses keep OR statements in filter from combining with other conditions
+            filter_sql = f"({filter_expr.to_sql('odsql')})"
+            where_query = f"{where_query} AND {filter_sql}" if where_query else filter_sql
+
         return where_query
 
     
-    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, sortby=None, **kwargs):
+    def load(self, date=None, nrows=None, offset=0, *, pbar=True, format_date=True, sortby=None, columns=None, filter_expr=None, **kwargs):
         '''Download table to pandas or geopandas DataFrame
         
         Parameters
@@ -229,6 +291,10 @@ class Opendatasoft(Data_Loader):
             to be pandas datetimes (or pandas Period in rare cases), by default True
         sortby : str
             (Optional) Columns to sort by. Allowable values: None (defaults to id) or "date"
+        columns : list, optional
+            Fields to request. The date field is always included. By default None (all fields)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -247,8 +313,19 @@ class Opendatasoft(Data_Loader):
                 warnings.warn("Date sorting was requested but no date field was provided. Resulting data will not be sorted by date")
                 sortby = None
 
-        where_query = self.__construct_where(date)
-        df = self.__request(where=where_query, offset=offset, count=nrows, pbar=pbar, sortby=sortby)
+        out_fields = "*"
+        columns = _get_columns(columns, self.date_field)
+        if columns is not None:
+            # Fields not in the dataset are ignored
+            if self._fields is None:
+                r = http_get(f'{self.url}/{self.data_set}')
+                r.raise_for_status()
+                self._fields = [x['name'] for x in r.json()['fields']]
+            match = _column_matcher(columns)
+            out_fields = ", ".join([x for x in self._fields if match(x)])
+
+        where_query = self.__construct_where(date, filter_expr)
+        df = self.__request(where=where_query, offset=offset, count=nrows, pbar=pbar, sortby=sortby, out_fields=out_fields)
         
         return df
 
@@ -9,7 +9,8 @@ from tqdm import tqdm
 import re
 
 from .data_loader import Data_Loader, _process_date, _url_error_msg, _use_gpd_force, _has_gpd, _clean_date_input, \
-    _filter_inaccurate_date_query, _setup_records_request, _is_annual_date_query
+    _filter_inaccurate_date_query, _setup_records_request, _is_annual_date_query, _build_point_geometry, _get_point_coordinates, \
+    _check_aggregate_input, _format_aggregate, _get_columns, _column_matcher, _append_filter, _ServerAggregateUnsupported
 from . import data_loader
 from ..exceptions import OPD_SocrataHTTPError
 from .. import log, datetime_parser
@@ -19,6 +20,8 @@ if _has_gpd:
 
 logger = log.get_logger()
 
+_nan_point = {"type" : "Point", "coordinates" : (nan, nan)}
+
 # This is for use if import data sets using Socrata. It is not required.
 # Requests made without an app_token will be subject to strict throttling limits
 # Get a App Token here: http://dev.socrata.com/docs/app-tokens.html
@@ -45,7 +48,7 @@ class Socrata(Data_Loader):
 
     Methods
     -------
-    load(date=None, nrows=None, offset=0, pbar=True, opt_filter=None, select=None, output_type=None)
+    load(date=None, nrows=None, offset=0, pbar=True, opt_filter=None, select=None, output_type=None, columns=None, filter_expr=None)
         Load data for query
     get_count(date=None, opt_filter=None, where=None)
         Get number of records/rows generated by query
@@ -71,9 +74,13 @@ class Socrata(Data_Loader):
         self.data_set = data_set
         self.date_field = date_field
         self.date_format = None
+        self._metadata = None  # Dataset metadata. Requested once and reused by later requests
         # Unauthenticated client only works with public data sets. Note 'None'
         # in place of application token, and no username or password:
-        self.client = SocrataClient(self.url, key, timeout=90)
+        # Requests share the pooled connections used by the other data loaders
+        api_url = self.get_api_url()
+        adapter = data_loader.get_session(api_url).get_adapter(api_url)
+        self.client = SocrataClient(self.url, key, timeout=90, session_adapter={'prefix':'https://', 'adapter':adapter})
 
 
     def __construct_where(self, date, opt_filter):
@@ -134,6 +141,10 @@ class Socrata(Data_Loader):
                 opt_filter = [opt_filter]
 
             andStr = " AND "
+            for k in range(len(where)):
+                if " OR " in where[k].where:
+                    # Ensure filters apply to all date conditions
+                    where[k].where = f"({where[k].where})"
             for filt in opt_filter:
                 for k in range(len(where)):
                     where[k].where += andStr + filt
@@ -144,6 +155,12 @@ class Socrata(Data_Loader):
         return where
     
 
+    def __get_metadata(self):
+        if self._metadata is None:
+            self._metadata = self.client.get_metadata(self.data_set)
+        return self._metadata
+
+
     def isfile(self):
         '''Returns False to indicate that Socrata data is not file-based
 
@@ -159,7 +176,7 @@ class Socrata(Data_Loader):
         return f"{url}/resource/{self.data_set}.json"
 
 
-    def get_count(self, date=None, *,  opt_filter=None, where=None, **kwargs):
+    def get_count(self, date=None, *,  opt_filter=None, where=None, filter_expr=None, **kwargs):
         '''Get number of records for a Socrata data request
         
         Parameters
@@ -172,6 +189,8 @@ class Socrata(Data_Loader):
             (Optional) Additional filter to apply to data (beyond any date filter specified by self.date_field and date)
         where: str
             (Optional) where statement for Socrata query. If None, where statement will be constructed from self.date_field, date, and opt_filter
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -182,10 +201,161 @@ class Socrata(Data_Loader):
         if pd.isnull(self.date_field) and date!=None:
             raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
 
+        opt_filter = _append_filter(opt_filter, filter_expr, 'soql')
         where = self.__get_counts(date, opt_filter, where)
         return sum(w.count for w in where)
 
 
+    def get_years(self, *, check=None, **kwargs):
+        '''Get years contained in data set
+        
+        Parameters
+        ----------
+        check : list
+            (Optional) If set, only years in check will be returned
+            
+        Returns
+        -------
+        list
+            list containing years in data set
+        '''
+
+        if self.date_field==None:
+            raise ValueError("A date field is required to get years")
+        
+        if check is not None and len(check)==0:
+            return []
+        
+        try:
+            # Date range of a full year determines whether the date field is a timestamp, number, or text
+            year = pd.Timestamp.now().year if check is None else max(check)
+            data_type, _ = self.__date_format_search(f"{year}-01-01", f"{year}-12-31")
+
+            if data_type in ['timestamp', 'numeric']:
+                # Count records in each year with a single request
+                year_expr = f"date_extract_y({self.date_field})" if data_type=='timestamp' else self.date_field
+                logger.debug(f"Request dataset {self.data_set} from {self.url}")
+                logger.debug(f"\tselect={year_expr} AS year, count(*) AS count")
+                logger.debug(f"\tgroup={year_expr}")
+                results = self.client.get(self.data_set, select=f"{year_expr} AS year, count(*) AS count", group=year_expr, 
+                                          limit=data_loader._default_limit)
+                years = [int(float(x["year"])) for x in results if "year" in x and pd.notnull(x["year"]) and int(float(x["count"]))>0]
+            else:
+                years = self.__get_text_years(check)
+        except OPD_SocrataHTTPError:
+            raise
+        except Exception as e:
+            logger.debug(f"Unable to get years with a single request ({e}). Checking years individually.")
+            return super().get_years(check=check, **kwargs)
+
+        years.sort(reverse=True)
+        if check is not None:
+            years = [x for x in years if x in check]
+
+        return years
+    
+
+    def aggregate(self, date=None, *, group_by=None, agg='count', date_part=None, opt_filter=None, filter_expr=None, **kwargs):
+        '''Count records in each group with a SoQL group query
+        
+        Parameters
+        ----------
+        date : int or a length 2 list of start and stop year(s), date string(s), and/or timestamp(s)
+            (Optional) Define timespan of data to aggregate
+        group_by : str or list
+            (Optional) Field(s) to group by
+        agg : str
+            (Optional) Aggregation to compute. Currently, only 'count' is supported.
+        date_part : str
+            (Optional) 'year' or 'month'. If set, results are also grouped by the year or month of the date field
+        opt_filter : str
+            (Optional) Additional filter to apply to the where query
+            
+        Returns
+        -------
+        pandas.DataFrame
+            Dataframe containing the group_by fields, the date_part column (if requested) and the count
+        '''
+
+        group_by = _check_aggregate_input(group_by, agg, date_part, self.date_field)
+        date = _clean_date_input(date)
+        opt_filter = _append_filter(opt_filter, filter_expr, 'soql')
+        where = self.__construct_where(date, opt_filter)
+        if any(not w.accurate for w in where):
+            raise _ServerAggregateUnsupported(f"Date field {self.date_field} cannot be filtered exactly by {date} on the server")
+
+        select = group_by.copy()
+        group = group_by.copy()
+        if date_part:
+            # Date range of a full year determines whether the date field is a timestamp, number, or text
+            year = pd.Timestamp.now().year
+            data_type, _ = self.__date_format_search(f"{year}-01-01", f"{year}-12-31")
+            if data_type=='timestamp':
+                date_expr = f"date_extract_{date_part[0]}({self.date_field})"
+            elif data_type=='numeric' and date_part=='year':
+                date_expr = self.date_field
+            else:
+                raise _ServerAggregateUnsupported(f"The {date_part} of date field {self.date_field} cannot be computed on the server")
+            select.append(f"{date_expr} AS {date_part}")
+            group.append(date_expr)
+        select.append("count(*) AS count")
+
+        select = ", ".join(select)
+        group = ", ".join(group) if len(group)>0 else None
+        logger.debug(f"Request dataset {self.data_set} from {self.url}")
+        logger.debug(f"\twhere={where}")
+        logger.debug(f"\tselect={select}")
+        logger.debug(f"\tgroup={group}")
+
+        results = []
+        for w in where:
+            try:
+                new_results = self.client.get(self.data_set, where=w.where, select=select, group=group, limit=data_loader._default_limit)
+            except (requests.HTTPError, requests.exceptions.ReadTimeout, requests.ConnectionError) as e:
+                raise OPD_SocrataHTTPError(self.url, self.data_set, *e.args, _url_error_msg.format(self.get_api_url()))
+            
+            if len(new_results)==data_loader._default_limit:
+                raise _ServerAggregateUnsupported("Number of groups exceeds the maximum number of records returned in a single request")
+            results.extend(new_results)
+
+        # Fields with null values are left out of returned records
+        df = pd.DataFrame.from_records(results, columns=group_by+([date_part] if date_part else [])+["count"])
+        return _format_aggregate(df, group_by, date_part)
+    
+
+    def __get_text_years(self, check):
+        # Counts for several years are found in a single request by summing the records that match the year query of each year
+        def count_years(years):
+            select = ", ".join([f"sum(case({self.year_where_query([y])}, 1, true, 0)) AS y{y}" for y in years])
+            logger.debug(f"Request dataset {self.data_set} from {self.url}")
+            logger.debug(f"\tselect={select}")
+            results = self.client.get(self.data_set, select=select)
+            result = results[0] if len(results)>0 else {}
+            return [y for y in years if pd.notnull(result.get(f"y{y}")) and float(result[f"y{y}"])>0]
+
+        if check is not None:
+            return count_years(check)
+        
+        # Check batches of years from newest to oldest using the same stopping criteria as Data_Loader.get_years
+        batch_size = data_loader._max_misses_gap
+        year = pd.Timestamp.now().year
+        max_misses = data_loader._oldest_recent
+        misses = 0
+        years = []
+        while misses < max_misses:
+            batch = list(range(year, year-batch_size, -1))
+            new_years = count_years(batch)
+            if len(new_years)>0:
+                misses = min(new_years) - (year-batch_size+1)   # Years in batch without data older than the oldest found year
+                max_misses = data_loader._max_misses_gap
+                years.extend(new_years)
+            else:
+                misses+=batch_size
+            year-=batch_size
+
+        return years
+
+
     def __get_counts(self, date=None, opt_filter=None, where=None):
         date = _clean_date_input(date)
 
@@ -233,7 +403,7 @@ class Socrata(Data_Loader):
 
 
     def load(self, date=None, nrows=None, offset=0, *, pbar=True, opt_filter=None, select=None, output_type=None, sortby=None, 
-             format_date=True, **kwargs):
+             format_date=True, columns=None, filter_expr=None, **kwargs):
         '''Download table from Socrata to pandas or geopandas DataFrame
         
         Parameters
@@ -259,6 +429,10 @@ class Socrata(Data_Loader):
         format_date : bool, optional
             If True, known date columns (based on presence of date_field in datasets table or data type information provided by dataset owner) will be automatically formatted
             to be pandas datetimes (or pandas Period in rare cases), by default True
+        columns : list, optional
+            Fields to request. The date field is always included. Ignored if select is set. By default None (all fields)
+        filter_expr : openpolicedata.filters.Expression
+            (Optional) Filter expression that will be added to the where query
             
         Returns
         -------
@@ -270,6 +444,7 @@ class Socrata(Data_Loader):
             raise ValueError(f'The dataset at {self.url} has no date field and therefore, cannot be filtered by date')
 
         date = _clean_date_input(date)
+        opt_filter = _append_filter(opt_filter, filter_expr, 'soql')
 
         where = self.__construct_where(date, opt_filter)
         
@@ -310,8 +485,15 @@ class Socrata(Data_Loader):
                 # https://dev.socrata.com/docs/paging.html#2.1
                 order = ":id"
 
+        columns = _get_columns(columns, self.date_field) if select==None else None
+        if columns is not None:
+            # Fields not in the dataset are ignored
+            fields = [x['fieldName'] for x in self.__get_metadata()['columns']]
+            match = _column_matcher(columns)
+            columns = [x for x in fields if match(x)]
+
         for k in range(len(where)):
-            df_cur, output_type = self._request_data(where[k].where, select, batch_sizes[k], offset if k==0 else 0, 
+            df_cur, output_type = self._request_data(where[k].where, select if columns is None else ", ".join(columns), batch_sizes[k], offset if k==0 else 0, 
                                         nrows_req[k], order, use_gpd, output_type, bar, show_pbar)
             if k==0:
                 df = df_cur
@@ -476,27 +658,21 @@ class Socrata(Data_Loader):
             elif use_gpd and output_type=="GeoDataFrame":
                 output_type = "GeoDataFrame"
                 # Presumed to be a list of properties that possibly include coordinates
-                geojson = {"type" : "FeatureCollection", "features" : []}
+                geometry = []
                 for p in results:
-                    feature = {"type" : "Feature", "properties" : p}
-                    if "geolocation" in feature["properties"]:
-                        geo = feature["properties"].pop("geolocation")
-                        if list(geo.keys()) == ["human_address"]:
-                            feature["geometry"] = {"type" : "Point", "coordinates" : (nan, nan)}  
-                        elif "coordinates" in geo:
-                            feature["geometry"] = geo
-                        else:
-                            feature["geometry"] = {"type" : "Point", "coordinates" : (float(geo["longitude"]), float(geo["latitude"]))}
-                    elif "geocoded_column" in feature["properties"]:
-                        feature["geometry"] = feature["properties"].pop("geocoded_column")
+                    if "geolocation" in p:
+                        # Locations with only human_address have NaN coordinates
+                        geometry.append(p.pop("geolocation"))
+                    elif "geocoded_column" in p:
+                        geometry.append(p.pop("geocoded_column"))
                     else:
-                        feature["geometry"] = {"type" : "Point", "coordinates" : (nan, nan)} 
-                    
-                    geojson["features"].append(feature)
+                        geometry.append(_nan_point)
 
                 if len(results)>0:
                     logger.debug("Geometry found. Contructing geopandas GeoDataFrame")
-                    new_gdf = gpd.GeoDataFrame.from_features(geojson, crs=4326)
+                    new_gdf = pd.DataFrame.from_records(results)
+                    new_gdf.insert(0, "geometry", _build_point_geometry(*_get_point_coordinates(geometry)))
+                    new_gdf = gpd.GeoDataFrame(new_gdf, geometry="geometry", crs=4326)
                         
                     if offset==start_offset:
                         df = new_gdf
@@ -525,7 +701,7 @@ class Socrata(Data_Loader):
         check_meta = True
         try:
             # Check if date is formatted as a date or is text that needs to be handled more carefully
-            meta = self.client.get_metadata(self.data_set)
+            meta = self.__get_metadata()
         except (requests.HTTPError, requests.ConnectionError) as e:
             raise OPD_SocrataHTTPError(self.url, self.data_set, *e.args, _url_error_msg.format(self.get_api_url()))
         except Exception as e:
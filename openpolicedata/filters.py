@@ -0,0 +1,326 @@
+'''Filter expressions for requesting only the rows of a table that match a condition
+
+Filter expressions are created from columns returned by col and combined with & (and), | (or), and ~ (not):
+
+>>> from openpolicedata.filters import col
+>>> where = col('race').isin(['BLACK','WHITE']) & (col('age') > 17)
+
+For data from APIs, filters are compiled to the query language of the API so that only matching rows are
+downloaded. For file-based data, filters are applied to the table after it is read.
+'''
+import datetime
+import numbers
+import operator
+import re
+import pandas as pd
+from pandas.api.types import is_numeric_dtype, is_datetime64_any_dtype
+
+from .datetime_parser import to_datetime
+
+# Query languages that filters can be compiled to
+_dialects = ['arcgis', 'soql', 'ckan', 'carto', 'odsql']
+
+_ops = {'=':operator.eq, '!=':operator.ne, '<':operator.lt, '<=':operator.le, '>':operator.gt, '>=':operator.ge}
+
+
+def col(name):
+    '''Create a column that can be used to build filter expressions
+
+    Parameters
+    ----------
+    name : str
+        Name of column
+
+    Returns
+    -------
+    Column
+        Column that can be compared to values to create filter expressions
+    '''
+    return Column(name)
+
+
+class Column:
+    '''Column of a table used to build filter expressions. Comparison operators (==, !=, <, <=, >, >=) return filter expressions.'''
+    def __init__(self, name):
+        if not isinstance(name, str) or len(name)==0:
+            raise TypeError(f"Column name must be a non-empty string not {name}")
+        self.name = name
+
+    def __repr__(self):
+        return f"col('{self.name}')"
+
+    def __eq__(self, value):
+        return _Comparison(self.name, '=', value)
+
+    def __ne__(self, value):
+        return _Comparison(self.name, '!=', value)
+
+    def __lt__(self, value):
+        return _Comparison(self.name, '<', value)
+
+    def __le__(self, value):
+        return _Comparison(self.name, '<=', value)
+
+    def __gt__(self, value):
+        return _Comparison(self.name, '>', value)
+
+    def __ge__(self, value):
+        return _Comparison(self.name, '>=', value)
+
+    __hash__ = None
+
+    def isin(self, values):
+        '''Filter for rows where column is equal to any of values'''
+        return _IsIn(self.name, values)
+
+    def isnull(self):
+        '''Filter for rows where column is null'''
+        return _IsNull(self.name)
+
+    def notnull(self):
+        '''Filter for rows where column is not null'''
+        return _IsNull(self.name, negate=True)
+
+
+class Expression:
+    '''Base class of filter expressions. Expressions are combined with & (and), | (or), and ~ (not).'''
+
+    def __and__(self, other):
+        return _BoolOp('AND', self, other)
+
+    def __or__(self, other):
+        return _BoolOp('OR', self, other)
+
+    def __invert__(self):
+        return _Not(self)
+
+    def __bool__(self):
+        raise TypeError("Filter expressions cannot be converted to bool. Use & and | instead of 'and' and 'or' and put comparisons in parentheses.")
+
+    def __repr__(self):
+        return f"{type(self).__name__.strip('_')}({self.to_sql('carto')})"
+
+    def to_sql(self, dialect):
+        '''Compile filter to a where clause
+
+        Parameters
+        ----------
+        dialect : str
+            Query language: 'arcgis' (ArcGIS SQL), 'soql' (Socrata), 'ckan' (CKAN SQL), 'carto' (Carto SQL), or 'odsql' (Opendatasoft)
+
+        Returns
+        -------
+        str
+            where clause
+        '''
+        if dialect not in _dialects:
+            raise ValueError(f"Unknown dialect {dialect}. Dialect must be one of {_dialects}")
+        return self._to_sql(dialect)
+
+    def mask(self, df):
+        '''Evaluate filter for a table
+
+        Parameters
+        ----------
+        df : pandas.DataFrame
+            Table to evaluate filter for
+
+        Returns
+        -------
+        pandas.Series
+            Boolean series that is True for rows that match the filter
+        '''
+        # Rows where the filter is unknown (i.e. comparisons with null values) do not match like in SQL
+        return self._mask(df).fillna(False).astype(bool)
+
+    def columns(self):
+        '''Get the names of the columns used in the filter'''
+        raise NotImplementedError()
+
+    def _to_sql(self, dialect):
+        raise NotImplementedError()
+
+    def _mask(self, df):
+        # Returns a nullable boolean series that is NA where the result is unknown (SQL three-valued logic)
+        raise NotImplementedError()
+
+
+class _BoolOp(Expression):
+    def __init__(self, op, left, right):
+        for x in [left, right]:
+            if not isinstance(x, Expression):
+                raise TypeError(f"Filter expressions can only be combined with other filter expressions not {x}")
+        self.op = op
+        self.left = left
+        self.right = right
+
+    def columns(self):
+        return self.left.columns() | self.right.columns()
+
+    def _to_sql(self, dialect):
+        return f"({self.left._to_sql(dialect)}) {self.op} ({self.right._to_sql(dialect)})"
+
+    def _mask(self, df):
+        if self.op=='AND':
+            return self.left._mask(df) & self.right._mask(df)
+        else:
+            return self.left._mask(df) | self.right._mask(df)
+
+
+class _Not(Expression):
+    def __init__(self, expr):
+        self.expr = expr
+
+    def columns(self):
+        return self.expr.columns()
+
+    def _to_sql(self, dialect):
+        return f"NOT ({self.expr._to_sql(dialect)})"
+
+    def _mask(self, df):
+        # NOT of an unknown result is still unknown
+        return ~self.expr._mask(df)
+
+
+class _Comparison(Expression):
+    def __init__(self, name, op, value):
+        _check_value(value)
+        if op in ['=','!='] and pd.isnull(value):
+            raise ValueError("Use isnull or notnull to filter for null values")
+        self.name = name
+        self.op = op
+        self.value = value
+
+    def columns(self):
+        return {self.name}
+
+    def _to_sql(self, dialect):
+        op = '<>' if self.op=='!=' and dialect=='arcgis' else self.op
+        return f"{_identifier(self.name, dialect)} {op} {_literal(self.value, dialect)}"
+
+    def _mask(self, df):
+        series, value = _coerce(_get_column(df, self.name), self.value)
+        # Comparisons with null values are unknown in SQL
+        return _unknown_if_null(_ops[self.op](series, value), series)
+
+
+class _IsIn(Expression):
+    def __init__(self, name, values):
+        if isinstance(values, (str, bytes)) or not hasattr(values, '__iter__'):
+            raise TypeError(f"isin requires a list of values not {values}")
+        values = list(values)
+        if len(values)==0:
+            raise ValueError("isin requires at least 1 value")
+        for v in values:
+            _check_value(v)
+        self.name = name
+        self.values = values
+
+    def columns(self):
+        return {self.name}
+
+    def _to_sql(self, dialect):
+        name = _identifier(self.name, dialect)
+        if dialect=='odsql':
+            # ODSQL does not support IN for lists of values
+            return " OR ".join([f"{name} = {_literal(v, dialect)}" for v in self.values])
+        return f"{name} IN ({', '.join([_literal(v, dialect) for v in self.values])})"
+
+    def _mask(self, df):
+        series, _ = _coerce(_get_column(df, self.name), self.values[0])
+        values = [_coerce(series, v)[1] for v in self.values]
+        return _unknown_if_null(series.isin(values), series)
+
+
+class _IsNull(Expression):
+    def __init__(self, name, negate=False):
+        self.name = name
+        self.negate = negate
+
+    def columns(self):
+        return {self.name}
+
+    def _to_sql(self, dialect):
+        return f"{_identifier(self.name, dialect)} IS {'NOT ' if self.negate else ''}NULL"
+
+    def _mask(self, df):
+        series = _get_column(df, self.name)
+        return (series.notnull() if self.negate else series.isnull()).astype('boolean')
+
+
+def _unknown_if_null(result, series):
+    # Converts result to a nullable boolean series that is NA where series is null
+    result = result.astype('boolean')
+    result[series.isnull().to_numpy()] = pd.NA
+    return result
+
+
+def _check_value(value):
+    if not isinstance(value, (str, numbers.Number, datetime.date, pd.Timestamp)) and value is not None:
+        raise TypeError(f"Unsupported filter value {value} of type {type(value)}")
+
+
+def _identifier(name, dialect):
+    if dialect=='ckan':
+        # Column names are case-sensitive and are quoted
+        return '"' + name.replace('"','""') + '"'
+    elif dialect in ['soql','odsql'] and not re.search(r'^[A-Za-z_][A-Za-z0-9_]*$', name):
+        return f"`{name}`"
+    else:
+        return name
+
+
+def _literal(value, dialect):
+    if isinstance(value, bool):
+        if dialect=='arcgis':
+            return '1' if value else '0'
+        return 'true' if value else 'false'
+    elif isinstance(value, numbers.Number):
+        if pd.isnull(value):
+            raise ValueError("NaN cannot be used in a filter. Use isnull or notnull instead.")
+        return str(value)
+    elif isinstance(value, (datetime.date, pd.Timestamp)):
+        value = pd.Timestamp(value)
+        if dialect=='arcgis':
+            return f"timestamp '{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+        elif dialect=='soql':
+            return f"'{value.strftime('%Y-%m-%dT%H:%M:%S')}'"
+        elif dialect=='odsql':
+            return f"date'{value.strftime('%Y-%m-%dT%H:%M:%S')}'"
+        else:
+            return f"'{value.strftime('%Y-%m-%d %H:%M:%S')}'"
+    else:
+        return "'" + value.replace("'","''") + "'"
+
+
+def _get_column(df, name):
+    if name in df:
+        return df[name]
+
+    # Capitalization of column names sometimes changes
+    matches = [x for x in df.columns if isinstance(x,str) and x.lower()==name.lower()]
+    if len(matches)==1:
+        return df[matches[0]]
+
+    raise KeyError(f"Filter column {name} not found in table")
+
+
+def _coerce(series, value):
+    # Convert column to the type of the value (i.e. numbers stored as text in CSV files)
+    if isinstance(value, bool):
+        return series, value
+    elif isinstance(value, numbers.Number):
+        if not is_numeric_dtype(series):
+            series = pd.to_numeric(series, errors='coerce')
+    elif isinstance(value, (datetime.date, pd.Timestamp)):
+        value = pd.Timestamp(value)
+        if not is_datetime64_any_dtype(series):
+            series = to_datetime(series, ignore_errors=True)
+            if not is_datetime64_any_dtype(series):
+                series = pd.to_datetime(series, errors='coerce')
+        if getattr(series.dt, 'tz', None) is not None and value.tz is None:
+            value = value.tz_localize(series.dt.tz)
+    elif isinstance(value, str) and not (pd.api.types.is_string_dtype(series) or pd.api.types.is_object_dtype(series)):
+        series = series.astype(str).where(series.notnull())
+
+    return series, value
@@ -1,10 +1,16 @@
 from __future__ import absolute_import
 
-import re
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import json
+import os
 import requests
+import threading
 import urllib.request
 
 from io import BufferedIOBase
+from io import open as _open  # open is redefined by this module
 
 from six import PY3
 from sys import version_info
@@ -30,17 +36,38 @@ req_headers = {
         }
 
 
-def open(url, block_size=-1, **kwargs):
+# Default maximum number of bytes of blocks to cache per file
+default_cache_size = 256 * 2**20
+
+# Missing ranges of blocks separated by at most this many cached blocks are requested together
+_max_coalesce_gap = 2
+
+
+def open(url, block_size=-1, session=None, cache_size=None, read_ahead=0, read_ahead_workers=2, cache_dir=None, **kwargs):
     """
     Open a URL as a file-like object
 
     :param url: The URL of the file to open
     :param block_size: The cache block size, or `-1` to disable caching.
+    :param session: (Optional) `requests.Session` to use for requests. It will
+        not be closed when the file is closed.
+    :param cache_size: (Optional) Maximum number of bytes to cache. The least
+        recently used blocks are removed when the cache is full. Default is
+        `default_cache_size`.
+    :param read_ahead: (Optional) Number of blocks to request in the background
+        after sequential reads. Default is 0 (no read-ahead).
+    :param read_ahead_workers: (Optional) Number of threads requesting blocks
+        in the background.
+    :param cache_dir: (Optional) Directory where requested blocks are saved.
+        Blocks are reused by later opens of the same URL if its ETag and
+        length have not changed. Only used by servers that report an ETag.
+        Requires a positive `block_size`.
     :param kwargs: Additional arguments to pass to `requests.Request()`
     :return: An `httpio.HTTPIOFile` object supporting most of the usual
         file-like object methods.
     """
-    f = HTTPIOFile(url, block_size, **kwargs)
+    f = HTTPIOFile(url, block_size, session=session, cache_size=cache_size, read_ahead=read_ahead,
+                   read_ahead_workers=read_ahead_workers, cache_dir=cache_dir, **kwargs)
     f.open()
     return f
 
@@ -50,15 +77,31 @@ class HTTPIOError(IOBaseError):
 
 
 class SyncHTTPIOFile(BufferedIOBase):
-    def __init__(self, url, block_size=-1, **kwargs):
+    def __init__(self, url, block_size=-1, session=None, cache_size=None, read_ahead=0, read_ahead_workers=2,
+                 cache_dir=None, **kwargs):
         super(SyncHTTPIOFile, self).__init__()
+        if cache_dir is not None and block_size <= 0:
+            raise ValueError("A positive block_size is required to save blocks to cache_dir")
         self.url = url
         self.block_size = block_size
+        self.read_ahead = read_ahead
+        self.read_ahead_workers = read_ahead_workers
+
+        cache_size = default_cache_size if cache_size is None else cache_size
+        self._max_cache_blocks = max(1, cache_size // block_size) if block_size > 0 else 0
 
         self._kwargs = kwargs
         self._cursor = 0
-        self._cache = {}
+        # Least recently used blocks are first
+        self._cache = OrderedDict()
+        # Futures of blocks being read ahead
+        self._pending = {}
+        self._lock = threading.RLock()
+        self._executor = None
+        self._last_read_end = None
+        self._disk_cache = _DiskCache(cache_dir, url) if cache_dir is not None else None
         self._session = None
+        self._shared_session = session
 
         self.length = None
 
@@ -75,9 +118,12 @@ class SyncHTTPIOFile(BufferedIOBase):
     def open(self):
         self._assert_not_closed()
         if not self._closing and self._session is None:
-            self._session = requests.Session()
+            self._session = self._shared_session if self._shared_session is not None else requests.Session()
             
-            response = self._session.head(self.url, **self._kwargs)
+            # Conditional request to check whether blocks saved to disk are still valid
+            cached_etag = self._disk_cache.etag if self._disk_cache is not None else None
+            response = self._session.head(self.url,
+                **self._get_kwargs({"If-None-Match": cached_etag} if cached_etag else None))
             try:
                 response.raise_for_status()
             except requests.exceptions.HTTPError as e:
@@ -93,7 +139,9 @@ class SyncHTTPIOFile(BufferedIOBase):
             except:
                 raise
 
-            if self.length==None:
+            if self.length==None and cached_etag and getattr(response, 'status_code', None)==304:
+                self.length = self._disk_cache.length
+            elif self.length==None:
                 self.length = response.headers.get('Content-Length', None)
                 if self.length:
                     self.length = int(self.length)
@@ -103,17 +151,28 @@ class SyncHTTPIOFile(BufferedIOBase):
                 if response.headers.get('Accept-Ranges', '').lower() != 'bytes':
                     raise HTTPIOError("Server does not accept 'Range' headers")
 
+                if self._disk_cache is not None:
+                    self._disk_cache.validate(response.headers.get('ETag'), self.length)
+
     def close(self):
         self._closing = True
-        self._cache.clear()
-        if self._session is not None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            self._cache.clear()
+            self._pending.clear()
+            if self._disk_cache is not None:
+                self._disk_cache.close()
+        if self._session is not None and self._session is not self._shared_session:
             self._session.close()
         super(SyncHTTPIOFile, self).close()
 
     def flush(self):
         self._assert_not_closed()
         self.open()
-        self._cache.clear()
+        with self._lock:
+            self._cache.clear()
 
     def peek(self, size=-1):
         loc = self.tell()
@@ -180,6 +239,7 @@ class SyncHTTPIOFile(BufferedIOBase):
                                               max_raw_reads=max_raw_reads))
 
         self._cursor += len(data)
+        self._last_read_end = self._cursor
         return data
 
     def _readinto_impl(self, b, max_raw_reads=-1):
@@ -196,6 +256,7 @@ class SyncHTTPIOFile(BufferedIOBase):
 
         if self.block_size <= 0:
             b[:size] = self._read_raw(self._cursor, self._cursor + size)
+            self._cursor += size
             return size
 
         else:
@@ -205,6 +266,8 @@ class SyncHTTPIOFile(BufferedIOBase):
                 b[n:n+len(sector)] = sector
                 n += len(sector)
 
+            self._cursor += n
+            self._last_read_end = self._cursor
             return n
 
     def _read_cached(self, size, max_raw_reads=-1):
@@ -212,47 +275,147 @@ class SyncHTTPIOFile(BufferedIOBase):
         sector1, offset1 = divmod(self._cursor + size - 1, self.block_size)
         offset1 += 1
         sector1 += 1
+        sequential = self._cursor == self._last_read_end
+
+        # Blocks needed for this read are kept here so that they are not removed from the cache before they are used
+        blocks = self._wait_for_read_ahead(range(sector0, sector1))
+        blocks.update(self._read_disk_blocks(range(sector0, sector1), blocks))
 
         # Fetch any sectors missing from the cache
-        status = "".join(str(int(idx in self._cache))
-                         for idx in range(sector0, sector1))
         raw_reads = 0
-        for match in re.finditer("0+", status):
+        for start, end in self._get_missing_ranges(sector0, sector1, blocks):
             if max_raw_reads >= 0 and raw_reads >= max_raw_reads:
                 break
 
-            data = self._read_raw(
-                self.block_size * (sector0 + match.start()),
-                self.block_size * (sector0 + match.end()))
+            blocks.update(self._fetch_blocks(start, end))
             raw_reads += 1
 
-            for idx in range(match.end() - match.start()):
-                self._cache[sector0 + idx + match.start()] = data[
-                    self.block_size * idx:
-                    self.block_size * (idx + 1)]
-
         data = []
         for idx in range(sector0, sector1):
-            if idx not in self._cache:
+            block = blocks[idx] if idx in blocks else self._get_cached_block(idx)
+            if block is None:
                 break
 
             start = offset0 if idx == sector0 else None
             end = offset1 if idx == (sector1 - 1) else None
-            data.append(self._cache[idx][start:end])
+            data.append(block[start:end])
+
+        if self.read_ahead > 0 and sequential:
+            self._start_read_ahead(sector1)
 
         return data
 
+    def _get_cached_block(self, idx):
+        with self._lock:
+            if idx not in self._cache:
+                return None
+            self._cache.move_to_end(idx)
+            return self._cache[idx]
+
+    def _get_missing_ranges(self, sector0, sector1, blocks):
+        # Returns ranges of blocks to request. Ranges separated by a few cached blocks are combined
+        # into a single request because an extra request takes longer than reading a few extra blocks.
+        ranges = []
+        with self._lock:
+            for idx in range(sector0, sector1):
+                if idx in blocks or idx in self._cache:
+                    continue
+                if len(ranges) > 0 and idx - ranges[-1][1] <= _max_coalesce_gap:
+                    ranges[-1][1] = idx + 1
+                else:
+                    ranges.append([idx, idx + 1])
+        return ranges
+
+    def _fetch_blocks(self, start, end):
+        data = self._read_raw(self.block_size * start, self.block_size * end)
+        blocks = {}
+        for idx in range(end - start):
+            blocks[start + idx] = data[self.block_size * idx: self.block_size * (idx + 1)]
+
+        with self._lock:
+            self._add_to_cache(blocks)
+            for idx in blocks:
+                self._pending.pop(idx, None)
+            if self._disk_cache is not None and not self._closing:
+                self._disk_cache.write(self.block_size * start, data)
+
+        return blocks
+
+    def _add_to_cache(self, blocks):
+        with self._lock:
+            for idx, block in blocks.items():
+                self._cache[idx] = block
+                self._cache.move_to_end(idx)
+            while len(self._cache) > self._max_cache_blocks:
+                self._cache.popitem(last=False)
+
+    def _is_on_disk(self, idx):
+        return self._disk_cache is not None and \
+            self._disk_cache.contains(self.block_size * idx, min(self.block_size * (idx + 1), self.length))
+
+    def _read_disk_blocks(self, sectors, blocks):
+        disk_blocks = {}
+        if self._disk_cache is None:
+            return disk_blocks
+
+        with self._lock:
+            for idx in sectors:
+                if idx not in blocks and idx not in self._cache and self._is_on_disk(idx):
+                    start = self.block_size * idx
+                    disk_blocks[idx] = self._disk_cache.read(start, min(start + self.block_size, self.length))
+            self._add_to_cache(disk_blocks)
+
+        return disk_blocks
+
+    def _start_read_ahead(self, sector):
+        num_blocks = -(-self.length // self.block_size)
+        with self._lock:
+            if self._closing:
+                return
+            missing = [idx for idx in range(sector, min(sector + self.read_ahead, num_blocks))
+                       if idx not in self._cache and idx not in self._pending and not self._is_on_disk(idx)]
+            if len(missing) == 0:
+                return
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.read_ahead_workers)
+
+            # Request each block separately so that blocks can be requested in parallel
+            for idx in missing:
+                self._pending[idx] = self._executor.submit(self._fetch_blocks, idx, idx + 1)
+
+    def _wait_for_read_ahead(self, sectors):
+        blocks = {}
+        with self._lock:
+            futures = {idx: self._pending[idx] for idx in sectors if idx in self._pending}
+
+        for idx, future in futures.items():
+            try:
+                blocks.update(future.result())
+            except Exception:
+                # Block will be requested again
+                with self._lock:
+                    self._pending.pop(idx, None)
+
+        return {k: v for k, v in blocks.items() if k in sectors}
+
     def _read_raw(self, start, end):
-        headers = {"Range": "bytes=%d-%d" % (start, end - 1)}
-        headers.update(self._kwargs.get("headers", {}))
-        kwargs = dict(self._kwargs)
-        kwargs['headers'] = headers
         response = self._session.get(
             self.url,
-            **kwargs)
+            **self._get_kwargs({"Range": "bytes=%d-%d" % (start, end - 1)}))
         response.raise_for_status()
         return response.content
 
+    def _get_kwargs(self, headers=None):
+        # Byte ranges and content length refer to the uncompressed file so compressed responses must not be requested
+        req_headers = {"Accept-Encoding": "identity"}
+        if headers:
+            req_headers.update(headers)
+        req_headers.update(self._kwargs.get("headers", {}))
+        kwargs = dict(self._kwargs)
+        kwargs['headers'] = req_headers
+        return kwargs
+
     def _assert_not_closed(self):
         if self.closed:
             raise HTTPIOError("I/O operation on closed resource")
@@ -268,6 +431,94 @@ class _UrlResponse:
     def raise_for_status(self):
         pass
 
+class _DiskCache:
+    # Blocks of a URL saved to a sparse file. The byte ranges that have been saved are
+    # stored in a JSON file along with the ETag and length of the URL's content. The JSON
+    # file is only updated with newly saved ranges when the cache is closed.
+    def __init__(self, cache_dir, url):
+        name = hashlib.sha256(url.encode()).hexdigest()
+        self._data_file = os.path.join(cache_dir, name + '.bin')
+        self._info_file = os.path.join(cache_dir, name + '.json')
+        self._file = None
+        self._modified = False
+
+        self.info = None
+        if os.path.exists(self._info_file) and os.path.exists(self._data_file):
+            try:
+                with _open(self._info_file, 'r') as f:
+                    self.info = json.load(f)
+            except ValueError:
+                pass
+
+    @property
+    def etag(self):
+        return self.info['etag'] if self.info else None
+
+    @property
+    def length(self):
+        return self.info['length'] if self.info else None
+
+    def validate(self, etag, length):
+        if not etag:
+            # Changes to the content cannot be detected without an ETag
+            self.info = None
+            return
+
+        if self.info is None or self.info['etag'] != etag or self.info['length'] != length:
+            self.info = {'etag': etag, 'length': length, 'ranges': []}
+            os.makedirs(os.path.dirname(self._data_file), exist_ok=True)
+            with _open(self._data_file, 'wb') as f:
+                f.truncate(length)
+            self._save_info()
+
+    def contains(self, start, end):
+        return self.info is not None and \
+            any(r[0] <= start and end <= r[1] for r in self.info['ranges'])
+
+    def read(self, start, end):
+        f = self._open_file()
+        f.seek(start)
+        return f.read(end - start)
+
+    def write(self, start, data):
+        if self.info is None or len(data) == 0:
+            return
+
+        f = self._open_file()
+        f.seek(start)
+        f.write(data)
+
+        # Merge overlapping and adjacent ranges
+        ranges = []
+        for r in sorted(self.info['ranges'] + [[start, start + len(data)]]):
+            if len(ranges) > 0 and r[0] <= ranges[-1][1]:
+                ranges[-1][1] = max(ranges[-1][1], r[1])
+            else:
+                ranges.append(list(r))
+        self.info['ranges'] = ranges
+        self._modified = True
+
+    def close(self):
+        if self._file is not None:
+            # Data is written before the ranges that it is saved in
+            self._file.close()
+            self._file = None
+        if self._modified:
+            self._save_info()
+            self._modified = False
+
+    def _open_file(self):
+        if self._file is None:
+            self._file = _open(self._data_file, 'r+b')
+        return self._file
+
+    def _save_info(self):
+        tmp_file = self._info_file + '.tmp'
+        with _open(tmp_file, 'w') as f:
+            json.dump(self.info, f)
+        os.replace(tmp_file, self._info_file)
+
+
 class _UrlSession:
     def __init__(self, url, headers) -> None:
         req_info = urllib.request.Request(url, headers=headers)
@@ -2547,9 +2547,7 @@ def california_ori2agency(col, year, unknown='ignore'):
     try:
         ori_df = reader(data[0], index_col=data[2])
     except urllib.error.URLError:
-        with data_loaders.data_loader.get_legacy_session() as session:
-            r = session.get(data[0])
-            
+        r = data_loaders.data_loader.get_legacy_session(data[0]).get(data[0])
         r.raise_for_status()
         file_like = BytesIO(r.content)
         ori_df = reader(file_like, index_col=data[2])
@@ -5,6 +5,7 @@ import sys
 if __name__ == "__main__":
 	sys.path.append('../openpolicedata')
 from openpolicedata import data_loaders
+import openpolicedata as opd
 import pandas as pd
 try:
     import geopandas as gpd
@@ -13,6 +14,11 @@ except:
     _has_gpd = False
 
 import warnings
+import re
+from math import ceil
+import numpy as np
+import struct
+import time
 warnings.filterwarnings(action='ignore', module='arcgis')
 
 def test_arcgis_two_digit_year_text_date_query(monkeypatch):
@@ -50,3 +56,360 @@ def test_arcgis_two_digit_year_text_date_query(monkeypatch):
     assert "DATE_REPORTED LIKE '_/_/18 %'" in where_query
     assert "DATE_REPORTED LIKE '__/__/18'" in where_query
     assert "2018" not in where_query
+
+
+@pytest.mark.parametrize('max_workers', [1, 4])
+def test_arcgis_load_batches_in_order(monkeypatch, max_workers):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = None
+    loader.query = {}
+    loader._last_count = None
+    loader.max_record_count = 10
+    loader.is_table = True
+
+    nrecords = 95
+
+    def request_stub(where=None, return_count=False, offset=0, count=None, **kwargs):
+        if return_count:
+            return {"count": nrecords}
+        return {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+                "features": [{"attributes": {"OBJECTID": k}} for k in range(offset, min(offset+count, nrecords))]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+
+    df = loader.load(pbar=False, max_workers=max_workers)
+
+    assert df["OBJECTID"].tolist()==list(range(nrecords))
+
+
+def test_arcgis_metadata_requested_once(monkeypatch):
+    url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    meta = {"type": "Feature Layer", "maxRecordCount": 50000, "geometryType": "esriGeometryPoint",
+            "objectIdField": "FID", "supportedQueryFormats": "JSON, geoJSON, PBF",
+            "advancedQueryCapabilities": {"supportsPagination": False},
+            "fields": [{"name": "FID", "type": "esriFieldTypeOID"}, {"name": "Date", "type": "esriFieldTypeDate"}]}
+    requests_made = []
+
+    class ResponseStub:
+        def __init__(self, result):
+            self.result = result
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return self.result
+
+    def http_get_stub(url, params=None, **kwargs):
+        requests_made.append((url, params))
+        return ResponseStub(meta if url==url_base else {"count": 3})
+    
+    url_base = url + "/"
+    monkeypatch.setattr(data_loaders.arcgis_class, "http_get", http_get_stub)
+
+    loader = data_loaders.Arcgis(url, date_field="DATE")
+
+    assert loader.metadata.objectid_field=="FID"
+    assert loader.metadata.date_type=="esriFieldTypeDate"
+    assert loader.metadata.geometry_type=="esriGeometryPoint"
+    assert loader.metadata.supported_query_formats==("JSON", "geoJSON", "PBF")
+    assert not loader.metadata.supports_pagination
+    assert loader.max_record_count==32000
+    assert not loader.is_table
+
+    assert loader.get_count(date=[pd.Timestamp("2020-01-01"), pd.Timestamp("2020-12-31")])==3
+    # Only the initial metadata request and the count request. The date type is known from the metadata
+    assert len(requests_made)==2
+    assert requests_made[1][1]["where"].startswith("DATE >= '2020-01-01' AND  DATE <= '2020-12-31")
+
+    # Protocol buffer format is only used if it is enabled
+    assert not loader._use_pbf
+    monkeypatch.setattr(data_loaders.arcgis_class, "use_pbf", True)
+    assert data_loaders.Arcgis(url, date_field="DATE")._use_pbf
+
+
+@pytest.mark.parametrize('objectid_paging', [True, False])
+def test_arcgis_load_objectid_paging(monkeypatch, objectid_paging):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = None
+    loader.query = {}
+    loader._last_count = None
+    loader.max_record_count = 10
+    loader.is_table = True
+    loader.metadata = data_loaders.arcgis_class.LayerMetadata([], objectid_field="OBJECTID", supports_pagination=not objectid_paging)
+    loader._objectid_paging = objectid_paging
+
+    # IDs are not continuous
+    ids = [k for k in range(200) if k%3!=0]
+    where_queries = []
+    failed_offsets = []
+
+    def request_stub(where=None, return_count=False, return_ids=False, offset=0, count=None, **kwargs):
+        if return_count:
+            return {"count": len(ids)}
+        elif return_ids:
+            return {"objectIdFieldName": "OBJECTID", "objectIds": ids[::-1]}
+        
+        where_queries.append(where)
+        m = re.search(r"OBJECTID >= (\d+) AND OBJECTID <= (\d+)", where)
+        if m:
+            features = [k for k in ids if int(m.group(1))<=k<=int(m.group(2))][::-1]
+        elif offset>=50:
+            # Server times out for large offsets
+            failed_offsets.append(offset)
+            time.sleep(0.02)
+            raise requests.exceptions.ReadTimeout("Read timed out")
+        else:
+            features = ids[offset:offset+count]
+        return {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+                "features": [{"attributes": {"OBJECTID": k}} for k in features]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+    monkeypatch.setattr(data_loaders.arcgis_class, "sleep", lambda x: None)
+
+    offset = 5 if objectid_paging else 0
+    if not objectid_paging:
+        # Records would be ordered differently than previous requests with offsets if paging switched to OBJECTID ranges
+        with pytest.raises(opd.exceptions.OPD_DataUnavailableError):
+            loader.load(offset=5, pbar=False, max_workers=2)
+        assert not loader._objectid_paging
+        # Batches after the failed batch are not requested
+        assert len(failed_offsets) < 10
+
+    df = loader.load(offset=offset, pbar=False, max_workers=2)
+
+    assert df["OBJECTID"].tolist()==ids[offset:]
+    assert loader._objectid_paging
+    assert all(x.startswith("(1=1) AND OBJECTID >= ") for x in where_queries[-ceil((len(ids)-offset)/10):])
+
+
+def _pb_varint(n):
+    out = b""
+    while True:
+        b = n & 0x7f
+        n >>= 7
+        if n:
+            out += bytes([b | 0x80])
+        else:
+            return out + bytes([b])
+
+def _pb_field(num, value):
+    # Encodes int as varint, float as double, and bytes/str as length-delimited
+    if isinstance(value, float):
+        return _pb_varint(num << 3 | 1) + struct.pack('<d', value)
+    elif isinstance(value, int):
+        return _pb_varint(num << 3) + _pb_varint(value)
+    value = value.encode() if isinstance(value, str) else value
+    return _pb_varint(num << 3 | 2) + _pb_varint(len(value)) + value
+
+def _pb_zigzag(n):
+    return (n << 1) ^ (n >> 63)
+
+
+def test_arcgis_decode_pbf():
+    fields = _pb_field(13, _pb_field(1, "OBJECTID") + _pb_field(2, 6)) + \
+        _pb_field(13, _pb_field(1, "Date") + _pb_field(2, 5)) + \
+        _pb_field(13, _pb_field(1, "Race") + _pb_field(2, 4))
+    transform = _pb_field(12, _pb_field(1, 0) + _pb_field(2, _pb_field(1, 0.5) + _pb_field(2, 0.25)) + 
+                          _pb_field(3, _pb_field(1, -100.0) + _pb_field(2, 40.0)))
+    coords = _pb_varint(_pb_zigzag(10)) + _pb_varint(_pb_zigzag(-8))
+    features = _pb_field(15, _pb_field(1, _pb_field(5, 1)) + _pb_field(1, _pb_field(8, _pb_zigzag(1577836800000))) + 
+                         _pb_field(1, _pb_field(1, "WHITE")) + _pb_field(2, _pb_field(3, coords))) + \
+        _pb_field(15, _pb_field(1, _pb_field(5, 2)) + _pb_field(1, b"") + _pb_field(1, _pb_field(1, "BLACK")))
+    content = _pb_field(1, "1.0") + _pb_field(2, _pb_field(1, fields + transform + _pb_field(8, _pb_field(1, 4326)) + features))
+
+    result = data_loaders.arcgis_pbf.decode_feature_collection(content)
+
+    assert [x["type"] for x in result["fields"]]==["esriFieldTypeOID", "esriFieldTypeDate", "esriFieldTypeString"]
+    assert result["spatialReference"]["wkid"]==4326
+    assert result["columns"]["OBJECTID"].tolist()==[1,2]
+    assert result["columns"]["Date"][0]==1577836800000
+    assert pd.isnull(result["columns"]["Date"][1])
+    assert result["columns"]["Race"].tolist()==["WHITE", "BLACK"]
+    assert result["has_geometry"].tolist()==[True, False]
+    assert result["x"][0]==-95.0
+    assert result["y"][0]==42.0
+    assert pd.isnull(result["x"][1])
+
+    with pytest.raises(data_loaders.arcgis_pbf.PbfDecodeError):
+        data_loaders.arcgis_pbf.decode_feature_collection(content[:-5])
+
+
+@pytest.mark.parametrize('use_pbf', [True, False])
+def test_arcgis_load_pbf(monkeypatch, use_pbf):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = None
+    loader.query = {}
+    loader._last_count = None
+    loader.max_record_count = 2
+    loader.is_table = False
+    loader._use_pbf = use_pbf
+
+    pbf_result = {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}], "spatialReference": {"wkid": 4326},
+                  "columns": {"OBJECTID": np.array([1, 2])}, "x": np.array([-95.0, np.nan]), "y": np.array([42.0, np.nan]),
+                  "has_geometry": np.array([True, False])}
+    json_result = {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}], "spatialReference": {"wkid": 4326},
+                   "features": [{"attributes": {"OBJECTID": 1}, "geometry": {"x": -95.0, "y": 42.0}}, {"attributes": {"OBJECTID": 2}}]}
+    out_types = []
+
+    def request_stub(where=None, return_count=False, out_type="json", **kwargs):
+        if return_count:
+            return {"count": 2}
+        out_types.append(out_type)
+        return pbf_result if out_type=="pbf" else json_result
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+
+    df = loader.load(pbar=False)
+
+    assert out_types==["pbf" if use_pbf else "json"]
+    assert df["OBJECTID"].tolist()==[1,2]
+    if _has_gpd:
+        assert df.geometry.iloc[0].x==-95.0
+        assert df.geometry.iloc[1] is None
+    else:
+        assert df["geolocation"].iloc[0]=={"x": -95.0, "y": 42.0}
+        assert df["geolocation"].iloc[1] is None
+
+
+def test_arcgis_load_pbf_fallback(monkeypatch):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = None
+    loader.query = {}
+    loader._last_count = None
+    loader.max_record_count = 2
+    loader.is_table = True
+    loader._use_pbf = True
+    out_types = []
+
+    def request_stub(where=None, return_count=False, out_type="json", offset=0, count=None, **kwargs):
+        if return_count:
+            return {"count": 7}
+        out_types.append(out_type)
+        if out_type=="pbf":
+            raise data_loaders.arcgis_pbf.PbfDecodeError("Protocol buffer message is truncated")
+        return {"fields": [{"name": "OBJECTID", "type": "esriFieldTypeOID"}],
+                "features": [{"attributes": {"OBJECTID": k}} for k in range(offset, min(offset+count, 7))]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+
+    df = loader.load(pbar=False, max_workers=2)
+
+    assert df["OBJECTID"].tolist()==list(range(7))
+    assert not loader._use_pbf
+    # Format is decided by the 1st batch before the other batches are requested
+    assert out_types==["pbf"] + ["json"]*4
+
+
+@pytest.mark.parametrize('server_error', [False, True])
+def test_arcgis_get_years_statistics(monkeypatch, server_error):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = "Date"
+    loader.query = {}
+    loader._last_count = None
+    loader._date_type = "esriFieldTypeDate"
+    loader.metadata = data_loaders.arcgis_class.LayerMetadata([], objectid_field="OBJECTID")
+
+    requests_made = []
+    def request_stub(where=None, out_statistics=None, group_by=None, **kwargs):
+        requests_made.append(group_by)
+        if server_error:
+            raise data_loaders.arcgis_class.OPD_DataUnavailableError(loader.url, 'Error returned by ArcGIS query', 'code', 400)
+        assert out_statistics[0]["onStatisticField"]=="OBJECTID"
+        return {"features": [{"attributes": {"EXPR_1": 2019, "opd_count": 5}}, {"attributes": {"EXPR_1": None, "opd_count": 2}},
+                             {"attributes": {"EXPR_1": 2021.0, "opd_count": 10}}]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+    monkeypatch.setattr(loader, "get_count", lambda date: 1 if date in [2019, 2021] else 0)
+    monkeypatch.setattr(data_loaders.data_loader, "sleep_time", 0)
+
+    assert loader.get_years(check=[2019, 2020, 2021])==[2021, 2019]
+    assert requests_made==["EXTRACT(YEAR FROM Date)"]
+
+
+def test_arcgis_aggregate(monkeypatch):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = "Date"
+    loader.query = {}
+    loader._last_count = None
+    loader._date_type = "esriFieldTypeDate"
+    loader.metadata = data_loaders.arcgis_class.LayerMetadata([], objectid_field="OBJECTID")
+
+    requests_made = []
+    def request_stub(where=None, out_statistics=None, group_by=None, **kwargs):
+        requests_made.append((where, group_by))
+        assert out_statistics==[{"statisticType":"count", "onStatisticField":"OBJECTID", "outStatisticFieldName":"opd_count"}]
+        return {"features": [{"attributes": {"RACE": "W", "EXPR_1": 2021, "OPD_COUNT": 5}}, 
+                             {"attributes": {"RACE": "B", "EXPR_1": 2021, "OPD_COUNT": 3}},
+                             {"attributes": {"RACE": "W", "EXPR_1": 2020, "OPD_COUNT": 2}}]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+    monkeypatch.setattr(loader, "_Arcgis__construct_where", lambda date, **kwargs: "1=1")
+
+    df = loader.aggregate(group_by='race', date_part='year')
+
+    assert requests_made==[("1=1", "race,EXTRACT(YEAR FROM Date)")]
+    assert df.columns.tolist()==['race', 'year', 'count']
+    assert df.values.tolist()==[['B', 2021, 3], ['W', 2020, 2], ['W', 2021, 5]]
+
+    loader.metadata.supports_statistics = False
+    with pytest.raises(data_loaders.data_loader._ServerAggregateUnsupported):
+        loader.aggregate(group_by='race')
+
+
+def test_arcgis_get_count_filter(monkeypatch):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = "Date"
+    loader.query = {"Type":"Stop"}
+    loader._last_count = None
+    loader.count_precision = 'day'
+
+    requested = []
+    def request_stub(where=None, return_count=False, **kwargs):
+        requested.append(where)
+        return {"count": 2}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+    monkeypatch.setattr(loader, "_build_date_query", lambda date: "Date LIKE '%2020%' or Date LIKE '%2021%'")
+
+    where = opd.col('Race').isin(['W','B']) | (opd.col('Age') > 17)
+    assert loader.get_count([2020, 2021], filter_expr=where)==2
+    # Date query does not replace query or filter
+    assert requested==["(Date LIKE '%2020%' or Date LIKE '%2021%') AND (Type = 'Stop' AND ((Race IN ('W', 'B')) OR (Age > 17)))"]
+
+    # Count for a different filter is requested
+    assert loader.get_count([2020, 2021], filter_expr=opd.col('Race')=='W')==2
+    assert len(requested)==2
+
+
+def test_arcgis_load_columns(monkeypatch):
+    loader = data_loaders.Arcgis.__new__(data_loaders.Arcgis)
+    loader.url = "https://example.com/arcgis/rest/services/Test/FeatureServer/0"
+    loader.date_field = "Date"
+    loader.query = {}
+    loader._last_count = None
+    loader.max_record_count = 10
+    loader.is_table = True
+    fields = [{"name": x, "type": "esriFieldTypeString"} for x in ["OBJECTID", "DATE", "Race", "Age", "Gender"]]
+    loader.metadata = data_loaders.arcgis_class.LayerMetadata(fields, objectid_field="OBJECTID")
+
+    requested = []
+    def request_stub(where=None, return_count=False, out_fields="*", **kwargs):
+        if return_count:
+            return {"count": 2}
+        requested.append(out_fields)
+        names = out_fields.split(",")
+        return {"fields": [{"name": x, "type": "esriFieldTypeString"} for x in names],
+                "features": [{"attributes": {x:str(k) for x in names}} for k in range(2)]}
+
+    monkeypatch.setattr(loader, "_Arcgis__request", request_stub)
+
+    df = loader.load(pbar=False, format_date=False, columns=["race", "Missing"])
+
+    assert requested==["Race,DATE,OBJECTID"]
+    assert df.columns.tolist()==["Race", "DATE"]
@@ -0,0 +1,64 @@
+import pytest
+import requests
+import sys
+
+if __name__ == "__main__":
+	sys.path.append('../openpolicedata')
+from openpolicedata import data_loaders
+import openpolicedata as opd
+
+
+@pytest.mark.parametrize('date_type, date_field, expr', [('date', 'dispatch_date', 'EXTRACT(YEAR FROM dispatch_date)'), 
+                                                         ('number', 'crash_year', 'crash_year')])
+def test_carto_get_years_group_by(monkeypatch, date_type, date_field, expr):
+    loader = data_loaders.Carto("phl", "crashes", date_field)
+    queries = []
+
+    def request_stub(out_fields="*", count=None, group_by=None, **kwargs):
+        if group_by is None:
+            return {'fields':{date_field:{'type':date_type}}, 'rows':[]}
+        queries.append((out_fields, group_by))
+        return {'rows':[{'year':2019, 'count':5}, {'year':None, 'count':1}, {'year':2021, 'count':3}]}
+
+    monkeypatch.setattr(loader, "_Carto__request", request_stub)
+
+    assert loader.get_years()==[2021, 2019]
+    assert loader.get_years(check=[2019, 2020])==[2019]
+    assert queries[0]==(f'{expr} AS year, count(*) AS count', '1')
+
+
+@pytest.mark.parametrize('error', [NotImplementedError, requests.HTTPError, opd.exceptions.OPD_DataUnavailableError])
+def test_carto_get_years_fallback(monkeypatch, error):
+    loader = data_loaders.Carto("phl", "crashes", "dispatch_date")
+
+    def request_stub(out_fields="*", count=None, group_by=None, **kwargs):
+        if group_by is None:
+            return {'fields':{"dispatch_date":{'type':'date'}}, 'rows':[]}
+        # Server rejects the GROUP BY query
+        raise error("Bad request")
+
+    monkeypatch.setattr(loader, "_Carto__request", request_stub)
+    monkeypatch.setattr(loader, "get_count", lambda date=None, **kwargs: 5 if date==2019 else 0)
+    monkeypatch.setattr(data_loaders.data_loader, "sleep_time", 0)
+
+    # Years are checked individually
+    assert loader.get_years(check=[2019, 2020])==[2019]
+
+
+def test_carto_aggregate(monkeypatch):
+    loader = data_loaders.Carto("phl", "crashes", "dispatch_date")
+    queries = []
+
+    def request_stub(where=None, out_fields="*", count=None, group_by=None, **kwargs):
+        if group_by is None:
+            return {'fields':{"dispatch_date":{'type':'date'}}, 'rows':[]}
+        queries.append((where, out_fields, group_by))
+        return {'rows':[{'race':'W', 'month':2, 'count':5}, {'race':'B', 'month':1, 'count':3}]}
+
+    monkeypatch.setattr(loader, "_Carto__request", request_stub)
+
+    df = loader.aggregate(2020, group_by='race', date_part='month')
+
+    assert queries[0]==("dispatch_date >= '2020-01-01' AND dispatch_date <= '2020-12-31T23:59:59.999'", 
+                        'race, EXTRACT(MONTH FROM dispatch_date) AS month, count(*) AS count', '1, 2')
+    assert df.values.tolist()==[['B', 1, 3], ['W', 2, 5]]
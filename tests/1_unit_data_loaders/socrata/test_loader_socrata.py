@@ -0,0 +1,115 @@
+import pytest
+import re
+import sys
+
+if __name__ == "__main__":
+	sys.path.append('../openpolicedata')
+from openpolicedata import data_loaders
+import pandas as pd
+
+
+class ClientStub:
+    def __init__(self, data_type, years):
+        self.data_type = data_type
+        self.years = years
+        self.requests = []
+
+    def get_metadata(self, data_set):
+        column = {'fieldName':'date', 'dataTypeName':self.data_type}
+        if self.data_type=='text':
+            column['cachedContents'] = {'smallest':'01/01/2015', 'largest':'12/31/2023'}
+        return {'columns':[column]}
+
+    def get(self, data_set, select=None, group=None, **kwargs):
+        self.requests.append((select, group))
+        if group is not None:
+            return [{'year':str(y), 'count':'5'} for y in self.years] + [{'count':'2'}]
+        
+        result = {}
+        for name in re.findall(r"AS (y\d{4})", select):
+            result[name] = '3' if int(name[1:]) in self.years else '0'
+        return [result]
+
+
+def get_loader(data_type, years):
+    loader = data_loaders.Socrata.__new__(data_loaders.Socrata)
+    loader.url = 'data.example.com'
+    loader.data_set = 'abcd-1234'
+    loader.date_field = 'date'
+    loader._last_count = None
+    loader._metadata = None
+    loader.client = ClientStub(data_type, years)
+    return loader
+
+
+@pytest.mark.parametrize('check', [None, [2018, 2019, 2020]])
+def test_socrata_get_years_timestamp(check):
+    loader = get_loader('calendar_date', [2019, 2020, 2023])
+
+    years = loader.get_years(check=check)
+
+    assert years==([2023, 2020, 2019] if check is None else [2020, 2019])
+    assert loader.client.requests==[('date_extract_y(date) AS year, count(*) AS count', 'date_extract_y(date)')]
+
+
+def test_socrata_get_years_text():
+    cur_year = pd.Timestamp.now().year
+    loader = get_loader('text', [cur_year-3, cur_year-4, cur_year-15])
+
+    years = loader.get_years()
+
+    assert years==[cur_year-3, cur_year-4, cur_year-15]
+    # Years are checked in batches
+    assert len(loader.client.requests)==3
+    assert all(x[1] is None for x in loader.client.requests)
+    assert f"sum(case((date LIKE '%{cur_year-3}%'), 1, true, 0)) AS y{cur_year-3}" in loader.client.requests[0][0]
+
+
+def test_socrata_get_years_text_check():
+    loader = get_loader('text', [2016, 2018])
+
+    assert loader.get_years(check=[2016, 2017, 2018])==[2018, 2016]
+    assert len(loader.client.requests)==1
+
+
+def test_socrata_aggregate():
+    loader = get_loader('calendar_date', [])
+    requests_made = []
+    def get_stub(data_set, where=None, select=None, group=None, **kwargs):
+        requests_made.append((where, select, group))
+        return [{'race':'W', 'year':'2020', 'count':'4'}, {'year':'2020', 'count':'1'}, {'race':'B', 'year':'2019', 'count':'2'}]
+    loader.client.get = get_stub
+
+    df = loader.aggregate(group_by='race', date_part='year', opt_filter="LOWER(agency) = 'a'")
+
+    assert requests_made==[("LOWER(agency) = 'a'", 'race, date_extract_y(date) AS year, count(*) AS count', 'race, date_extract_y(date)')]
+    assert df.columns.tolist()==['race', 'year', 'count']
+    assert df['count'].tolist()==[2, 4, 1]
+    assert df['year'].tolist()==[2019, 2020, 2020]
+
+
+def test_socrata_aggregate_text_date():
+    loader = get_loader('text', [])
+    with pytest.raises(data_loaders.data_loader._ServerAggregateUnsupported):
+        loader.aggregate(date_part='month')
+
+
+def test_socrata_load_columns_metadata_requested_once(monkeypatch):
+    loader = get_loader('calendar_date', [])
+    metadata_requests = []
+    def get_metadata(data_set):
+        metadata_requests.append(data_set)
+        return {'columns':[{'fieldName':'date', 'dataTypeName':'calendar_date'}, {'fieldName':'race', 'dataTypeName':'text'}]}
+    monkeypatch.setattr(loader.client, 'get_metadata', get_metadata)
+    monkeypatch.setattr(loader.client, 'get', lambda data_set, **kwargs: [{'count':'1'}])
+    selects = []
+    def request_stub(where, select, *args):
+        selects.append(select)
+        return pd.DataFrame({'date':['2021-01-01'], 'race':['W']}), None
+    monkeypatch.setattr(loader, '_request_data', request_stub)
+
+    for _ in range(2):
+        loader.load(2021, columns=['Race', 'Missing'], pbar=False)
+    assert selects==['date, race']*2
+    # Metadata used to find the date format and the requested fields is only requested by the 1st load
+    assert metadata_requests==['abcd-1234']
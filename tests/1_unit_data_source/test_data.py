@@ -95,4 +95,104 @@ def test_get_years_to_check_empty(year, force, isfile):
 
 @pytest.mark.parametrize('force, isfile', [(True, False), (True,True), (False, False)])
 def test_get_years_to_check_bool(force, isfile):
-	assert data._get_years_to_check([2020, 2021], cur_year=2023, force=force, isfile=isfile) == [2022, 2023]
\ No newline at end of file
+	assert data._get_years_to_check([2020, 2021], cur_year=2023, force=force, isfile=isfile) == [2022, 2023]
+
+@pytest.fixture()
+def sync_source(monkeypatch):
+	details = pd.Series({'State':'Virginia', 'SourceName':'Test', 'Agency':'Test', 'TableType':'STOPS', 'Year':opd.defs.MULTI, 
+					  'URL':'https://example.com/data', 'DataType':'ArcGIS', 'dataset_id':None, 'date_field':'Date', 'agency_field':None})
+	tables = []
+	calls = []
+	def load_stub(table_type, date=None, agency=None, pbar=True, url=None, id=None, where=None, **kwargs):
+		calls.append({'date':date, 'url':url, 'where':where})
+		return data.Table(details, tables.pop(0))
+
+	src = opd.Source.__new__(opd.Source)
+	monkeypatch.setattr(src, 'load', load_stub)
+	return src, tables, calls
+
+
+def test_sync(sync_source, tmp_path):
+	src, tables, calls = sync_source
+	store = str(tmp_path / 'stops.parquet')
+	year = pd.Timestamp.now().year
+
+	tables.append(pd.DataFrame({'Date':pd.to_datetime([f'{year}-01-01 00:00',f'{year}-06-01 10:00']), 'OBJECTID':[1,2], 'Race':['W','B']}))
+	src.sync('STOPS', store)
+	assert calls[0]=={'date':opd.defs.MULTI, 'url':None, 'where':None}
+
+	# Record 2 was updated
+	tables.append(pd.DataFrame({'Date':pd.to_datetime([f'{year}-06-01 10:00',f'{year}-07-01 00:00']), 'OBJECTID':[2,3], 'Race':['W','H']}))
+	t = src.sync('STOPS', store)
+	assert calls[1]['date']==[pd.Timestamp(f'{year}-06-01'), pd.Timestamp(f'{year}-12-31')]
+	assert calls[1]['url']=='https://example.com/data'
+	assert t.table['OBJECTID'].tolist()==[1,2,3]
+	assert t.table['Race'].tolist()==['W','W','H']
+
+	saved = pd.read_parquet(store)
+	pd.testing.assert_frame_equal(saved, t.table)
+
+	# Refreshing the current year removes record 2, which was deleted
+	tables.append(pd.DataFrame({'Date':pd.to_datetime([f'{year}-01-01 00:00',f'{year}-07-01 00:00']), 'OBJECTID':[1,3], 'Race':['W','H']}))
+	t = src.sync('STOPS', store, refresh_year=True)
+	assert calls[2]['date'][0]==pd.Timestamp(f'{year}-01-01')
+	assert t.table['OBJECTID'].tolist()==[1,3]
+
+	# No new records
+	tables.append(pd.DataFrame())
+	t = src.sync('STOPS', store)
+	assert calls[3]['date'][0]==pd.Timestamp(f'{year}-07-01')
+	assert t.table['OBJECTID'].tolist()==[1,3]
+
+
+def test_sync_no_date(sync_source, tmp_path):
+	src, tables, calls = sync_source
+	store = str(tmp_path / 'officers.parquet')
+
+	tables.append(pd.DataFrame({'_id':[1,2], 'Race':['W','B']}))
+	src.sync('STOPS', store)
+
+	tables.append(pd.DataFrame({'_id':[3], 'Race':['H']}))
+	t = src.sync('STOPS', store)
+	assert calls[1]['date']==opd.defs.MULTI
+	assert calls[1]['where'].to_sql('ckan')=='"_id" > 2'
+	assert t.table['_id'].tolist()==[1,2,3]
+
+
+def test_sync_no_date_or_id(sync_source, tmp_path):
+	src, tables, calls = sync_source
+	store = str(tmp_path / 'complaints.parquet')
+
+	tables.append(pd.DataFrame({'Race':['W','B']}))
+	src.sync('STOPS', store)
+
+	# Whole table is downloaded again and replaces the stored records
+	tables.append(pd.DataFrame({'Race':['W','B','H']}))
+	t = src.sync('STOPS', store)
+	assert calls[1]=={'date':opd.defs.MULTI, 'url':'https://example.com/data', 'where':None}
+	assert t.table['Race'].tolist()==['W','B','H']
+	pd.testing.assert_frame_equal(pd.read_parquet(store), t.table)
+
+
+def test_load_iter_file_verbose_engine(logger, log_stream, monkeypatch):
+	details = pd.DataFrame([{'State':'Virginia', 'SourceName':'Test', 'Agency':'Test', 'TableType':'STOPS', 'Year':opd.defs.MULTI, 
+					  'URL':'https://example.com/data.xlsx', 'DataType':'Excel', 'dataset_id':None, 'date_field':None, 'agency_field':None, 
+					  'query':None, 'source_url':'https://example.com', 'readme':None, 'min_version':None, 'py_min_version':None}])
+	engines = []
+	class LoaderStub:
+		def load_iter(self, engine=None, **kwargs):
+			engines.append(engine)
+			for k in range(2):
+				logger.debug(f"Reading batch {k}")
+				yield pd.DataFrame({'Race':['W','B']})
+
+	src = opd.Source.__new__(opd.Source)
+	monkeypatch.setattr(src, 'filter', lambda *args, **kwargs: details)
+	monkeypatch.setattr(src, '_Source__get_loader', lambda *args, **kwargs: LoaderStub())
+
+	batches = src.load_iter('STOPS', nbatch=2, verbose=True, engine='calamine')
+	assert [len(t.table) for t in batches]==[2,2]
+	assert engines==['calamine']
+	# Logging is changed while batches are read
+	assert "Reading batch 0" in log_stream.getvalue()
+	assert "Reading batch 1" in log_stream.getvalue()
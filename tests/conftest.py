@@ -52,6 +52,15 @@ def pytest_collection_modifyitems(config, items):
     items[:] = tests + slowtests
 
 
+@pytest.fixture
+def download_cache(tmp_path, monkeypatch):
+    # Enables the cache of downloaded files, which is disabled by default. Each test uses its own cache 
+    # so that files cached by one test are not used by another.
+    from openpolicedata.data_loaders import data_loader
+    monkeypatch.setattr(data_loader, 'download_cache_dir', str(tmp_path / 'downloads'))
+    return tmp_path / 'downloads'
+
+
 # Define fixtures for each command line option
 
 @pytest.fixture(scope='session')
@@ -0,0 +1,145 @@
+import pandas as pd
+import pytest
+
+import openpolicedata as opd
+from openpolicedata import cache, data
+
+cur_year = pd.Timestamp.now().year
+
+@pytest.fixture
+def cache_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(cache, '_cache_dir', None)
+    opd.set_cache(str(tmp_path / 'opd'))
+    return tmp_path / 'opd'
+
+
+@pytest.fixture
+def cached_source(monkeypatch, cache_dir):
+    details = pd.Series({'State':'Virginia', 'SourceName':'Test', 'Agency':'Test', 'TableType':'STOPS', 'Year':opd.defs.MULTI,
+                         'URL':'https://example.com/data', 'DataType':'ArcGIS', 'dataset_id':None, 'date_field':'Date', 'agency_field':None})
+    df = pd.DataFrame({'Date':pd.to_datetime([f'{cur_year-3}-05-01', f'{cur_year-2}-03-01', f'{cur_year-2}-11-01', f'{cur_year}-01-02']),
+                       'Race':['W','B','W','H']})
+    calls = []
+    def load_stub(table_type, date, agency, load_table, pbar=True, where=None, **kwargs):
+        if not load_table:
+            return data.Table(details, None)
+        calls.append(date)
+        if isinstance(date, list):
+            table = df[(df['Date']>=date[0]) & (df['Date']<date[1]+pd.Timedelta('1D'))].reset_index(drop=True)
+        else:
+            table = df.copy()
+        if where is not None:
+            table = table[where.mask(table)].reset_index(drop=True)
+        return data.Table(details, table)
+
+    src = opd.Source.__new__(opd.Source)
+    monkeypatch.setattr(src, '_Source__load', load_stub)
+    monkeypatch.setattr(src, 'check_simple_dataset_filter', lambda *args: (False, False, None))
+    return src, df, calls
+
+
+def test_get_complete_years():
+    assert cache.get_complete_years([pd.Timestamp('2019-01-01'), pd.Timestamp('2021-12-31')])==[2019,2020,2021]
+    assert cache.get_complete_years([pd.Timestamp('2019-01-02'), pd.Timestamp('2021-06-30')])==[2020]
+    assert cache.get_complete_years([pd.Timestamp(f'{cur_year}-01-01'), pd.Timestamp(f'{cur_year}-12-31')])==[]
+
+
+def test_write_read(cache_dir):
+    dataset_dir = cache.get_dataset_dir('Virginia', 'Test', 'STOPS', 'Virginia_Test_STOPS_MULTIPLE')
+    df = pd.DataFrame({'Date':pd.to_datetime(['2019-05-01','2021-03-01']), 'Race':['W','B']})
+    assert cache.write(dataset_dir, df, 'Date', [2019,2020,2021])
+    assert cache.get_years(dataset_dir)==[2019,2020,2021]
+    assert not cache.is_complete(dataset_dir)
+
+    pd.testing.assert_frame_equal(cache.read(dataset_dir, [2019,2020,2021]), df)
+    pd.testing.assert_frame_equal(cache.read(dataset_dir, [2021]), df.iloc[[1]].reset_index(drop=True))
+    # 2020 has no data
+    assert len(cache.read(dataset_dir, [2020]))==0
+
+
+def test_write_read_null_dates(cache_dir):
+    dataset_dir = cache.get_dataset_dir('Virginia', 'Test', 'STOPS', 'Virginia_Test_STOPS_2020')
+    df = pd.DataFrame({'Date':pd.to_datetime(['2020-05-01', None, '2020-03-01']), 'Race':['W','B','H']})
+    assert cache.write(dataset_dir, df, 'Date', [2020], complete=True)
+    assert cache.is_complete(dataset_dir)
+
+    # Records without a date are only read when the entire dataset is requested
+    pd.testing.assert_frame_equal(cache.read(dataset_dir, [2020]), df.iloc[[0,2]].reset_index(drop=True))
+    pd.testing.assert_frame_equal(cache.read(dataset_dir, [2020], null_dates=True), df.iloc[[0,2,1]].reset_index(drop=True))
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setattr(cache, '_cache_dir', None)
+    with pytest.raises(ValueError):
+        cache.get_dataset_dir('Virginia', 'Test', 'STOPS', 'Virginia_Test_STOPS_MULTIPLE')
+
+
+def test_load_cached_years(cached_source):
+    src, df, calls = cached_source
+
+    t = src.load('STOPS', [cur_year-3, cur_year])
+    assert calls==[[pd.Timestamp(f'{cur_year-3}-01-01'), pd.Timestamp(f'{cur_year}-12-31')]]
+    pd.testing.assert_frame_equal(t.table, df)
+
+    # Only the current year is requested
+    t = src.load('STOPS', [cur_year-3, cur_year])
+    assert calls[1]==[pd.Timestamp(f'{cur_year}-01-01'), pd.Timestamp(f'{cur_year}-12-31')]
+    pd.testing.assert_frame_equal(t.table, df)
+
+    # Past years are read from the cache
+    t = src.load('STOPS', cur_year-2)
+    assert len(calls)==2
+    pd.testing.assert_frame_equal(t.table, df.iloc[1:3].reset_index(drop=True))
+
+    t = src.load('STOPS', [f'{cur_year-2}-02-01', f'{cur_year-2}-04-01'], columns=['Race'], where=opd.col('Race')=='B')
+    assert len(calls)==2
+    pd.testing.assert_frame_equal(t.table, df.iloc[[1]].reset_index(drop=True))
+
+
+def test_load_cached_partial_year(cached_source):
+    src, df, calls = cached_source
+
+    # Part of a year is not cached
+    src.load('STOPS', [f'{cur_year-2}-01-01', f'{cur_year-2}-06-30'])
+    src.load('STOPS', cur_year-2)
+    assert len(calls)==2
+
+    # Filtered data is not cached
+    src.load('STOPS', cur_year-3, where=opd.col('Race')=='W')
+    src.load('STOPS', cur_year-3)
+    assert len(calls)==4
+
+
+def test_load_cached_all(cached_source):
+    src, df, calls = cached_source
+
+    t = src.load('STOPS')
+    assert calls==[None]
+    pd.testing.assert_frame_equal(t.table, df)
+
+    # Past years can be read from the cache after loading the entire dataset
+    t = src.load('STOPS', cur_year-3)
+    assert len(calls)==1
+    pd.testing.assert_frame_equal(t.table, df.iloc[[0]].reset_index(drop=True))
+
+
+def test_load_cached_all_null_dates(cached_source, monkeypatch):
+    src, _, calls = cached_source
+    # Data is from a past year so that the entire dataset is cached
+    details = pd.Series({'State':'Virginia', 'SourceName':'Test', 'Agency':'Test', 'TableType':'STOPS', 'Year':cur_year-1,
+                         'URL':'https://example.com/data', 'DataType':'ArcGIS', 'dataset_id':None, 'date_field':'Date', 'agency_field':None})
+    df = pd.DataFrame({'Date':pd.to_datetime([f'{cur_year-1}-05-01', None, f'{cur_year-1}-11-01']), 'Race':['W','B','H']})
+    def load_stub(table_type, date, agency, load_table, pbar=True, **kwargs):
+        if not load_table:
+            return data.Table(details, None)
+        calls.append(date)
+        return data.Table(details, df.copy())
+    monkeypatch.setattr(src, '_Source__load', load_stub)
+
+    t = src.load('STOPS', cur_year-1)
+    pd.testing.assert_frame_equal(t.table, df)
+
+    # Records without a date are read from the cache
+    t = src.load('STOPS', cur_year-1)
+    assert len(calls)==1
+    pd.testing.assert_frame_equal(t.table, df.iloc[[0,2,1]].reset_index(drop=True))
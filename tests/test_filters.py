@@ -0,0 +1,81 @@
+import pandas as pd
+import pytest
+
+import openpolicedata as opd
+from openpolicedata import filters
+
+
+@pytest.mark.parametrize('dialect, result', [
+    ('arcgis', "((race IN ('BLACK', 'WHITE')) AND (age > 17)) AND (gender <> 'F')"),
+    ('soql', "((race IN ('BLACK', 'WHITE')) AND (age > 17)) AND (gender != 'F')"),
+    ('ckan', '''(("race" IN ('BLACK', 'WHITE')) AND ("age" > 17)) AND ("gender" != 'F')'''),
+    ('carto', "((race IN ('BLACK', 'WHITE')) AND (age > 17)) AND (gender != 'F')"),
+    ('odsql', "((race = 'BLACK' OR race = 'WHITE') AND (age > 17)) AND (gender != 'F')"),
+])
+def test_to_sql(dialect, result):
+    where = opd.col('race').isin(['BLACK','WHITE']) & (opd.col('age') > 17) & (opd.col('gender')!='F')
+    assert where.to_sql(dialect)==result
+
+
+@pytest.mark.parametrize('dialect, result', [
+    ('arcgis', "(NOT (Stop Date >= timestamp '2021-01-01 00:00:00')) OR (Name = 'O''Brien')"),
+    ('soql', "(NOT (`Stop Date` >= '2021-01-01T00:00:00')) OR (Name = 'O''Brien')"),
+    ('odsql', "(NOT (`Stop Date` >= date'2021-01-01T00:00:00')) OR (Name = 'O''Brien')"),
+])
+def test_to_sql_literals(dialect, result):
+    where = ~(opd.col('Stop Date') >= pd.Timestamp('2021-01-01')) | (opd.col('Name')=="O'Brien")
+    assert where.to_sql(dialect)==result
+
+
+def test_to_sql_null():
+    assert opd.col('age').isnull().to_sql('carto')=="age IS NULL"
+    assert opd.col('age').notnull().to_sql('ckan')=='"age" IS NOT NULL'
+
+
+def test_filter_errors():
+    with pytest.raises(ValueError):
+        opd.col('race').isin(['W']).to_sql('sql')
+    with pytest.raises(ValueError):
+        opd.col('race')==None
+    with pytest.raises(TypeError):
+        opd.col('race').isin('W')
+    with pytest.raises(TypeError):
+        # Python's and cannot be used to combine filters
+        (opd.col('race')=='W') and (opd.col('age') > 17)
+    with pytest.raises(TypeError):
+        (opd.col('race')=='W') & True
+
+
+def test_mask():
+    df = pd.DataFrame({'Race':['W','B',None,'W'], 'Age':['30','17','41',None], 
+                       'Date':['2021-01-01','2021-06-01','2022-01-01','2022-03-01']})
+
+    where = (opd.col('race')!='B') & (opd.col('age') > 17)
+    assert where.mask(df).tolist()==[True, False, False, False]
+    assert where.columns()=={'race','age'}
+
+    assert (opd.col('Date') >= pd.Timestamp('2021-06-01')).mask(df).tolist()==[False, True, True, True]
+    assert opd.col('Age').isin([17, 41]).mask(df).tolist()==[False, True, True, False]
+    assert (~opd.col('Race').isnull()).mask(df).tolist()==[True, True, False, True]
+
+    with pytest.raises(KeyError):
+        (opd.col('Gender')=='F').mask(df)
+
+
+def test_mask_not_null():
+    # Negated comparisons with null values do not match like in SQL
+    df = pd.DataFrame({'x':[1,2,None], 'y':['A',None,'B']})
+    assert (~(opd.col('x')==1)).mask(df).tolist()==[False, True, False]
+    assert (~(opd.col('x')==1)).mask(df).tolist()==(opd.col('x')!=1).mask(df).tolist()
+    assert (~opd.col('x').isin([1])).mask(df).tolist()==[False, True, False]
+    assert (~~(opd.col('x')!=1)).mask(df).tolist()==[False, True, False]
+    # Unknown results are combined with three-valued logic
+    assert (~((opd.col('x')==1) & (opd.col('y')=='A'))).mask(df).tolist()==[False, True, True]
+    assert ((opd.col('x')==2) | (opd.col('y')=='B')).mask(df).tolist()==[False, True, True]
+    assert (~((opd.col('x')==2) | (opd.col('y')=='B'))).mask(df).tolist()==[True, False, False]
+    assert (~opd.col('x').isnull()).mask(df).tolist()==[True, True, False]
+
+
+def test_repr():
+    assert repr(opd.col('age') > 17)=="Comparison(age > 17)"
+    assert isinstance(opd.col('age') > 17, filters.Expression)
@@ -5,6 +5,7 @@ import sys
 if __name__ == "__main__":
 	sys.path.append('../openpolicedata')
 from openpolicedata import data_loaders
+import openpolicedata as opd
 import pandas as pd
 
 
@@ -99,3 +100,76 @@ def test_ckan():
 
     data_loaders.data_loader._default_limit = lim
 
+
+
+def test_ckan_get_years_group_by(monkeypatch):
+    loader = data_loaders.Ckan("data.example.com", "abcd", "STOP_DATE")
+    queries = []
+
+    def request_stub(where=None, out_fields="*", count=None, group_by=None, **kwargs):
+        if group_by is None:
+            return {'result':{'fields':[{'id':'STOP_DATE', 'type':'timestamp'}], 'records':[{'STOP_DATE':'2020-01-01T00:00:00'}]}}
+        queries.append((out_fields, group_by))
+        return {'result':{'records':[{'year':2019.0, 'count':5}, {'year':None, 'count':1}, {'year':2021.0, 'count':3}]}}
+
+    monkeypatch.setattr(loader, "_Ckan__request", request_stub)
+
+    assert loader.get_years()==[2021, 2019]
+    assert loader.get_years(check=[2019, 2020])==[2019]
+    assert queries[0]==('EXTRACT(YEAR FROM "STOP_DATE") AS "year", COUNT(*) AS "count"', "1")
+
+
+def test_ckan_aggregate(monkeypatch):
+    loader = data_loaders.Ckan("data.example.com", "abcd", "STOP_DATE")
+    queries = []
+
+    def request_stub(where=None, out_fields="*", count=None, group_by=None, **kwargs):
+        if group_by is None:
+            return {'result':{'fields':[{'id':'STOP_DATE', 'type':'text'}], 'records':[{'STOP_DATE':'2020-01-01'}]}}
+        queries.append((where, out_fields, group_by))
+        return {'result':{'records':[{'RACE':'W', 'year':'2020', 'count':5}, {'RACE':None, 'year':'2020', 'count':1}]}}
+
+    monkeypatch.setattr(loader, "_Ckan__request", request_stub)
+
+    df = loader.aggregate(group_by=['RACE'], date_part='year', opt_filter="LOWER(\"AGENCY\") = 'a'")
+
+    assert queries[0]==("LOWER(\"AGENCY\") = 'a'", '"RACE", LEFT("STOP_DATE", 4) AS "year", COUNT(*) AS "count"', "1, 2")
+    assert df['count'].tolist()==[5, 1]
+    assert df['year'].tolist()==[2020, 2020]
+    assert df['RACE'].iloc[0]=='W' and pd.isnull(df['RACE'].iloc[1])
+
+
+def test_ckan_get_count_filter(monkeypatch):
+    loader = data_loaders.Ckan("data.example.com", "abcd", "STOP_DATE")
+    queries = []
+
+    def request_stub(where=None, return_count=False, **kwargs):
+        queries.append(where)
+        return {'result':{'records':[{'count':3}]}}
+
+    monkeypatch.setattr(loader, "_Ckan__request", request_stub)
+
+    where = opd.col('Race').isin(['W',"O'B"]) & (opd.col('Age') >= 18)
+    assert loader.get_count(opt_filter="LOWER(\"AGENCY\") = 'a'", filter_expr=where)==3
+    assert queries==["LOWER(\"AGENCY\") = 'a' AND ((\"Race\" IN ('W', 'O''B')) AND (\"Age\" >= 18))"]
+
+
+def test_ckan_load_columns(monkeypatch):
+    loader = data_loaders.Ckan("data.example.com", "abcd", "STOP_DATE")
+    requested = []
+
+    def request_stub(where=None, return_count=False, out_fields="*", count=None, **kwargs):
+        if return_count:
+            return {'result':{'records':[{'count':1}]}}
+        elif count==100:
+            return {'result':{'fields':[{'id':x, 'type':'text'} for x in ['_id', 'STOP_DATE', 'RACE', 'AGE', '_full_text']], 
+                              'records':[{'STOP_DATE':'2020-01-01'}]}}
+        requested.append(out_fields)
+        return {'result':{'records':[{x:'2020-01-01' for x in out_fields}]}}
+
+    monkeypatch.setattr(loader, "_Ckan__request", request_stub)
+
+    df = loader.load(pbar=False, columns=['race'])
+
+    assert requested==[['STOP_DATE', 'RACE']]
+    assert df.columns.tolist()==['STOP_DATE', 'RACE']
@@ -90,4 +90,23 @@ def test_combined(url, dataset):
     pd.testing.assert_frame_equal(df, df_true.head(nrows).convert_dtypes())
 
     df = loader.load(offset=offset, nrows=nrows).convert_dtypes()
-    pd.testing.assert_frame_equal(df, df_true.iloc[offset:].head(nrows).convert_dtypes())
\ No newline at end of file
+    pd.testing.assert_frame_equal(df, df_true.iloc[offset:].head(nrows).convert_dtypes())
+
+def test_combined_excel_csv_fallback(tmp_path, monkeypatch):
+    # File of one dataset is a CSV file instead of an Excel file
+    csv_file = str(tmp_path / 'data.csv')
+    df_csv = pd.DataFrame({'Date':['2021-02-01'], 'Race':['B']})
+    df_csv.to_csv(csv_file, index=False)
+    monkeypatch.setattr(data_loaders.excel, 'try_download_file', lambda url, **kwargs: csv_file)
+
+    class CsvStub:
+        def __init__(self, url, *args, **kwargs):
+            self.url = url
+        def load(self, *args, **kwargs):
+            return pd.read_csv(csv_file)
+    monkeypatch.setattr(data_loaders.combine_dataset, 'Csv', CsvStub)
+
+    loader = data_loaders.CombinedDataset(data_loaders.Excel, 'https://example.com', [{'url':'data1'}], pbar=False)
+    assert isinstance(loader.loaders[0], data_loaders.Excel)
+    pd.testing.assert_frame_equal(loader.load(pbar=False), df_csv)
+    assert isinstance(loader.loaders[0], CsvStub)
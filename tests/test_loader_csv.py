@@ -1,13 +1,16 @@
+import io
 import json
 import pandas as pd
 import pytest
 import re
 import sys
 import warnings
+import zipfile
 
 if __name__ == "__main__":
 	sys.path.append('../openpolicedata')
 from openpolicedata import data_loaders
+import openpolicedata as opd
 
 @pytest.mark.parametrize('url',['https://stacks.stanford.edu/file/druid:yg821jf8611/yg821jf8611_ar_little_rock_2020_04_01.csv.zip',
                                 'https://www.chicagopolice.org/wp-content/uploads/legacy/2016-ISR.zip'])
@@ -124,3 +127,224 @@ def test_csv_year_filter(url, date_field):
 
     # Ensure that count updates properly with different call (most recent count is cached)
     assert count!=count2
+
+
+class ResponseStub:
+    def __init__(self, content, url="https://example.com/data.csv"):
+        self.content = content
+        self.url = url
+        self.status_code = 200
+        self.headers = {"Content-Length": str(len(content))}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def raise_for_status(self):
+        pass
+
+    def close(self):
+        pass
+
+    def iter_lines(self):
+        yield from self.content.splitlines()
+
+    def iter_content(self, chunk_size=1):
+        for k in range(0, len(self.content), chunk_size):
+            yield self.content[k:k+chunk_size]
+
+
+@pytest.fixture
+def csv_stub(monkeypatch):
+    content = b"Date,Agency,Race,Age,Gender\n2021-01-01,A,W,30,M\n2021-06-01,B,B,25,F\n2022-01-01,A,W,41,F\n"
+    monkeypatch.setattr(data_loaders.csv_class, "http_head", lambda url, **kwargs: ResponseStub(content, url))
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", lambda url, **kwargs: ResponseStub(content, url))
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", lambda url, **kwargs: ResponseStub(content, url))
+    return content
+
+
+def test_csv_load_columns(csv_stub):
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+
+    df = loader.load(pbar=False, columns=["race", "Missing"], agency="A")
+
+    assert df.columns.tolist()==["Date", "Agency", "Race"]
+    assert df["Race"].tolist()==["W", "W"]
+
+
+def test_csv_load_filter(csv_stub):
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+
+    where = (opd.col("age") > 26) & ~(opd.col("Race")=="B")
+    df = loader.load(pbar=False, columns=["Gender"], filter_expr=where)
+
+    # Filter columns are loaded so that the filter can be applied
+    assert df.columns.tolist()==["Date", "Agency", "Race", "Age", "Gender"]
+    assert df["Age"].tolist()==[30, 41]
+
+    assert loader.get_count(force=True, filter_expr=where)==2
+    assert loader.get_count(force=True, filter_expr=opd.col("Date") >= pd.Timestamp("2021-06-01"))==2
+
+
+@pytest.mark.parametrize("nrows", [None, 0, 2, 3, 10])
+def test_tqdm_reader(nrows):
+    content = b"Date,Agency,Race,Age,Gender\n2021-01-01,A,W,30,M\n2021-06-01,B,B,25,F\n2022-01-01,A,W,41,F\n"
+    reader = data_loaders.csv_class.TqdmReader(ResponseStub(content, "https://example.com/data.csv"), pbar=False, nrows=nrows, block_size=7)
+
+    # Blocks of the requested size are returned
+    data = reader.read(5)
+    data += reader.read(20)
+    assert len(data)==min(25, len(b"".join(content.splitlines(keepends=True)[:nrows])))
+    data += reader.read()
+    assert reader.read(10)==b""
+
+    expected = b"".join(content.splitlines(keepends=True)[:nrows])
+    assert data==expected
+
+
+def test_csv_load_iter(csv_stub, monkeypatch):
+    content = csv_stub
+    num_get = []
+    def get_stub(url, **kwargs):
+        num_get.append(url)
+        return ResponseStub(content, url)
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", get_stub)
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", get_stub)
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+
+    batches = list(loader.load_iter(nbatch=2, pbar=False))
+    # File is only downloaded once
+    assert len(num_get)==1
+    assert [len(x) for x in batches]==[2,1]
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), loader.load(pbar=False))
+
+    batches = list(loader.load_iter(nbatch=1, offset=1, pbar=False, filter_expr=opd.col("Gender")=="F", columns=["Age"]))
+    assert [x["Age"].tolist() for x in batches]==[[41]]
+    assert batches[0].columns.tolist()==["Date", "Agency", "Age", "Gender"]
+
+
+def test_csv_load_iter_encoding_errors(csv_stub, monkeypatch):
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", lambda url, **kwargs: ResponseStub(csv_stub, url))
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", lambda url, **kwargs: ResponseStub(csv_stub, url))
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+    expected = loader.load(pbar=False)
+
+    read_csv = pd.read_csv
+    encoding_errors = []
+    class FailingReader:
+        # Fails on the 2nd chunk if surrogateescape is used
+        def __init__(self, reader, fail):
+            self.reader = reader
+            self.fail = fail
+            self.count = 0
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            self.reader.close()
+        def __next__(self):
+            self.count+=1
+            if self.fail and self.count==2:
+                raise UnicodeEncodeError('utf-8', 'a', 0, 1, 'surrogates not allowed')
+            return next(self.reader)
+    def read_csv_stub(*args, **kwargs):
+        encoding_errors.append(kwargs['encoding_errors'])
+        return FailingReader(read_csv(*args, **kwargs), kwargs['encoding_errors']=='surrogateescape')
+    monkeypatch.setattr(data_loaders.csv_class.pd, "read_csv", read_csv_stub)
+
+    batches = list(loader.load_iter(nbatch=1, pbar=False))
+    assert encoding_errors==['surrogateescape', 'ignore']
+    # Rows read before the error are not repeated
+    pd.testing.assert_frame_equal(pd.concat(batches, ignore_index=True), expected)
+
+
+def test_csv_download_once(csv_stub, monkeypatch, download_cache):
+    content = csv_stub
+    num_get = []
+    def get_stub(url, **kwargs):
+        num_get.append(url)
+        return ResponseStub(content, url)
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", get_stub)
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", get_stub)
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+
+    assert loader.get_count()==3
+    assert loader.get_years(force=True)==[2021, 2022]
+    assert len(loader.load(pbar=False))==3
+    assert len(list(loader.load_iter(pbar=False)))==1
+    # A new loader uses the same file
+    assert len(data_loaders.Csv("https://example.com/data.csv", date_field="Date").load(pbar=False))==3
+    assert len(num_get)==1
+
+    # Only the first rows of the file are read without downloading the whole file if it is not cached
+    data_loaders.data_loader.set_download_cache(None)
+    assert len(loader.load(nrows=1, pbar=False))==1
+    assert len(num_get)==2
+
+
+def test_csv_no_download_cache(csv_stub, monkeypatch):
+    # Files are streamed from the server on every load when the download cache is disabled (the default)
+    content = csv_stub
+    num_get = []
+    def get_stub(url, **kwargs):
+        num_get.append(url)
+        return ResponseStub(content, url)
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", get_stub)
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", get_stub)
+    assert data_loaders.data_loader.download_cache_dir is None
+    assert data_loaders.data_loader.get_block_cache_dir() is None
+
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+    assert len(loader.load(pbar=False))==3
+    assert len(loader.load(pbar=False, agency="A"))==2
+    assert len(num_get)==2
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_read_zipped_csv(monkeypatch, request, use_cache):
+    content = b"Date,Agency,Race,Age,Gender\n2021-01-01,A,W,30,M\n2021-06-01,B,B,25,F\n2022-01-01,A,W,41,F\n"
+    b = io.BytesIO()
+    with zipfile.ZipFile(b, 'w', compression=zipfile.ZIP_DEFLATED) as z:
+        z.writestr('data.csv', content)
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", lambda url, **kwargs: ResponseStub(b.getvalue(), url))
+    if use_cache:
+        request.getfixturevalue("download_cache")
+
+    url = "https://example.com/data.zip"
+    df = data_loaders.csv_class.read_zipped_csv(url, pbar=False)
+    pd.testing.assert_frame_equal(df, pd.read_csv(io.BytesIO(content)))
+
+    df = data_loaders.csv_class.read_zipped_csv(url, pbar=False, nrows=2, usecols=["Race"])
+    assert df["Race"].tolist()==["W","B"]
+
+
+@pytest.mark.parametrize("use_cache", [True, False])
+def test_csv_load_pyarrow(csv_stub, monkeypatch, request, use_cache):
+    if use_cache:
+        request.getfixturevalue("download_cache")
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date", agency_field="Agency")
+
+    df = loader.load(pbar=False, engine="pyarrow")
+    pd.testing.assert_frame_equal(df, loader.load(pbar=False))
+    assert pd.api.types.is_datetime64_any_dtype(df["Date"])
+
+    df = loader.load(pbar=False, engine="pyarrow", columns=["race"], format_date=False)
+    assert df.columns.tolist()==["Date", "Agency", "Race"]
+    assert df["Date"].tolist()==["2021-01-01", "2021-06-01", "2022-01-01"]
+
+    # Excel engines are ignored so that the same engine can be used for datasets that combine CSV and Excel files
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine="calamine"), loader.load(pbar=False))
+    with pytest.raises(ValueError):
+        loader.load(pbar=False, engine="python")
+
+
+@pytest.mark.parametrize("content", [b"Date,Race,Race\n2021-01-01,W,B\n", b"Date,Race\n2021-01-01,W\xff\n"])
+def test_csv_load_pyarrow_fallback(monkeypatch, content):
+    # Files with duplicate column names or text that is not valid UTF-8 are read the same as by pandas
+    monkeypatch.setattr(data_loaders.csv_class, "http_head", lambda url, **kwargs: ResponseStub(content, url))
+    monkeypatch.setattr(data_loaders.csv_class, "http_get", lambda url, **kwargs: ResponseStub(content, url))
+    monkeypatch.setattr(data_loaders.data_loader, "http_get", lambda url, **kwargs: ResponseStub(content, url))
+    loader = data_loaders.Csv("https://example.com/data.csv", date_field="Date")
+
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine="pyarrow"), loader.load(pbar=False))
@@ -1,4 +1,6 @@
+import copy
 from io import BytesIO
+import pickle
 import pytest
 import re
 import requests
@@ -316,3 +318,132 @@ def test_excel_xls():
 #     df_comp.columns = [x.strip() if isinstance(x, str) else x for x in df_comp.columns]
 #     df_comp = df_comp[[x for x in df_comp.columns if 'Unnamed' not in x]]
 #     assert df_comp.equals(df)
+
+
+def test_excel_lazy_load(tmp_path, monkeypatch):
+    filename = str(tmp_path / 'data.xlsx')
+    df_true = pd.DataFrame({'Date':['2021-01-01','2022-05-01'], 'Race':['W','B']})
+    df_true.to_excel(filename, index=False)
+
+    requests_made = []
+    def download_stub(url, **kwargs):
+        requests_made.append(url)
+        return filename
+    monkeypatch.setattr(data_loaders.excel, 'try_download_file', download_stub)
+
+    url = 'https://example.com/data.xlsx'
+    loader = data_loaders.Excel(url)
+    assert loader.isfile()
+    # File is not requested until data is loaded
+    assert len(requests_made)==0
+
+    loader_copy = copy.deepcopy(loader)
+    df = loader.load(pbar=False)
+    assert df['Race'].tolist()==['W','B']
+    assert len(requests_made)==1
+
+    # Copies share the downloaded file
+    pd.testing.assert_frame_equal(loader_copy.load(pbar=False), df)
+    assert len(requests_made)==1
+
+    loader_pickled = pickle.loads(pickle.dumps(loader))
+    pd.testing.assert_frame_equal(loader_pickled.load(pbar=False), df)
+    assert len(requests_made)==1
+
+
+def test_excel_no_download_cache(tmp_path, monkeypatch):
+    # File is requested directly when the download cache is disabled (the default)
+    filename = str(tmp_path / 'data.xlsx')
+    df_true = pd.DataFrame({'Date':['2021-01-01','2022-05-01'], 'Race':['W','B']})
+    df_true.to_excel(filename, index=False)
+
+    requests_made = []
+    def urlopen_stub(url, *args, **kwargs):
+        requests_made.append(url)
+        return open(filename, 'rb')
+    monkeypatch.setattr(data_loaders.excel.urllib.request, 'urlopen', urlopen_stub)
+    assert data_loaders.data_loader.download_cache_dir is None
+
+    url = 'https://example.com/data.xlsx'
+    df = data_loaders.Excel(url).load(pbar=False)
+    assert df['Race'].tolist()==['W','B']
+    assert requests_made==[url]
+
+
+@pytest.mark.parametrize('has_calamine', [True, False])
+def test_excel_engine(tmp_path, monkeypatch, has_calamine):
+    if has_calamine:
+        pytest.importorskip('python_calamine')
+    monkeypatch.setattr(data_loaders.excel, '_has_calamine', has_calamine)
+
+    filename = str(tmp_path / 'data.xlsx')
+    df_true = pd.DataFrame({'Date':pd.to_datetime(['2021-01-01','2022-05-01','2022-06-01']), 'Race':['W','B','H'], 'Age':[20,35,41]})
+    df_true.to_excel(filename, index=False)
+    monkeypatch.setattr(data_loaders.excel, 'try_download_file', lambda url, **kwargs: filename)
+
+    loader = data_loaders.Excel('https://example.com/data.xlsx', date_field='Date')
+    df = loader.load(pbar=False)
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine='calamine'), df)
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine='openpyxl'), df)
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine='calamine', nrows=2), df.head(2))
+    assert ('calamine' in loader._excel_files)==has_calamine
+
+    # CSV engines are ignored so that the same engine can be used for datasets that combine CSV and Excel files
+    pd.testing.assert_frame_equal(loader.load(pbar=False, engine='pyarrow'), df)
+    with pytest.raises(ValueError):
+        loader.load(engine='python')
+
+
+@pytest.mark.parametrize('max_workers', [1, 2])
+def test_excel_year_sheets(tmp_path, monkeypatch, max_workers):
+    filename = str(tmp_path / 'data.xlsx')
+    with pd.ExcelWriter(filename) as writer:
+        for y in range(2019, 2022):
+            # Typo in column name in 2020 sheet
+            race_col = 'Race of Subjet' if y==2020 else 'Race of Subject'
+            df = pd.DataFrame({'Date':pd.to_datetime([f'{y}-01-05', f'{y}-06-01']), race_col:['W','B']})
+            df.to_excel(writer, sheet_name=str(y), index=False)
+    monkeypatch.setattr(data_loaders.excel, 'try_download_file', lambda url, **kwargs: filename)
+
+    loader = data_loaders.Excel('https://example.com/data.xlsx', date_field='Date')
+    assert loader.get_years()==[2019, 2020, 2021]
+    with pytest.warns(UserWarning, match='appears to be a typo'):
+        df = loader.load(pbar=False, max_workers=max_workers)
+    assert set(df.columns)=={'Date', 'Race of Subject', 'Year'}
+    assert df['Year'].tolist()==[2019, 2019, 2020, 2020, 2021, 2021]
+    assert df['Date'].dt.year.tolist()==df['Year'].tolist()
+
+    with pytest.warns(UserWarning, match='appears to be a typo'):
+        df = loader.load(date=[2020,2021], nrows=3, pbar=False, max_workers=max_workers)
+    assert df['Date'].dt.year.tolist()==[2020, 2020, 2021]
+
+    # Requested columns are kept after combining the sheets
+    with pytest.warns(UserWarning, match='appears to be a typo'):
+        df = loader.load(pbar=False, max_workers=max_workers, columns=['Race of Subject'])
+    assert df.columns.tolist()==['Date', 'Race of Subject']
+    assert len(df)==6
+
+
+def test_excel_multirow_header(tmp_path, monkeypatch):
+    import openpyxl
+    filename = str(tmp_path / 'data.xlsx')
+    wb = openpyxl.Workbook()
+    ws = wb.active
+    ws.cell(1, 1, 'Use of force report')
+    # Merged column name groups above the column names
+    for col, group in [(1, 'Officer'), (7, 'Subject'), (13, 'Incident')]:
+        ws.cell(2, col, group)
+        ws.merge_cells(start_row=2, start_column=col, end_row=2, end_column=col+5)
+    for col in range(1, 19):
+        ws.cell(3, col, f'Field {col}')
+        ws.cell(4, col, col)
+    wb.save(filename)
+    monkeypatch.setattr(data_loaders.excel, 'try_download_file', lambda url, **kwargs: filename)
+    num_get = []
+    monkeypatch.setattr(data_loaders.excel, 'http_get', lambda url, **kwargs: num_get.append(url))
+
+    df = data_loaders.Excel('https://example.com/data.xlsx').load(pbar=False)
+    assert df.columns.tolist()==[f'{group} Field {col}' for group, cols in [('Officer', range(1,7)), ('Subject', range(7,13)), ('Incident', range(13,19))] for col in cols]
+    assert df.iloc[0].tolist()==list(range(1, 19))
+    # Merged cells are read from the workbook that was already requested
+    assert len(num_get)==0
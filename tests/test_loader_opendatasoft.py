@@ -72,3 +72,44 @@ def test_opendatasoft():
               df[c] = df[c].astype(df_truth[c].dtype)
 
     pd.testing.assert_frame_equal(df.sort_values(['stopdate','stopid','pid']).reset_index(drop=True), df_truth)
+
+
+def test_opendatasoft_aggregate(monkeypatch):
+    loader = data_loaders.Opendatasoft("data.example.com", "stops", "stopdate")
+    requests_made = []
+    def request_stub(where=None, out_fields="*", out_type='csv', group_by=None, **kwargs):
+        requests_made.append((where, out_fields, out_type, group_by))
+        return [{'race':'W', 'year':2021, 'count':5}, {'race':'B', 'year':2021, 'count':3}]
+    
+    monkeypatch.setattr(loader, "_Opendatasoft__request", request_stub)
+
+    df = loader.aggregate(2021, group_by='race', date_part='year')
+
+    assert requests_made==[("stopdate >= '2021-01-01' AND stopdate <= '2021-12-31T23:59:59.999'", 
+                            "race, year(stopdate) as year, count(*) as count", "json", "race, year(stopdate)")]
+    assert df.values.tolist()==[['B', 2021, 3], ['W', 2021, 5]]
+
+
+def test_opendatasoft_load_columns_fields_requested_once(monkeypatch):
+    loader = data_loaders.Opendatasoft("data.example.com", "stops", "stopdate")
+    class Response:
+        def raise_for_status(self):
+            pass
+        def json(self):
+            return {'fields':[{'name':'stopdate'}, {'name':'race'}, {'name':'age'}]}
+    fields_requests = []
+    def get_stub(url, **kwargs):
+        fields_requests.append(url)
+        return Response()
+    monkeypatch.setattr(data_loaders.opendatasoft, "http_get", get_stub)
+    requests_made = []
+    def request_stub(out_fields="*", **kwargs):
+        requests_made.append(out_fields)
+        return pd.DataFrame()
+    monkeypatch.setattr(loader, "_Opendatasoft__request", request_stub)
+
+    for _ in range(2):
+        loader.load(columns=['Race', 'Missing'], pbar=False)
+    assert requests_made==['stopdate, race']*2
+    # Field names are only requested by the 1st load
+    assert fields_requests==['https://data.example.com/api/explore/v2.1/catalog/datasets/stops']
@@ -1,4 +1,7 @@
+import io
 import math
+import os
+import zipfile
 
 import pandas as pd
 import pytest
@@ -423,4 +426,187 @@ def test_check_query_match_last_False(date1, where1, opt_filter2):
     where = [data_loaders.data_loader.Where(where=where1, count=10, accurate=True), \
              data_loaders.data_loader.Where(where='2', count=10, accurate=True)]
 
-    assert not data_loaders.data_loader._check_query_match_last(last_count_old, filter, where, opt_filter2)
\ No newline at end of file
+    assert not data_loaders.data_loader._check_query_match_last(last_count_old, filter, where, opt_filter2)
+
+def test_get_session_shared_per_host():
+    s1 = data_loaders.data_loader.get_session('https://example.com/path1?q=1')
+    s2 = data_loaders.data_loader.get_session('https://EXAMPLE.com/path2')
+    s3 = data_loaders.data_loader.get_session('https://example.org/path1')
+
+    assert s1 is s2
+    assert s1 is not s3
+    assert 'gzip' in s1.headers['Accept-Encoding']
+
+
+def test_get_legacy_session_cached():
+    s1 = data_loaders.data_loader.get_legacy_session('https://example.com/path1')
+    s2 = data_loaders.data_loader.get_legacy_session('https://example.com/path2')
+
+    assert s1 is s2
+    assert s1 is not data_loaders.data_loader.get_session('https://example.com/path1')
+    assert s1.get_adapter('https://example.com').ssl_context is not None
+
+
+def test_set_transport_options():
+    url = 'https://example.com'
+    old = data_loaders.data_loader.get_session(url)
+    try:
+        data_loaders.data_loader.set_transport_options(pool_maxsize=25, timeout=30)
+        new = data_loaders.data_loader.get_session(url)
+        assert new is not old
+        assert new.get_adapter(url)._pool_maxsize==25
+        assert new.get_adapter(url).timeout==30
+    finally:
+        data_loaders.data_loader.set_transport_options(pool_maxsize=10)
+        data_loaders.data_loader.request_timeout = None
+        data_loaders.data_loader.close_sessions()
+
+
+def test_columnar_pages():
+    pages = data_loaders.data_loader.ColumnarPages(keep_geometry=True)
+    pages.add_records([{'a':1, 'b':'x'}, {'a':2, 'b':None}], x=[1.0, math.nan], y=[2.0, math.nan], 
+                      geometry=[{'x':1.0, 'y':2.0}, None])
+    # Page is missing column b and has new column c
+    pages.add_records([{'a':3, 'c':4.5}, {'a':4}])
+    pages.add_records([])
+
+    df = pages.to_frame()
+    x, y, has_geometry = pages.get_coordinates()
+
+    assert len(pages)==4
+    assert df.columns.tolist()==['a','b','c']
+    assert df['a'].tolist()==[1,2,3,4]
+    assert df['b'].iloc[0]=='x'
+    assert df['b'].iloc[1:].isnull().all()
+    assert df['c'].iloc[2]==4.5
+    assert df['c'].iloc[[0,1,3]].isnull().all()
+    assert x[0]==1.0 and y[0]==2.0
+    assert has_geometry.tolist()==[True, False, False, False]
+    assert pages.get_geometry()==[{'x':1.0, 'y':2.0}, None, None, None]
+
+
+def test_get_point_coordinates():
+    geometry = [{'x':1.0, 'y':2.0}, {'x':'NaN', 'y':'NaN'}, None, {'type':'Point', 'coordinates':[3.0, 4.0]},
+                {'latitude':'6.5', 'longitude':'5.5', 'human_address':'{}'}, {'human_address':'{}'}, {'rings':[]},
+                {'type':'LineString', 'coordinates':[[0,0],[1,1]]}]
+    x, y, has_geometry, other_geometry = data_loaders.data_loader._get_point_coordinates(geometry)
+
+    assert has_geometry.tolist()==[True, True, False, True, True, True, False, True]
+    assert x[[0,3,4]].tolist()==[1.0, 3.0, 5.5]
+    assert y[[0,3,4]].tolist()==[2.0, 4.0, 6.5]
+    assert pd.isnull(x[[1,2,5,6,7]]).all()
+    assert list(other_geometry.keys())==[7]
+
+
+@pytest.mark.skipif(not data_loaders.data_loader._has_gpd, reason='GeoPandas is not installed')
+def test_build_point_geometry():
+    geometry = data_loaders.data_loader._build_point_geometry([1.0, math.nan, math.nan, 0.0], [2.0, math.nan, math.nan, 0.0], 
+                                                              [True, True, False, True], {3:{'type':'LineString', 'coordinates':[[0,0],[1,1]]}})
+    
+    assert geometry[0].x==1.0 and geometry[0].y==2.0
+    assert math.isnan(geometry[1].x)
+    assert geometry[2] is None
+    assert geometry[3].geom_type=='LineString'
+
+
+def test_aggregate_dataframe(df):
+    df = df.copy()
+    df['date'] = pd.to_datetime(df['date'])
+
+    result = data_loaders.data_loader._aggregate_dataframe(df, group_by='FakeAgencyCol', date_field='date', date_part='year')
+    assert result.columns.tolist()==['FakeAgencyCol', 'year', 'count']
+    assert result.values.tolist()==[['Agency1', 2022, 1], ['Agency1', 2023, 2], ['Agency2', 2022, 2]]
+
+    result = data_loaders.data_loader._aggregate_dataframe(df, date_field='date', date_part='month')
+    assert result.values.tolist()==[[1, 1], [2, 2], [11, 1], [12, 1]]
+
+    result = data_loaders.data_loader._aggregate_dataframe(df)
+    assert result['count'].tolist()==[5]
+
+    with pytest.raises(ValueError):
+        data_loaders.data_loader._aggregate_dataframe(df, agg='sum')
+    with pytest.raises(ValueError):
+        data_loaders.data_loader._aggregate_dataframe(df, date_part='year')
+
+
+def test_get_columns(df):
+    assert data_loaders.data_loader._get_columns(None, 'date') is None
+    assert data_loaders.data_loader._get_columns('col1', 'date', None)==['col1', 'date']
+    assert data_loaders.data_loader._get_columns(['DATE', 'col1'], 'date', 'FakeAgencyCol')==['DATE', 'col1', 'FakeAgencyCol']
+
+    result = data_loaders.data_loader._select_columns(df, ['COL1', 'date', 'Missing'])
+    assert result.columns.tolist()==['col1', 'date']
+
+
+def test_download_file(monkeypatch, download_cache):
+    class Response:
+        def __init__(self, status_code, content=b'', etag=None):
+            self.status_code = status_code
+            self.content = content
+            self.headers = {'ETag':etag} if etag else {}
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            pass
+        def raise_for_status(self):
+            pass
+        def iter_content(self, chunk_size=1):
+            yield self.content
+
+    responses = []
+    requests = []
+    def get_stub(url, headers=None, **kwargs):
+        requests.append(headers)
+        return responses.pop(0)
+    monkeypatch.setattr(data_loaders.data_loader, 'http_get', get_stub)
+    url = 'https://example.com/data.csv'
+
+    responses.append(Response(200, b'a,b\n1,2\n', etag='"v1"'))
+    filename = data_loaders.data_loader.download_file(url, pbar=False)
+    with open(filename, 'rb') as f:
+        assert f.read()==b'a,b\n1,2\n'
+
+    # Recently checked file is used without a request
+    assert data_loaders.data_loader.download_file(url, pbar=False)==filename
+    assert len(requests)==1
+
+    # Server is asked if the file has changed
+    monkeypatch.setattr(data_loaders.data_loader, 'download_cache_max_age', 0)
+    responses.append(Response(304))
+    assert data_loaders.data_loader.download_file(url, pbar=False)==filename
+    assert requests[1]=={'If-None-Match':'"v1"'}
+
+    responses.append(Response(200, b'a,b\n3,4\n', etag='"v2"'))
+    new_filename = data_loaders.data_loader.download_file(url, pbar=False)
+    assert new_filename!=filename
+    with open(new_filename, 'rb') as f:
+        assert f.read()==b'a,b\n3,4\n'
+    assert not os.path.exists(filename)
+
+    monkeypatch.setattr(data_loaders.data_loader, 'download_cache_dir', None)
+    assert data_loaders.data_loader.download_file(url, pbar=False) is None
+
+
+def test_open_zip_no_download_cache(monkeypatch):
+    b = io.BytesIO()
+    with zipfile.ZipFile(b, 'w') as z:
+        z.writestr('data.csv', b'a,b\n1,2\n')
+    class Response:
+        headers = {}
+        def __enter__(self):
+            return self
+        def __exit__(self, *args):
+            pass
+        def raise_for_status(self):
+            pass
+        def iter_content(self, chunk_size=1):
+            yield b.getvalue()
+    monkeypatch.setattr(data_loaders.data_loader, 'http_get', lambda url, **kwargs: Response())
+    assert data_loaders.data_loader.download_cache_dir is None
+
+    with data_loaders.data_loader.open_zip('https://example.com/data.zip', pbar=False) as z:
+        # File is spooled to a temporary file when the download cache is disabled (the default)
+        filename = z.filename
+        assert os.path.exists(filename)
+        assert z.read('data.csv')==b'a,b\n1,2\n'
+    assert not os.path.exists(filename)
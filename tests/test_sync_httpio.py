@@ -1,4 +1,5 @@
 from io import BufferedIOBase, UnsupportedOperation
+import json
 import pytest
 import requests
 
@@ -193,4 +194,170 @@ def test_writable():
 def test_writelines():
     with HTTPIOFile(test_url, 1024) as io:
         with pytest.raises(httpio.HTTPIOError):
-            io.writelines([line.encode('ascii') for line in ASCII_LINES])
\ No newline at end of file
+            io.writelines([line.encode('ascii') for line in ASCII_LINES])
+
+class RangeSessionStub:
+    # Session that serves bytes from memory and records requested ranges
+    def __init__(self, content, etag=None):
+        self.content = content
+        self.etag = etag
+        self.ranges = []
+        self.head_status = []
+
+    def head(self, url, headers={}, **kwargs):
+        if self.etag and headers.get('If-None-Match')==self.etag:
+            self.head_status.append(304)
+            return _RangeResponseStub(b'', {'ETag':self.etag}, 304)
+        resp_headers = {'Content-Length':str(len(self.content)), 'Accept-Ranges':'bytes'}
+        if self.etag:
+            resp_headers['ETag'] = self.etag
+        self.head_status.append(200)
+        return _RangeResponseStub(b'', resp_headers)
+
+    def get(self, url, headers={}, **kwargs):
+        start, end = headers['Range'].replace('bytes=','').split('-')
+        self.ranges.append((int(start), int(end)+1))
+        return _RangeResponseStub(self.content[int(start):int(end)+1], {})
+
+
+class _RangeResponseStub:
+    def __init__(self, content, headers, status_code=200):
+        self.content = content
+        self.headers = headers
+        self.status_code = status_code
+
+    def raise_for_status(self):
+        pass
+
+
+def test_cache_size_limited():
+    content = bytes(range(256))*8
+    session = RangeSessionStub(content)
+    with HTTPIOFile('https://example.com/data.zip', 16, session=session, cache_size=64) as io:
+        assert io.read() == content
+        assert len(io._cache) == 4
+        # Most recently read blocks are kept
+        assert list(io._cache.keys()) == [124, 125, 126, 127]
+        io.seek(0)
+        assert io.read(16) == content[:16]
+        assert session.ranges[-1] == (0, 16)
+
+
+def test_missing_ranges_coalesced():
+    content = bytes(range(256))
+    session = RangeSessionStub(content)
+    with HTTPIOFile('https://example.com/data.zip', 16, session=session) as io:
+        io.seek(32)
+        io.read(48)
+        io.seek(128)
+        io.read(16)
+        session.ranges.clear()
+        io.seek(0)
+        assert io.read() == content
+        # Missing blocks separated by a single cached block are requested together
+        assert session.ranges == [(0, 32), (80, 256)]
+
+
+def test_read_ahead():
+    content = bytes(range(256))
+    session = RangeSessionStub(content)
+    def wait_for_read_ahead(io):
+        # Requests are run in order by a single worker
+        io._executor.submit(lambda: None).result()
+
+    with HTTPIOFile('https://example.com/data.zip', 16, session=session, read_ahead=3, read_ahead_workers=1) as io:
+        assert io.read(16) == content[:16]
+        assert io.read(16) == content[16:32]
+        # Next 3 blocks are requested in the background after sequential reads
+        wait_for_read_ahead(io)
+        assert session.ranges[2:] == [(32, 48), (48, 64), (64, 80)]
+
+        assert io.read(32) == content[32:64]
+        wait_for_read_ahead(io)
+        # Only blocks that were not already read ahead are requested
+        assert session.ranges[5:] == [(80, 96), (96, 112)]
+        assert io.read() == content[64:]
+
+    assert io._executor is None
+
+
+def test_readinto_advances_cursor():
+    content = bytes(range(64))
+    with HTTPIOFile('https://example.com/data.zip', 16, session=RangeSessionStub(content)) as io:
+        b = bytearray(20)
+        assert io.readinto(b) == 20
+        assert io.tell() == 20
+        assert io.readinto(b) == 20
+        assert bytes(b) == content[20:40]
+
+
+def test_disk_cache(tmp_path):
+    url = 'https://example.com/data.zip'
+    content = bytes(range(256))
+    session = RangeSessionStub(content, etag='"v1"')
+    with HTTPIOFile(url, 16, session=session, cache_dir=str(tmp_path)) as io:
+        io.seek(32)
+        assert io.read(64) == content[32:96]
+        # Saved ranges are written when the file is closed
+        info_file = next(tmp_path.glob('*.json'))
+        assert json.loads(info_file.read_text())['ranges'] == []
+    assert session.ranges == [(32, 96)]
+    assert json.loads(info_file.read_text())['ranges'] == [[32, 96]]
+
+    # Saved blocks are read from disk after the server reports that the file has not changed
+    with HTTPIOFile(url, 16, session=session, cache_dir=str(tmp_path)) as io:
+        assert io.read() == content
+        assert io.length == len(content)
+    assert session.head_status == [200, 304]
+    assert session.ranges == [(32, 96), (0, 32), (96, 256)]
+
+    session.ranges.clear()
+    with HTTPIOFile(url, 16, session=session, cache_dir=str(tmp_path)) as io:
+        assert io.read() == content
+    assert session.ranges == []
+
+    # Blocks are requested again if the file changes
+    content = content[::-1]
+    session = RangeSessionStub(content, etag='"v2"')
+    with HTTPIOFile(url, 16, session=session, cache_dir=str(tmp_path)) as io:
+        assert io.read() == content
+    assert session.head_status == [200]
+    assert session.ranges == [(0, 256)]
+
+
+def test_disk_cache_requires_block_size(tmp_path):
+    with pytest.raises(ValueError):
+        HTTPIOFile('https://example.com/data.zip', session=RangeSessionStub(b''), cache_dir=str(tmp_path))
+
+
+def test_url_io_disk_cache(monkeypatch, download_cache):
+    from openpolicedata.data_loaders import data_loader
+    content = bytes(range(256))
+    session = RangeSessionStub(content, etag='"v1"')
+    monkeypatch.setattr(data_loader, 'get_session', lambda url: session)
+    for _ in range(2):
+        with data_loader.UrlIoContextManager('https://example.com/data.zip') as fp:
+            assert fp.read() == content
+    # The file is read in a single block that is read from the disk cache the 2nd time
+    assert len(session.ranges) == 1
+
+
+def test_url_io_no_disk_cache(monkeypatch):
+    from openpolicedata.data_loaders import data_loader
+    content = bytes(range(256))
+    session = RangeSessionStub(content, etag='"v1"')
+    monkeypatch.setattr(data_loader, 'get_session', lambda url: session)
+    for _ in range(2):
+        with data_loader.UrlIoContextManager('https://example.com/data.zip') as fp:
+            assert fp.read() == content
+    # Blocks are only cached in memory when the download cache is disabled (the default)
+    assert len(session.ranges) == 2
+
+
+def test_disk_cache_requires_etag(tmp_path):
+    content = bytes(range(64))
+    session = RangeSessionStub(content)
+    for _ in range(2):
+        with HTTPIOFile('https://example.com/data.zip', 16, session=session, cache_dir=str(tmp_path)) as io:
+            assert io.read() == content
+    assert session.ranges == [(0, 64), (0, 64)]